@@ -71,6 +71,33 @@ class CbrainTask::SparkHandler < ClusterTask
                  fmri_data.data_provider_id
 
     output_dir = params[:out_dir]
+
+    # With --WRAP-UP --pack, the archive and its manifest are saved instead of the
+    # whole output directory: a few large sequential writes instead of thousands of
+    # small files
+    if params[:pack].present? && params[:pack].to_s != "0"
+      packed_files = Dir.glob(File.join(output_dir, "*.spark.tar")) +
+                     Dir.glob(File.join(output_dir, "*.spark.manifest.json"))
+      if packed_files.empty?
+        self.addlog("Missing archive '*.spark.tar' in '#{output_dir}'")
+        return false
+      end
+
+      packed_files.each_with_index do |packed_file, k|
+        self.addlog("Attempting to save results '#{packed_file}'")
+        cb_out = safe_userfile_find_or_new(SingleFile,
+          { :name => File.basename(packed_file), :data_provider_id => dest_dp_id }
+        )
+        cb_out.cache_copy_from_local_file(packed_file)
+        cb_out.move_to_child_of(fmri_data)
+        self.addlog_to_userfiles_these_created_these( fmri_data, cb_out )
+        self.params[k == 0 ? '_cbrain_output_result' : "_cbrain_output_result_#{k}"] = cb_out.id
+      end
+      self.save
+
+      return true
+    end
+
     self.addlog("Attempting to save results '#{output_dir}'")
     
     cb_out = safe_userfile_find_or_new(FileCollection,
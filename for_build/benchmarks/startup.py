@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Startup-time benchmark of spark.py: fails if the modes run by the many short tasks of
+# an analysis exceed their startup budget, or import heavy modules they do not need
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser
+import os
+from statistics import median
+from subprocess import PIPE, run as sp_run
+from sys import argv, executable, stderr
+from sys import exit as sys_exit
+from time import perf_counter
+
+
+# Calls benchmarked, and the modules they must not import
+CASES = [
+    (['--RUN', '--help'], ['bids_validator', 'numpy', 'scipy']),
+    (['--WRAP-UP', '--help'], ['bids_validator', 'numpy', 'scipy']),
+]
+
+
+def get_spark():
+    """Path to spark.py
+    """
+
+    return os.sep.join([os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                        'spark.py'])
+
+
+def imported_modules(iargs):
+    """Lists the top-level modules imported by a call of spark.py
+    """
+
+    p = sp_run([executable, '-X', 'importtime', get_spark()] + iargs,
+               stdout=PIPE, stderr=PIPE, universal_newlines=True)
+    modules = set()
+    for line in p.stderr.splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            modules.add(line.split('|')[2].strip().split('.')[0])
+
+    return modules
+
+
+def startup_time(iargs, repeats):
+    """Median wall time (seconds) of a call of spark.py
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        sp_run([executable, get_spark()] + iargs, stdout=PIPE, stderr=PIPE)
+        times.append(perf_counter() - start)
+
+    return median(times)
+
+
+def benchmark(iargs):
+    """Main function, runs the benchmark and fails if a budget is exceeded
+    """
+
+    parser = ArgumentParser(description='Startup-time benchmark of spark.py')
+    parser.add_argument('--budget', type=float, default=0.25,
+                        help='Startup budget of each call, in seconds (default: %(default)s)')
+    parser.add_argument('--repeats', type=int, default=10,
+                        help='Number of runs of each call (default: %(default)s)')
+    oargs = parser.parse_args(iargs)
+
+    failed = False
+    for (case, forbidden) in CASES:
+        elapsed = startup_time(case, oargs.repeats)
+        unexpected = sorted(set(forbidden) & imported_modules(case))
+        print('{:<24} {:.3f} s (budget: {:.3f} s)'.format(' '.join(case), elapsed, oargs.budget))
+        if elapsed > oargs.budget:
+            print('  -> over budget', file=stderr)
+            failed = True
+        if unexpected:
+            print('  -> unexpected imports: ' + ', '.join(unexpected), file=stderr)
+            failed = True
+
+    return sys_exit(1 if failed else 0)
+
+
+# Main
+if __name__ == "__main__":
+    benchmark(argv[1:])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Jobs x threads benchmark: runs the same number of jobs with every split of the cores
+# of this node between concurrent jobs and threads per job, to choose --parallel and
+# --threads
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser
+import os
+from subprocess import Popen
+from sys import argv, executable
+from sys import exit as sys_exit
+from textwrap import dedent
+from time import perf_counter
+
+
+# Job run by each process, with the thread budget set as by spark.py --threads
+WORKLOADS = {
+    # Python engine of the kmdl_boot jobs: thread pool, single-threaded BLAS
+    'ksvd': dedent('''\
+        import os, numpy as np
+        from spark.ksvd import ksvd
+        signals = np.random.default_rng(0).standard_normal(({time_points}, {voxels}))
+        ksvd(signals, {atoms}, {iterations}, threads=int(os.environ['SPARK_THREADS']))
+        '''),
+    # Multi-threaded BLAS, as the MATLAB Runtime
+    'blas': dedent('''\
+        import numpy as np
+        signals = np.random.default_rng(0).standard_normal(({time_points}, {voxels}))
+        dictionary = np.random.default_rng(1).standard_normal(({time_points}, {atoms}))
+        for _ in range({iterations}):
+            codes = np.linalg.lstsq(dictionary, signals, rcond=None)[0]
+            dictionary = signals @ np.linalg.pinv(codes)
+        '''),
+}
+
+
+def get_root():
+    """Directory holding spark.py and the spark package
+    """
+
+    return os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def get_splits(cpus, oversubscribed):
+    """Splits jobs x threads of the cores, and optionally every job using all cores
+    """
+
+    splits = [(jobs, cpus // jobs) for jobs in range(1, cpus + 1) if cpus % jobs == 0]
+    if oversubscribed and cpus > 1:
+        splits.append((cpus, cpus))
+
+    return splits
+
+
+def run_split(code, nb_jobs, jobs, threads):
+    """Runs nb_jobs processes, at most jobs at a time with threads each. Returns the
+    wall time (seconds).
+    """
+
+    env = dict(os.environ, SPARK_THREADS=str(threads),
+               PYTHONPATH=os.pathsep.join([get_root(), os.environ.get('PYTHONPATH', '')]))
+    if 'spark.ksvd' in code:
+        env.update(OMP_NUM_THREADS='1', OPENBLAS_NUM_THREADS='1', MKL_NUM_THREADS='1')
+    else:
+        env.update(OMP_NUM_THREADS=str(threads), OPENBLAS_NUM_THREADS=str(threads),
+                   MKL_NUM_THREADS=str(threads))
+
+    start = perf_counter()
+    running = []
+    for _ in range(nb_jobs):
+        if len(running) == jobs:
+            running.pop(0).wait()
+        running.append(Popen([executable, '-c', code], env=env))
+    for p in running:
+        p.wait()
+
+    return perf_counter() - start
+
+
+def benchmark(iargs):
+    """Main function, runs the benchmark and prints the best split
+    """
+
+    parser = ArgumentParser(description='Jobs x threads benchmark of the SPARK jobs')
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='ksvd',
+                        help='Job run by each process (default: %(default)s)')
+    parser.add_argument('--cpus', type=int, default=len(os.sched_getaffinity(0)),
+                        help='Cores shared by the jobs (default: %(default)s)')
+    parser.add_argument('--nb-jobs', type=int, default=0,
+                        help='Number of jobs run with each split (default: --cpus)')
+    parser.add_argument('--voxels', type=int, default=20000)
+    parser.add_argument('--time-points', type=int, default=200)
+    parser.add_argument('--atoms', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--oversubscribed', action='store_true',
+                        help='Also runs --cpus jobs at a time with --cpus threads each')
+    oargs = parser.parse_args(iargs)
+
+    code = WORKLOADS[oargs.workload].format(**vars(oargs))
+    nb_jobs = oargs.nb_jobs or oargs.cpus
+
+    results = []
+    print('{:>6} {:>8} {:>10} {:>12}'.format('jobs', 'threads', 'wall (s)', 'jobs/hour'))
+    for (jobs, threads) in get_splits(oargs.cpus, oargs.oversubscribed):
+        elapsed = run_split(code, nb_jobs, jobs, threads)
+        results.append((elapsed, jobs, threads))
+        print('{:>6} {:>8} {:>10.2f} {:>12.1f}'.format(
+            jobs, threads, elapsed, 3600 * nb_jobs / elapsed))
+
+    (elapsed, jobs, threads) = min(results)
+    print('\nBest split: --parallel {} --threads {}'.format(jobs, threads))
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    benchmark(argv[1:])
@@ -3,11 +3,22 @@ function spark_main(varargin)
 % Written quickly, input arguments checkings should at least be improved
 % Meant to be used by the 'compiled' SPARK version
 try
+    % Thread budget set by spark.py --threads
+    nb_threads = str2double(getenv('SPARK_THREADS'));
+    if ~isnan(nb_threads) && nb_threads >= 1
+        maxNumCompThreads(nb_threads);
+    end
+    
     op = varargin{1};
     if strcmp(op, 'setup')
         setup_spark(varargin{2})
     elseif strcmp(op, 'run')
         run_spark(varargin{2 : end})
+    elseif strcmp(op, 'run-jobs')
+        run_jobs(varargin{2 : end})
+    elseif strcmp(op, 'warm')
+        % Nothing to do, the runtime extracted the archive in MCR_CACHE_ROOT
+        % before calling this function
     end
 catch err
     fprintf(' - An exception occured:\n%s\n', err.message);
@@ -23,9 +34,10 @@ function setup_spark(pipe_opt_file)
 valid_fields = {...
     'pipe_file'; ...
     'fmri_data'; 'out_dir'; 'mask'; ...
-    'nb_resamplings'; 'network_scales'; 'nb_iterations'; 'p_value'; ...
+    'nb_resamplings'; 'network_scales'; 'network_scale'; 'sparsity_level'; ...
+    'nb_iterations'; 'p_value'; ...
     'resampling_method'; 'block_window_length'; 'dict_init_method'; ...
-    'sparse_coding_method'; 'preserve_dc_atom'; ...
+    'sparse_coding_method'; 'preserve_dc_atom'; 'precision'; ...
     'verbose'};
 
 p = struct();
@@ -66,14 +78,25 @@ p.rerun_step1 = '0';
 p.rerun_step2 = '0';
 p.rerun_step3 = '0';
 p.rerun_step4 = '0';
-p.sparsity_level = '';
-p.network_scale = '';
 p.error_flag = '0';
 p.display_progress = '1';
 p.session_flag = '1';
 % p.out_size = 'quality_control'; % useless...
 p.test = '1';
 
+% Options files written before 'precision' was introduced
+if ~isfield(p, 'precision')
+    p.precision = 'double';
+end
+
+% Sparsity level and network scale: estimated unless set (> 0) with --SETUP
+if ~isfield(p, 'sparsity_level') || ~(str2double(p.sparsity_level) > 0)
+    p.sparsity_level = '';
+end
+if ~isfield(p, 'network_scale') || ~(str2double(p.network_scale) > 0)
+    p.network_scale = '';
+end
+
 % Be safe, some code may forget to append filesep...
 p.out_dir = [p.out_dir, filesep];
 
@@ -105,9 +128,13 @@ opt.folder_kmdl.ksvd.param = struct(...
     );
 if isempty(p.sparsity_level)
     opt.folder_kmdl.ksvd.param.L = [];
+else
+    opt.folder_kmdl.ksvd.param.L = str2double(p.sparsity_level);
 end
 if isempty(p.network_scale)
     opt.folder_kmdl.ksvd.param.K = [];
+else
+    opt.folder_kmdl.ksvd.param.K = str2double(p.network_scale);
 end
 
 
@@ -140,7 +167,9 @@ fmri_file = p.fmri_data(sep(3)+1 : end);
 files_in.(subject_id).fmri.(session_id).(run_id) = fmri_file;
 [pipe, opt] = spark_pipeline_fmri_kmap(files_in, opt);
 pipe = spark_sub_pipelines(pipe);
-save(p.pipe_file, 'pipe', 'opt')
+save_pipe_files(p.pipe_file, pipe);
+precision = p.precision; %#ok
+save(p.pipe_file, 'opt', 'precision')
 end
 
 
@@ -179,6 +208,83 @@ end
 
 
 
+function save_pipe_files(pipe_file, pipe)
+% Saves each job in its own file, the job names of each sub-pipeline in a
+% small file per sub-pipeline, and an index of all jobs (with their inputs
+% and outputs) read by spark.py, so that a job only loads its own definition
+[pipe_dir, pipe_name] = fileparts(pipe_file);
+jobs_dir = fullfile(pipe_dir, 'jobs');
+private_mkdir(jobs_dir);
+% Jobs completed with a previous setup are run again
+if ~isempty(dir(fullfile(jobs_dir, '*.done')))
+    delete(fullfile(jobs_dir, '*.done'));
+end
+
+stages = {'A'; 'B'; 'C'};
+index = struct();
+for s = 1 : numel(stages)
+    stage = stages{s};
+    sub_pipe = pipe.(['pipe_', stage]);
+    names = fieldnames(sub_pipe);
+    files = cell(size(names));
+    entries = cell(size(names));
+    for k = 1 : numel(names)
+        job = sub_pipe.(names{k}); %#ok
+        files{k} = get_job_file(pipe_file, names{k});
+        save(files{k}, 'job')
+        entries{k} = struct(...
+            'name', names{k}, ...
+            'file', files{k}, ...
+            'files_in', {flatten_files(sub_pipe.(names{k}).files_in)}, ...
+            'files_out', {flatten_files(sub_pipe.(names{k}).files_out)});
+    end
+    save(get_stage_file(pipe_file, stage), 'names', 'files')
+    index.(stage) = entries;
+end
+
+[fid, msg] = fopen(fullfile(pipe_dir, [pipe_name, '.jobs.json']), 'w');
+if fid == -1
+    error('\n- Could not write the jobs index:\n%s\n', msg);
+end
+fprintf(fid, '%s', jsonencode(index));
+fclose(fid);
+end
+
+
+
+function stage_file = get_stage_file(pipe_file, stage)
+[pipe_dir, pipe_name] = fileparts(pipe_file);
+stage_file = fullfile(pipe_dir, [pipe_name, '_', stage, '.mat']);
+end
+
+
+
+function job_file = get_job_file(pipe_file, name)
+job_file = fullfile(fileparts(pipe_file), 'jobs', [name, '.mat']);
+end
+
+
+
+function files = flatten_files(files)
+% Lists all the paths found in the 'files_in' or 'files_out' of a job
+if ischar(files)
+    if isempty(files)
+        files = {};
+    else
+        files = {files};
+    end
+elseif iscell(files)
+    files = cellfun(@flatten_files, files(:), 'UniformOutput', false);
+    files = vertcat({}, files{:});
+elseif isstruct(files)
+    files = flatten_files(struct2cell(files(:)));
+else
+    files = {};
+end
+end
+
+
+
 function run_spark(varargin)
 % Run a SPARK sub-pipeline
 pipe_file = varargin{1};
@@ -189,14 +295,32 @@ else
     jobs_patterns = '';
 end
 
+if ~ismember(stage, {'A', 'B', 'C'})
+    error('Unknown SPARK sub-pipeline: %s', stage)
+end
+
+% Pipelines set up with one file per job: only the selected jobs are loaded
+stage_file = get_stage_file(pipe_file, stage);
+if exist(stage_file, 'file')
+    S = load(stage_file, 'names', 'files');
+    keep = true(size(S.names));
+    if endsWith(jobs_patterns, ';')
+        keep = false(size(S.names));
+        keep(str2num(jobs_patterns{1})) = true; %#ok
+    elseif ~isempty(jobs_patterns)
+        keep = contains(S.names, jobs_patterns);
+    end
+    run_jobs(pipe_file, S.files{keep});
+    return
+end
+
+precision = get_precision(pipe_file);
 if strcmp(stage, 'A')
     pipe = getfield(getfield(load(pipe_file, 'pipe'), 'pipe'), 'pipe_A');
 elseif strcmp(stage, 'B')
     pipe = getfield(getfield(load(pipe_file, 'pipe'), 'pipe'), 'pipe_B');
 elseif strcmp(stage, 'C')
     pipe = getfield(getfield(load(pipe_file, 'pipe'), 'pipe'), 'pipe_C');
-else
-    error('Unknown SPARK sub-pipeline: %s', stage)
 end
 
 names = fieldnames(pipe);
@@ -205,13 +329,224 @@ if endsWith(jobs_patterns, ';')
 else
     names(~contains(names, jobs_patterns)) = [];
 end
+failed = {};
 for k = 1 : size(names, 1)
-    name = names{k};
-    files_in = pipe.(name).files_in; %#ok
-    files_out = pipe.(name).files_out; %#ok
-    opt = pipe.(name).opt;
-    private_mkdir(opt.folder_out);
-    eval(pipe.(name).command);
+    try
+        run_job(pipe.(names{k}), precision, get_done_file(get_job_file(pipe_file, names{k})));
+    catch err
+        fprintf(' - The job %s failed:\n%s\n', names{k}, err.message);
+        failed{end+1} = names{k}; %#ok
+    end
+end
+check_failed(failed);
+end
+
+
+
+function run_jobs(pipe_file, varargin)
+% Run the jobs saved in the given job files
+precision = get_precision(pipe_file);
+failed = {};
+for k = 1 : numel(varargin)
+    try
+        run_job(getfield(load(varargin{k}, 'job'), 'job'), precision, ...
+            get_done_file(varargin{k}));
+    catch err
+        fprintf(' - The job %s failed:\n%s\n', varargin{k}, err.message);
+        failed{end+1} = varargin{k}; %#ok
+    end
+end
+check_failed(failed);
+end
+
+
+
+function check_failed(failed)
+% The other jobs were run, an error is raised at the end if some failed
+if ~isempty(failed)
+    error('%d job(s) failed:\n%s', numel(failed), strjoin(failed, '\n'));
+end
+end
+
+
+
+function run_job(job, precision, done_file)
+% Runs a job, unless it completed since its inputs were last written (e.g.
+% a stage B run again after a preemption): done_file is written once the
+% job completed
+files_in = job.files_in; %#ok
+files_out = job.files_out; %#ok
+opt = job.opt;
+% Speculative duplicate of a job: outputs in the directory given by spark.py
+output_dir = getenv('SPARK_OUTPUT_DIR');
+if ~isempty(output_dir)
+    files_out = redirect_files(files_out, output_dir);
+    opt.folder_out = [output_dir, filesep];
+    done_file = '';
+elseif is_done(done_file, files_in, files_out)
+    fprintf(' - Already completed, skipped:\n%s\n', done_file);
+    return
+end
+private_mkdir(opt.folder_out);
+check_engine(files_in);
+if ~isempty(done_file) && exist(done_file, 'file')
+    delete(done_file);
+end
+eval(job.command);
+if strcmp(precision, 'single')
+    cast_mat_files(files_out, 'single');
+end
+if ~isempty(done_file)
+    private_mkdir(fileparts(done_file));
+    fclose(fopen(done_file, 'w'));
+end
+end
+
+
+
+function done_file = get_done_file(job_file)
+% Marker of a completed job, next to its job file
+[job_dir, name] = fileparts(job_file);
+done_file = fullfile(job_dir, [name, '.done']);
+end
+
+
+
+function flag = is_done(done_file, files_in, files_out)
+% Whether a job completed: its marker exists, is newer than all its inputs,
+% and all its outputs exist
+flag = false;
+if isempty(done_file) || ~exist(done_file, 'file')
+    return
+end
+done = dir(done_file);
+files_in = flatten_files(files_in);
+for k = 1 : numel(files_in)
+    d = dir(files_in{k});
+    if numel(d) == 1 && d.datenum > done.datenum
+        return
+    end
+end
+files_out = flatten_files(files_out);
+flag = all(cellfun(@(f) exist(f, 'file') > 0, files_out));
+end
+
+
+
+function check_engine(files_in)
+% The outputs of the Python engines of spark.py (marked with 'spark_engine')
+% do not have the layout read by the SPARK bricks
+files = flatten_files(files_in);
+for k = 1 : numel(files)
+    if endsWith(files{k}, '.mat') && exist(files{k}, 'file') && ...
+            ismember('spark_engine', who('-file', files{k}))
+        error(['The input %s was written by a Python engine, run this ', ...
+            'job with --engine python'], files{k});
+    end
+end
+end
+
+
+
+function precision = get_precision(pipe_file)
+precision = 'double';
+if ismember('precision', who('-file', pipe_file))
+    precision = getfield(load(pipe_file, 'precision'), 'precision');
+end
+end
+
+
+
+function files = redirect_files(files, output_dir)
+% Moves the paths found in files (a path, or a cell/struct of paths) to the
+% given directory, keeping their names
+if ischar(files)
+    if ~isempty(files)
+        [~, name, ext] = fileparts(files);
+        files = fullfile(output_dir, [name, ext]);
+    end
+elseif iscell(files)
+    for k = 1 : numel(files)
+        files{k} = redirect_files(files{k}, output_dir);
+    end
+elseif isstruct(files)
+    names = fieldnames(files);
+    for k = 1 : numel(names)
+        files.(names{k}) = redirect_files(files.(names{k}), output_dir);
+    end
+end
+end
+
+
+
+function cast_mat_files(files, precision)
+% Casts the floating-point variables of the '.mat' files found in files (a
+% path, or a cell/struct of paths), so that the jobs using them as inputs
+% also compute with this precision. Files already in this precision are not
+% rewritten, the others keep their MAT-file version.
+if ischar(files)
+    [~, ~, ext] = fileparts(files);
+    if strcmp(ext, '.mat') && exist(files, 'file') && ...
+            needs_cast(whos('-file', files), precision)
+        version = get_mat_version(files);
+        S = cast_floats(load(files), precision); %#ok
+        save(files, '-struct', 'S', version);
+    end
+elseif iscell(files)
+    for k = 1 : numel(files)
+        cast_mat_files(files{k}, precision);
+    end
+elseif isstruct(files)
+    names = fieldnames(files);
+    for k = 1 : numel(names)
+        cast_mat_files(files.(names{k}), precision);
+    end
+end
+end
+
+
+
+function flag = needs_cast(vars, precision)
+% Whether some variables (as listed by whos) may hold floating-point arrays
+% of another precision
+classes = {vars(~[vars.sparse]).class};
+flag = any(ismember(classes, setdiff({'double'; 'single'}, precision))) || ...
+    any(ismember(classes, {'struct'; 'cell'}));
+end
+
+
+
+function version = get_mat_version(mat_file)
+% Version option of save for a '.mat' file: '-v7.3' (HDF5) if it is one,
+% its header starting with 'MATLAB 7.3 MAT-file', '-v7' otherwise
+version = '-v7';
+[fid, msg] = fopen(mat_file, 'r');
+if fid == -1
+    error('\n- Could not open the file:\n%s\n%s\n', mat_file, msg);
+end
+header = fread(fid, [1, 116], '*char');
+fclose(fid);
+if startsWith(header, 'MATLAB 7.3')
+    version = '-v7.3';
+end
+end
+
+
+
+function x = cast_floats(x, precision)
+if isfloat(x) && ~isa(x, precision) && ~issparse(x)
+    x = cast(x, precision);
+elseif isstruct(x)
+    names = fieldnames(x);
+    for k = 1 : numel(x)
+        for kk = 1 : numel(names)
+            x(k).(names{kk}) = cast_floats(x(k).(names{kk}), precision);
+        end
+    end
+elseif iscell(x)
+    for k = 1 : numel(x)
+        x{k} = cast_floats(x{k}, precision);
+    end
 end
 end
 
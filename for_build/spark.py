@@ -14,10 +14,6 @@ from sys import argv, stderr
 from sys import exit as sys_exit
 from textwrap import dedent
 
-from spark.setup import setup
-from spark.run import run
-from spark.wrapup import wrapup
-
 
 def show_help():
     """Generates help and usage messages for this program
@@ -28,7 +24,17 @@ def show_help():
                OR
                spark.py --RUN ... [--exe XXX]
                OR
+               spark.py --RUN-ALL ... [--exe XXX]
+               OR
                spark.py --WRAP-UP ... [--exe XXX]
+               OR
+               spark.py --RETHRESHOLD ...
+               OR
+               spark.py --COMPARE ...
+               OR
+               spark.py --GROUP ...
+               OR
+               spark.py --WARM-CACHE [--exe XXX]
 
         SParsity-based Analysis of Reliable K-hubness (SPARK) for brain fMRI functional
         connectivity
@@ -51,10 +57,38 @@ def show_help():
           --RUN ...             Runs a SPARK sub-pipeline. See --RUN --help for more info.
                                 --RUN and all other arguments are mutually exclusive.
                                 ____________________________________________________________
+          --RUN-ALL ...         Runs all SPARK sub-pipelines on this node, each job
+                                starting as soon as its inputs are available. See
+                                --RUN-ALL --help for more info.
+                                --RUN-ALL and all other arguments are mutually exclusive.
+                                ____________________________________________________________
           --WRAP-UP ...         Wraps-up a SPARK analysis. See --WRAP-UP --help for more
                                 info.
                                 --WRAP-UP and all other arguments are mutually exclusive.
                                 ____________________________________________________________
+          --RETHRESHOLD ...     Re-thresholds the k-hubness maps of a SPARK analysis at a
+                                new p-value, without running the pipeline again. See
+                                --RETHRESHOLD --help for more info.
+                                --RETHRESHOLD and all other arguments are mutually
+                                exclusive.
+                                ____________________________________________________________
+          --COMPARE ...         Compares the outputs of two SPARK analyses of the same
+                                fMRI, e.g. to measure the numerical drift of --SETUP
+                                --precision single. See --COMPARE --help for more info.
+                                --COMPARE and all other arguments are mutually exclusive.
+                                ____________________________________________________________
+          --GROUP ...           Computes group statistics (mean, variance, hub frequency)
+                                of the k-hubness maps of many wrapped-up SPARK analyses,
+                                per task and scale. See --GROUP --help for more info.
+                                --GROUP and all other arguments are mutually exclusive.
+                                ____________________________________________________________
+          --WARM-CACHE          Extracts the standalone application in the MATLAB Runtime
+                                cache shared by all SPARK calls on this node (e.g. when
+                                building containers). See --WARM-CACHE --help for more
+                                info.
+                                --WARM-CACHE and all other arguments are mutually
+                                exclusive.
+                                ____________________________________________________________
 
           OPTIONAL arguments:
           __________________________________________________________________________________
@@ -65,6 +99,18 @@ def show_help():
                                 (default: dirname(_THIS_FILE_)/spark.samapp)
                                 (type: str)
                                 ____________________________________________________________
+          --threads X           Number of compute threads of each job (MATLAB Runtime,
+                                BLAS/OpenMP libraries and Python engines), set with
+                                maxNumCompThreads and OMP_NUM_THREADS,
+                                OPENBLAS_NUM_THREADS and MKL_NUM_THREADS.
+                                With 'auto', the cores available are divided by the
+                                number of parallel jobs (--parallel) of all the SPARK
+                                processes running on this node.
+                                 
+                                (valid values: auto, X>=1)
+                                (default: auto)
+                                (type: str)
+                                ____________________________________________________________
         '''))
 
     return sys_exit(0)
@@ -78,23 +124,55 @@ def get_default_exe():
 
 
 def spark(iargs):
-    """Main function
+    """Main function, only imports the module of the requested mode so that short jobs
+    (e.g. --RUN, --WRAP-UP) do not pay for the dependencies of the others
     """
 
     iargs = ['--exe', get_default_exe()] + iargs
     do_setup = '--SETUP' in iargs
     do_run = '--RUN' in iargs
+    do_runall = '--RUN-ALL' in iargs
     do_wrapup = '--WRAP-UP' in iargs
-    if sum([do_setup, do_run, do_wrapup]) > 1:
-        print('--SETUP, --RUN and --WRAP-UP are mutually exclusive arguments, only specify one of them.\n' +
+    do_rethreshold = '--RETHRESHOLD' in iargs
+    do_compare = '--COMPARE' in iargs
+    do_group = '--GROUP' in iargs
+    do_warmcache = '--WARM-CACHE' in iargs
+    if sum([do_setup, do_run, do_runall, do_wrapup, do_rethreshold, do_compare, do_group,
+            do_warmcache]) > 1:
+        print('--SETUP, --RUN, --RUN-ALL, --WRAP-UP, --RETHRESHOLD, --COMPARE, --GROUP and --WARM-CACHE are mutually exclusive arguments, only specify one of them.\n' +
               'For more info, rerun the program with no argument.', file=stderr)
         sys_exit(1)
-    elif do_setup:
+
+    # Before any module using NumPy is imported, and inherited by the child processes
+    if any([do_setup, do_run, do_runall, do_wrapup, do_rethreshold, do_compare, do_group,
+            do_warmcache]):
+        from spark.threads import apply_threads
+        apply_threads(iargs, (os.cpu_count() or 1) if do_runall else 1)
+
+    if do_setup:
+        from spark.setup import setup
         setup(iargs)
     elif do_run:
+        from spark.run import run
         run(iargs)
+    elif do_runall:
+        from spark.runall import runall
+        runall(iargs)
     elif do_wrapup:
+        from spark.wrapup import wrapup
         wrapup(iargs)
+    elif do_rethreshold:
+        from spark.rethreshold import rethreshold
+        rethreshold(iargs)
+    elif do_compare:
+        from spark.compare import compare
+        compare(iargs)
+    elif do_group:
+        from spark.group import group
+        group(iargs)
+    elif do_warmcache:
+        from spark.mcr import warmcache
+        warmcache(iargs)
     else:
         show_help()
 
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Compares the outputs of two SPARK analyses of the same fMRI, e.g. to measure the
+# numerical drift of --SETUP --precision single against the double-precision path
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser, RawTextHelpFormatter
+import json
+import os
+from sys import argv, stderr
+from sys import exit as sys_exit
+from textwrap import dedent
+
+import numpy as np
+from scipy.io import loadmat
+from scipy.sparse import csr_matrix, issparse
+
+from spark.rethreshold import get_analysis_dir, get_bids_fmri_filename
+from spark.scheduler import get_times_file, read_history
+
+
+# Variables holding k-hubness maps, compared voxel by voxel
+KMAP_VARS = ('kmap',)
+
+# Final outputs, the only ones compared when the candidate analysis was reduced
+FINAL_PREFIXES = ('kmap_', 'kstats_')
+
+
+def compare_arrays(name, ref, cand):
+    """Measures the drift between a reference and a candidate array, dense or sparse.
+    k-hubness maps are compared voxel by voxel whatever their layouts (row or column).
+    """
+
+    if name in KMAP_VARS and ref.shape != cand.shape and \
+            int(np.prod(ref.shape)) == int(np.prod(cand.shape)) and \
+            not issparse(ref) and not issparse(cand):
+        (ref, cand) = (ref.ravel(order='F'), cand.ravel(order='F'))
+    if ref.shape != cand.shape:
+        return {'shape': [list(ref.shape), list(cand.shape)]}
+
+    size = int(np.prod(ref.shape))
+    if issparse(ref) or issparse(cand):
+        # Element-wise, without densifying, e.g. the sparse codes of the kmdl_boot outputs
+        ref = csr_matrix(ref, dtype=np.float64)
+        cand = csr_matrix(cand, dtype=np.float64)
+        diff = abs(ref - cand)
+        scale = abs(ref).max() if ref.nnz else 0
+        squares = diff.multiply(diff).sum()
+        mismatches = (ref != cand).nnz
+    else:
+        ref = ref.astype(np.float64)
+        cand = cand.astype(np.float64)
+        diff = np.abs(ref - cand)
+        scale = np.abs(ref).max() if size else 0
+        squares = np.sum(diff ** 2)
+        mismatches = np.count_nonzero(ref != cand)
+    max_abs_err = float(diff.max()) if size else 0.0
+
+    metrics = {
+        'max_abs_err': max_abs_err,
+        'max_rel_err': float(max_abs_err / scale) if scale else 0.0,
+        'rmse': float(np.sqrt(squares / size)) if size else 0.0,
+    }
+    if name in KMAP_VARS:
+        metrics['agreement'] = 1.0 - mismatches / size if size else 1.0
+
+    return metrics
+
+
+def compare_mat_files(ref_file, cand_file):
+    """Compares all the numerical variables of two '.mat' files
+    """
+
+    ref = loadmat(ref_file)
+    cand = loadmat(cand_file)
+
+    metrics = {}
+    for name in sorted(set(ref) & set(cand)):
+        if name.startswith('__'):
+            continue
+        if ref[name].dtype.kind in 'biuf' and cand[name].dtype.kind in 'biuf':
+            metrics[name] = compare_arrays(name, ref[name], cand[name])
+
+    return metrics
+
+
+def compare_times(ref_dir, cand_dir, bids_filename):
+    """Speedup of the candidate analysis (reference time / candidate time), in total and
+    for each sub-pipeline run in both analyses, from the times recorded by the runs
+    """
+
+    (ref, cand) = [read_history(get_times_file(os.sep.join([d, 'pipelines', bids_filename])))
+                   for d in (ref_dir, cand_dir)]
+    if not ref or not cand:
+        return {}
+
+    speedup = {s: ref[s] / cand[s] for s in sorted(set(ref) & set(cand)) if cand[s] > 0}
+    if sum(cand.values()) > 0:
+        speedup['total'] = sum(ref.values()) / sum(cand.values())
+
+    return {'reference': ref, 'candidate': cand, 'speedup': speedup}
+
+
+def compare_analyses(iargs):
+    """Compares the '.mat' outputs of two analyses, file by file, and writes a report
+    """
+
+    report = {
+        'reference_dir': iargs['reference_analysis_dir'],
+        'candidate_dir': iargs['analysis_dir'],
+        'files': {},
+        'missing': [],
+    }
+
+    # Only the final outputs of a reduced analysis are projected back to the voxels
+    from spark.reduce import load_reduction
+    reduction = load_reduction(os.sep.join([iargs['analysis_dir'], 'pipelines']))
+    if reduction is not None:
+        report['reduction'] = {k: str(reduction[k]) if k in ('method', 'argument')
+                               else int(reduction[k]) for k in
+                               ('method', 'argument', 'nb_voxels', 'nb_elements')}
+
+    for (root, dirs, files) in os.walk(iargs['reference_analysis_dir']):
+        dirs[:] = sorted([d for d in dirs if d != 'pipelines'])
+        for f in sorted(files):
+            if not f.endswith('.mat') or \
+                    (reduction is not None and not f.startswith(FINAL_PREFIXES)):
+                continue
+            rel_path = os.path.relpath(os.sep.join([root, f]), iargs['reference_analysis_dir'])
+            cand_file = os.sep.join([iargs['analysis_dir'], rel_path])
+            if not os.path.isfile(cand_file):
+                report['missing'].append(rel_path)
+                continue
+            report['files'][rel_path] = compare_mat_files(os.sep.join([root, f]), cand_file)
+            if iargs['verbose']:
+                print('Compared: ' + rel_path)
+
+    times = compare_times(iargs['reference_analysis_dir'], iargs['analysis_dir'],
+                          get_bids_fmri_filename(iargs['fmri']))
+    if times:
+        report['times'] = times
+
+    metrics = [m for f in report['files'].values() for m in f.values()]
+    report['summary'] = {
+        'nb_files': len(report['files']),
+        'nb_missing': len(report['missing']),
+        'nb_shape_mismatches': len([m for m in metrics if 'shape' in m]),
+        'max_rel_err': max([m['max_rel_err'] for m in metrics if 'max_rel_err' in m] or [0.0]),
+        'min_kmap_agreement': min([m['agreement'] for m in metrics if 'agreement' in m] or [1.0]),
+    }
+
+    with open(iargs['report'], 'w', newline='\n') as file:
+        json.dump(report, file, indent=1, sort_keys=True)
+
+    print(dedent('''\
+        Compared files:                {nb_files}
+        Missing files:                 {nb_missing}
+        Shape mismatches:              {nb_shape_mismatches}
+        Maximum relative error:        {max_rel_err:.3g}
+        Minimum k-hubness agreement:   {min_kmap_agreement:.4f}
+        ''').format(**report['summary']) +
+          ('Reduction:                     {method}:{argument}, {nb_voxels} voxels to '
+           '{nb_elements}\n'.format(**report['reduction']) if reduction is not None else '') +
+          ('Speedup:                       x{:.1f}\n'.format(times['speedup']['total'])
+           if 'total' in times.get('speedup', {}) else '') +
+          'Report:\n' + iargs['report'])
+
+    if iargs['tolerance'] and (report['summary']['nb_shape_mismatches'] or
+                               report['summary']['nb_missing'] or
+                               report['summary']['max_rel_err'] > iargs['tolerance']):
+        print('\nThe candidate outputs are not within the tolerance.', file=stderr)
+        sys_exit(1)
+
+    return None
+
+
+def check_iargs_integrity(iargs):
+    """Integrity of the input arguments
+    """
+
+    # Analyses
+    for k in ['reference_analysis_dir', 'analysis_dir']:
+        if not os.path.isdir(iargs[k]):
+            print('Output directory not found:\n' + iargs[k], file=stderr)
+            sys_exit(1)
+
+    # Tolerance
+    if iargs['tolerance'] < 0:
+        print('--tolerance\n' +
+              'Negative tolerance:\n' + str(iargs['tolerance']), file=stderr)
+        sys_exit(1)
+
+    return None
+
+
+def setup_abspath(iargs):
+    """Makes sure all paths are absolute.
+    """
+
+    iargs['fmri'] = os.path.abspath(iargs['fmri'])
+    iargs['out_dir'] = os.path.abspath(iargs['out_dir'])
+    iargs['reference_dir'] = os.path.abspath(iargs['reference_dir'])
+    if iargs['report']:
+        iargs['report'] = os.path.abspath(iargs['report'])
+
+    return iargs
+
+
+def check_iargs_parser(iargs):
+    """[For comparing SPARK analyses] Defines the possible arguments of the program,
+    generates help and usage messages, and issues errors in case of invalid arguments.
+    """
+
+    parser = ArgumentParser(
+        prog='spark.py',
+        description=dedent('''\
+        SParsity-based Analysis of Reliable K-hubness (SPARK) for brain fMRI functional
+        connectivity
+        ____________________________________________________________________________________
+
+           8b    d8 88   88 88     888888 88     888888 88   88 88b 88 88  dP 88 8b    d8
+           88b  d88 88   88 88       88   88     88__   88   88 88Yb88 88odP  88 88b  d88
+           88YbdP88 Y8   8P 88  .o   88   88     88""   Y8   8P 88 Y88 88"Yb  88 88YbdP88
+           88 YY 88 `YbodP' 88ood8   88   88     88     `YbodP' 88  Y8 88  Yb 88 88 YY 88
+           ------------------------------------------------------------------------------
+                              Multimodal Functional Imaging Laboratory
+        ____________________________________________________________________________________
+
+        '''),
+        add_help=False,
+        formatter_class=RawTextHelpFormatter)
+
+    # Required
+    required = parser.add_argument_group(
+        title='  REQUIRED arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    required.add_argument('--COMPARE',
+                          action='store_true',
+                          required=True,
+                          help='\n____________________________________________________________')
+    required.add_argument('--fmri', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the fMRI data analyzed in
+                          both --reference-dir and --out-dir.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='XXX',
+                          dest='fmri')
+    required.add_argument('--out-dir', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the output directory of the
+                          candidate analysis, e.g. run with --precision single or
+                          --reduce.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='out_dir')
+    required.add_argument('--reference-dir', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the output directory of the
+                          reference analysis, e.g. run with --precision double and
+                          otherwise the same options.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='reference_dir')
+
+    # Optional
+    optional = parser.add_argument_group(
+        title='  OPTIONAL arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    optional.add_argument('-h', '--help',
+                          action='help',
+                          help=dedent('''\
+                          Shows this help message and exits.
+                          ____________________________________________________________
+                          '''))
+    optional.add_argument('--report', nargs=1, type=str,
+                          default='',
+                          help=dedent('''\
+                          Path (absolute or relative) to the JSON report listing,
+                          for every numerical variable of every '.mat' output: the
+                          maximum absolute and relative errors, the RMSE, and for
+                          the k-hubness maps the fraction of identical voxels.
+
+                          (default: compare_[fMRI filename].json in the candidate
+                          output directory)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='report')
+    optional.add_argument('--tolerance', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          If greater than 0, the program fails when the maximum
+                          relative error is greater than this tolerance, or when
+                          outputs are missing or of different shapes.
+
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='tolerance')
+    optional.add_argument('-v', '--verbose',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, the program will provide some additional details.
+
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='verbose')
+
+    oargs = vars(parser.parse_known_args(iargs)[0])
+
+    # Hack: when (nargs=1) a list should not be returned
+    for k in ['fmri', 'out_dir', 'reference_dir', 'report', 'tolerance', 'verbose']:
+        if type(oargs[k]) is list:
+            oargs[k] = oargs[k][0]
+
+    return oargs
+
+
+def check_iargs(iargs):
+    """Checks the integrity of the input arguments and returns the options if successful
+    """
+
+    oargs = check_iargs_parser(iargs)
+    oargs = setup_abspath(oargs)
+    oargs['analysis_dir'] = get_analysis_dir(oargs['out_dir'], oargs['fmri'])
+    oargs['reference_analysis_dir'] = get_analysis_dir(oargs['reference_dir'], oargs['fmri'])
+    if not oargs['report']:
+        oargs['report'] = os.sep.join([
+            oargs['analysis_dir'], 'compare_' + get_bids_fmri_filename(oargs['fmri']) + '.json'])
+    check_iargs_integrity(oargs)
+    return oargs
+
+
+def compare(iargs):
+    """Main function, checks the inputs and compares two SPARK analyses
+    """
+
+    compare_analyses(check_iargs(iargs))
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    compare(argv[1:])
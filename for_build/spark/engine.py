@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Python engines of the SPARK bricks, run in place of the standalone application for
+# the jobs they support (--engine python)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import os
+from sys import argv, executable, stderr
+from sys import exit as sys_exit
+
+from spark.pipeline import (VAR_CODES, VAR_LABELS, VAR_TSERIES, find_jobs, get_dtype,
+                            get_nkmap_inputs, get_opt_file, has_var, job_cmd, load_pipe,
+                            load_var, mat_inputs, mat_outputs, read_opt)
+from spark.threads import THREAD_VARS
+
+
+# Jobs, by name prefix, that have a Python engine
+ENGINES = ('kmdl_boot', 'kmdl_Gx', 'nkmap')
+
+
+def warn_experimental():
+    """Warns that the outputs of the Python engines are not those of the published method
+    """
+
+    print('Warning: the Python engines (--engine python) are experimental, their outputs ' +
+          'are not equivalent to those of the standalone application.', file=stderr)
+
+    return None
+
+
+def has_engine(job):
+    """Whether a job can be run with a Python engine
+    """
+
+    return job['name'].startswith(ENGINES)
+
+
+def get_cmd(exe, pipe_file, job, engine='matlab'):
+    """Command running a single job, with its Python engine if requested and available,
+    or with the standalone application otherwise
+    """
+
+    if engine == 'python' and has_engine(job):
+        return [executable, '-m', 'spark.engine', pipe_file, job['name']]
+
+    return job_cmd(exe, pipe_file, job)
+
+
+def engine_env(env):
+    """Environment in which the spark package can be imported by the Python engines
+    """
+
+    path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    return dict(env, PYTHONPATH=os.pathsep.join(
+        [path] + ([env['PYTHONPATH']] if env.get('PYTHONPATH', '') else [])))
+
+
+def get_output(job):
+    """Output of a job, in $SPARK_OUTPUT_DIR when the job is run as a speculative
+    duplicate. The Python engines write a single '.mat' output, jobs declaring others
+    cannot be run with them.
+    """
+
+    if len(job['files_out']) != 1 or not mat_outputs(job):
+        print('The Python engine of the job ' + job['name'] + ' writes a single \'.mat\' ' +
+              'output, but the job declares:\n' + '\n'.join(job['files_out']), file=stderr)
+        sys_exit(1)
+
+    output = mat_outputs(job)[0]
+    if os.environ.get('SPARK_OUTPUT_DIR', ''):
+        output = os.sep.join([os.environ['SPARK_OUTPUT_DIR'], os.path.basename(output)])
+
+    return output
+
+
+def run_job(pipe_file, name, threads=1):
+    """Runs a single job of the pipeline with its Python engine
+    """
+
+    opt = read_opt(get_opt_file(pipe_file))
+    jobs = load_pipe(pipe_file)
+    job = ([job for job in find_jobs(jobs, name) if job['name'] == name] or [None])[0]
+    if job is None or not has_engine(job):
+        print('No job with a Python engine named:\n' + name, file=stderr)
+        sys_exit(1)
+
+    os.makedirs(os.path.dirname(get_output(job)), exist_ok=True)
+    if name.startswith('kmdl_boot'):
+        from spark.ksvd import run_kmdl
+        run_kmdl(load_var(mat_inputs(job)[0], VAR_TSERIES), get_output(job), opt,
+                 name, get_dtype(opt), threads)
+    elif name.startswith('kmdl_Gx'):
+        from spark.gx import run_gx
+        run_gx(mat_inputs(job), get_output(job), get_dtype(opt), threads)
+    elif name.startswith('nkmap'):
+        from spark.kstats import get_kstats_file
+        from spark.nkmap import run_nkmap
+        # Inputs: the clustering of a kmdl_Gx job, and the codes of the kmdl_boot jobs
+        (codes_files, labels_files) = get_nkmap_inputs(jobs, job)
+        missing = [f + ' (' + var + ')'
+                   for (files, var) in ((codes_files, VAR_CODES), (labels_files, VAR_LABELS))
+                   for f in files if not has_var(f, var)]
+        if not codes_files or len(labels_files) != 1 or missing:
+            print('The inputs of the job ' + name + ' were not found, or do not hold the ' +
+                  'variables written by the Python engines of the kmdl_boot and kmdl_Gx ' +
+                  'jobs:\n' + '\n'.join(missing or mat_inputs(job)), file=stderr)
+            sys_exit(1)
+        kmap_file = get_output(job)
+        run_nkmap(codes_files, labels_files[0], kmap_file, get_kstats_file(kmap_file),
+                  float(opt['p_value']), get_dtype(opt))
+
+    return None
+
+
+def engine(iargs):
+    """Main function, runs a single job: pipeline file and job name
+    """
+
+    if len(iargs) != 2:
+        print('Usage: python3 -m spark.engine PIPE_FILE JOB_NAME', file=stderr)
+        sys_exit(1)
+
+    # The engines parallelize with their own threads, each running single-threaded BLAS
+    threads = max(1, int(os.environ.get('SPARK_THREADS', '1')))
+    for var in THREAD_VARS:
+        os.environ[var] = '1'
+
+    run_job(iargs[0], iargs[1], threads)
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    engine(argv[1:])
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Export of the final outputs of SPARK analyses into a single chunked and compressed
+# HDF5 store, indexed by subject/session/run, so that reading a few voxels across many
+# scans only reads the chunks holding them
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from datetime import datetime
+import fcntl
+import os
+from sys import stderr
+from sys import exit as sys_exit
+
+import numpy as np
+from scipy.io import loadmat
+from scipy.sparse import issparse
+
+from spark.kstats import get_kstats_file, get_spark_filename
+from spark.pipeline import find_jobs, get_opt_file, load_pipe, mat_outputs, read_opt
+
+
+# Number of voxels per chunk, along the voxel axis of the vectors and matrices
+CHUNK_VOXELS = 4096
+
+# gzip level of the chunks
+COMPRESSION_LEVEL = 4
+
+# Fields of the index of the scans
+INDEX_FIELDS = ('scan', 'subject', 'session', 'run')
+
+
+def import_h5py():
+    """Imports h5py, only needed by the export
+    """
+
+    try:
+        import h5py
+    except ImportError:
+        print('--export\n' +
+              'The Python package h5py is required to export the outputs.', file=stderr)
+        sys_exit(1)
+
+    return h5py
+
+
+def get_final_files(pipe_file, bids_filename):
+    """Lists the final '.mat' outputs of an analysis: those of the stage C (global
+    dictionary, k-hubness maps) and the statistics of the k-hubness maps, named with
+    the BIDS filename when already renamed by a previous --WRAP-UP
+    """
+
+    opt = read_opt(get_opt_file(pipe_file))
+    spark_filename = get_spark_filename(opt)
+    files = []
+    for job in find_jobs(load_pipe(os.path.splitext(pipe_file)[0] + '.mat'), ''):
+        if job['stage'] != 'C':
+            continue
+        files.extend(mat_outputs(job))
+        if job['name'].startswith('nkmap') and mat_outputs(job):
+            files.append(get_kstats_file(mat_outputs(job)[0]))
+
+    files = [f if os.path.isfile(f) else f.replace(spark_filename, bids_filename)
+             for f in files]
+    return [f for f in files if os.path.isfile(f)]
+
+
+def get_group_name(mat_file, filenames):
+    """Builds the name of the group of a '.mat' file in the store, from its filename
+    without the SPARK or BIDS filename, e.g. 'kmap'
+    """
+
+    name = os.path.splitext(os.path.basename(mat_file))[0]
+    for filename in filenames:
+        name = name.replace('_' + filename, '').replace(filename, '')
+
+    return name.strip('_')
+
+
+def get_voxel_axis(shape):
+    """Voxel axis of a vector or a matrix, whatever its layout (e.g. a row or column
+    k-hubness map, networks x voxels z-scores): its longest axis, the last one when
+    several are. None for volumes, whose voxels are along all axes.
+    """
+
+    if len(shape) > 2:
+        return None
+
+    return len(shape) - 1 - int(np.argmax(shape[::-1]))
+
+
+def write_array(group, name, array):
+    """Writes an array, chunked along its voxel axis (in blocks for volumes) and
+    compressed, or as is when it has a single element. The voxel axis is recorded in
+    the 'voxel_axis' attribute, -1 for volumes.
+    """
+
+    if issparse(array):
+        array = array.toarray()
+    if array.size <= 1:
+        group.create_dataset(name, data=array)
+        return None
+
+    axis = get_voxel_axis(array.shape)
+    if axis is None:
+        chunks = True
+    else:
+        chunks = list(array.shape)
+        chunks[axis] = min(CHUNK_VOXELS, array.shape[axis])
+        chunks = tuple(chunks)
+    dataset = group.create_dataset(name, data=array, chunks=chunks, compression='gzip',
+                                   compression_opts=COMPRESSION_LEVEL, shuffle=True)
+    dataset.attrs['voxel_axis'] = -1 if axis is None else axis
+
+    return None
+
+
+def write_index(h5py, store):
+    """Rebuilds the index of the scans of the store (one row per scan)
+    """
+
+    rows = [tuple([name] + [store['scans'][name].attrs[f] for f in INDEX_FIELDS[1:]])
+            for name in sorted(store['scans'])]
+    if 'index' in store:
+        del store['index']
+    store.create_dataset('index', data=np.array(rows, dtype=[
+        (f, h5py.string_dtype()) for f in INDEX_FIELDS]))
+
+    return None
+
+
+def export_outputs(store_file, pipe_file, bids_filename, verbose=False):
+    """Exports the final outputs of an analysis into the store, under
+    /scans/<BIDS filename>, replacing a previous export of the same scan. Concurrent
+    exports into the same store are serialized with a lock file.
+    """
+
+    h5py = import_h5py()
+    opt = read_opt(get_opt_file(pipe_file))
+    spark_filename = get_spark_filename(opt)
+    (subject, session, run) = opt['fmri_data'].split(' ')[0: 3]
+    files = get_final_files(pipe_file, bids_filename)
+    if not files:
+        print('No final output to export, the stage C should have been run first:\n' +
+              pipe_file, file=stderr)
+        sys_exit(1)
+
+    with open(store_file + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with h5py.File(store_file, 'a') as store:
+            scans = store.require_group('scans')
+            if bids_filename in scans:
+                del scans[bids_filename]
+            scan = scans.create_group(bids_filename)
+            scan.attrs.update(subject=subject, session=session, run=run,
+                              source=opt['out_dir'],
+                              exported=datetime.now().isoformat(timespec='seconds'))
+            for f in files:
+                group = scan.require_group(get_group_name(f, [spark_filename, bids_filename]))
+                for (name, array) in loadmat(f).items():
+                    if not name.startswith('__') and \
+                            (issparse(array) or array.dtype.kind in 'biuf'):
+                        write_array(group, name, array)
+                if verbose:
+                    print('Exported: ' + f)
+            write_index(h5py, store)
+
+    return None
+
+
+def find_scans(store, subject=None, session=None, run=None):
+    """Names of the scans of an open store matching the given IDs (all if None)
+    """
+
+    index = store['index'][()]
+    mask = np.ones(index.shape, bool)
+    for (field, value) in (('subject', subject), ('session', session), ('run', run)):
+        if value is not None:
+            mask &= np.array([v.decode('utf-8') for v in index[field]]) == value
+
+    return [v.decode('utf-8') for v in index['scan'][mask]]
+
+
+def read_voxels(store_file, name, voxels, subject=None, session=None, run=None):
+    """Reads the given voxels (0-based, along the voxel axis) of an exported array,
+    e.g. 'kmap/kmap', for each scan matching the given IDs. Only the chunks holding
+    these voxels are read, but for volumes whose voxels are given as linear indices (in
+    MATLAB order) and read as a whole. Returns {scan: array}, the voxel axis of each
+    array holding the given voxels in order.
+    """
+
+    h5py = import_h5py()
+    voxels = np.asarray(voxels)
+    # h5py selections are increasing and without duplicates
+    (unique, inverse) = np.unique(voxels, return_inverse=True)
+    values = {}
+    with h5py.File(store_file, 'r') as store:
+        for scan in find_scans(store, subject, session, run):
+            path = '/'.join(['scans', scan, name])
+            if not isinstance(store.get(path), h5py.Dataset):
+                continue
+            dataset = store[path]
+            axis = int(dataset.attrs.get('voxel_axis', dataset.ndim - 1))
+            if axis < 0:
+                values[scan] = dataset[()].ravel(order='F')[voxels]
+                continue
+            index = [slice(None)] * dataset.ndim
+            index[axis] = unique
+            values[scan] = np.take(dataset[tuple(index)], inverse, axis=axis)
+
+    return values
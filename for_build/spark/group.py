@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Group-level statistics of the k-hubness maps of many SPARK analyses, streamed one map
+# at a time
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser, RawTextHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+from re import match, search
+from sys import argv, stderr
+from sys import exit as sys_exit
+from textwrap import dedent
+
+import numpy as np
+from scipy.io import loadmat, savemat
+
+from spark.pipeline import VAR_KMAP, load_var
+
+
+# k-hubness maps named with the BIDS filename by --WRAP-UP, the maps re-thresholded by
+# --RETHRESHOLD ('_p<p-value>') being excluded
+KMAP_PATTERN = r'^kmap_(sub-.+?)(_p[0-9.e-]+)?\.mat$'
+
+
+def find_kmaps(out_dirs):
+    """Finds the k-hubness maps of all analyses (wrapped-up with --WRAP-UP) in the output
+    directories, each map once even if found through several (nested or repeated)
+    directories or links. Returns (task, scale, file) tuples, the scale being the number
+    of networks of the map (0 if unknown).
+    """
+
+    kmaps = []
+    found = set()
+    for out_dir in out_dirs:
+        for (root, dirs, files) in os.walk(out_dir):
+            dirs[:] = sorted([d for d in dirs if d != 'pipelines'])
+            for f in sorted(files):
+                m = match(KMAP_PATTERN, f)
+                if not m or m.group(2) or os.path.realpath(os.sep.join([root, f])) in found:
+                    continue
+                found.add(os.path.realpath(os.sep.join([root, f])))
+                task = search(r'_task-([a-zA-Z0-9]+)', f)
+                kmaps.append((task.group(1) if task else 'none',
+                              get_scale(os.sep.join([root, 'kstats_' + m.group(1) + '.mat'])),
+                              os.sep.join([root, f])))
+
+    return kmaps
+
+
+def get_scale(kstats_file):
+    """Number of networks of a k-hubness map, from its statistics (0 if not found)
+    """
+
+    if not os.path.isfile(kstats_file):
+        return 0
+
+    return int(load_var(kstats_file, 'counts').size)
+
+
+def new_accumulator(shape):
+    """Running per-voxel statistics of a group of maps, laid out as the first map of the
+    group (row, column or volume)
+    """
+
+    nb_voxels = int(np.prod(shape))
+    return {
+        'shape': tuple(shape),
+        'n': np.zeros(nb_voxels),
+        'mean': np.zeros(nb_voxels),
+        'm2': np.zeros(nb_voxels),
+        'hubs': np.zeros(nb_voxels, np.uint32),
+        'files': [],
+    }
+
+
+def update(acc, kmap, hub_threshold):
+    """Adds a map to the running statistics (Welford)
+    """
+
+    valid = np.isfinite(kmap)
+    acc['n'] += valid
+    delta = np.where(valid, kmap - acc['mean'], 0)
+    acc['mean'] += delta / np.maximum(acc['n'], 1)
+    acc['m2'] += delta * np.where(valid, kmap - acc['mean'], 0)
+    acc['hubs'] += valid & (kmap >= hub_threshold)
+
+    return acc
+
+
+def merge(a, b):
+    """Merges the running statistics of two disjoint sets of maps (Chan et al.)
+    """
+
+    n = a['n'] + b['n']
+    delta = b['mean'] - a['mean']
+    weight = np.divide(b['n'], n, out=np.zeros_like(n), where=n > 0)
+
+    return {
+        'shape': a['shape'],
+        'n': n,
+        'mean': a['mean'] + delta * weight,
+        'm2': a['m2'] + b['m2'] + delta ** 2 * a['n'] * weight,
+        'hubs': a['hubs'] + b['hubs'],
+        'files': a['files'] + b['files'],
+    }
+
+
+def load_kmap(kmap_file):
+    """Loads a k-hubness map, in any layout (row, column or volume), raising a ValueError
+    naming the file if it cannot be read, the error being reported by the main process.
+    Returns its values (one per voxel, in MATLAB order) and its shape.
+    """
+
+    try:
+        variables = loadmat(kmap_file, variable_names=[VAR_KMAP])
+    except (OSError, ValueError, NotImplementedError) as e:
+        raise ValueError('Failed to load the k-hubness map:\n' + kmap_file + '\n' + str(e))
+    if VAR_KMAP not in variables:
+        raise ValueError('No k-hubness map (variable ' + VAR_KMAP + ') found in:\n' +
+                         kmap_file)
+    kmap = variables[VAR_KMAP]
+
+    return kmap.ravel(order='F').astype(np.float64), kmap.shape
+
+
+def accumulate(kmaps, hub_threshold):
+    """Streams a list of maps, one at a time, into the running statistics of their
+    task/scale group
+    """
+
+    accs = {}
+    for (task, scale, kmap_file) in kmaps:
+        (kmap, shape) = load_kmap(kmap_file)
+        acc = accs.setdefault((task, scale), new_accumulator(shape))
+        if kmap.size != acc['n'].size:
+            raise ValueError('The k-hubness map does not have the same number of voxels ' +
+                             'as the previous ones of its group (' + str(acc['n'].size) +
+                             '):\n' + kmap_file)
+        update(acc, kmap, hub_threshold)
+        acc['files'].append(kmap_file)
+
+    return accs
+
+
+def aggregate(kmaps, hub_threshold, parallel=1):
+    """Computes the statistics of each task/scale group, the maps being split between
+    parallel worker processes whose statistics are then merged. Processes rather than
+    threads, reading the '.mat' files being most of the work and holding the GIL.
+    """
+
+    chunks = [kmaps[k::parallel] for k in range(parallel) if kmaps[k::parallel]]
+    if len(chunks) <= 1:
+        results = [accumulate(chunk, hub_threshold) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            results = list(executor.map(accumulate, chunks, repeat(hub_threshold)))
+
+    groups = {}
+    for accs in results:
+        for (key, acc) in accs.items():
+            if key in groups and groups[key]['n'].size != acc['n'].size:
+                raise ValueError('The k-hubness maps of the group task-' + key[0] +
+                                 ' scale-' + str(key[1]) + ' do not have the same number ' +
+                                 'of voxels:\n' + groups[key]['files'][0] + '\n' +
+                                 acc['files'][0])
+            groups[key] = merge(groups[key], acc) if key in groups else acc
+
+    return groups
+
+
+def get_group_file(output_dir, task, scale):
+    """Builds the path of the summary of a task/scale group
+    """
+
+    return os.sep.join([output_dir, 'group_task-' + task + '_scale-' + str(scale) + '.mat'])
+
+
+def save_group(group_file, acc, hub_threshold):
+    """Saves the statistics of a group: per-voxel number of maps, mean and (unbiased)
+    variance of the k-hubness, and frequency of the voxel being a hub, laid out as the
+    maps
+    """
+
+    n = acc['n']
+    variance = np.divide(acc['m2'], n - 1, out=np.zeros_like(n), where=n > 1)
+    hub_frequency = np.divide(acc['hubs'], n, out=np.zeros_like(n), where=n > 0)
+    savemat(group_file, {
+        'count': n.reshape(acc['shape'], order='F'),
+        'mean': acc['mean'].reshape(acc['shape'], order='F'),
+        'variance': variance.reshape(acc['shape'], order='F'),
+        'hub_frequency': hub_frequency.reshape(acc['shape'], order='F'),
+        'hub_threshold': hub_threshold,
+        'nb_maps': len(acc['files']),
+        'files': np.array(sorted(acc['files']), dtype=object),
+    })
+
+    return None
+
+
+def group_kmaps(iargs):
+    """Computes and saves the statistics of every task/scale group
+    """
+
+    kmaps = find_kmaps(iargs['out_dirs'])
+    # Maps of different scales are not averaged together
+    unknown = [f for (_, scale, f) in kmaps if not scale]
+    if unknown:
+        print('Warning: ' + str(len(unknown)) + ' k-hubness map(s) left out of the groups, ' +
+              'their scale is unknown (no statistics file, kstats_<BIDS filename>.mat, ' +
+              'next to them):\n' + '\n'.join(unknown), file=stderr)
+        kmaps = [kmap for kmap in kmaps if kmap[1]]
+    if not kmaps:
+        print('No k-hubness map found, the analyses should have been wrapped-up with ' +
+              '--WRAP-UP first:\n' + '\n'.join(iargs['out_dirs']), file=stderr)
+        sys_exit(1)
+
+    try:
+        groups = aggregate(kmaps, iargs['hub_threshold'], iargs['parallel'])
+    except ValueError as e:
+        print(str(e), file=stderr)
+        sys_exit(1)
+
+    os.makedirs(iargs['output_dir'], exist_ok=True)
+    for ((task, scale), acc) in sorted(groups.items()):
+        group_file = get_group_file(iargs['output_dir'], task, scale)
+        save_group(group_file, acc, iargs['hub_threshold'])
+        print('Group summary of ' + str(len(acc['files'])) + ' k-hubness maps:\n' +
+              group_file)
+        if iargs['verbose']:
+            print('\n'.join(sorted(acc['files'])))
+
+    return None
+
+
+def check_iargs_integrity(iargs):
+    """Integrity of the input arguments
+    """
+
+    # Output directories
+    for out_dir in iargs['out_dirs']:
+        if not os.path.isdir(out_dir):
+            print('--out-dirs\n' +
+                  'Invalid or nonexistent directory:\n' + out_dir, file=stderr)
+            sys_exit(1)
+
+    # Hub threshold
+    if iargs['hub_threshold'] < 1:
+        print('--hub-threshold\n' +
+              'Number of networks smaller than 1:\n' + str(iargs['hub_threshold']), file=stderr)
+        sys_exit(1)
+
+    # Parallel workers
+    if iargs['parallel'] < 1:
+        print('--parallel\n' +
+              'Number of workers smaller than 1:\n' + str(iargs['parallel']), file=stderr)
+        sys_exit(1)
+
+    return None
+
+
+def setup_abspath(iargs):
+    """Makes sure all paths are absolute.
+    """
+
+    iargs['out_dirs'] = [os.path.abspath(d) for d in iargs['out_dirs']]
+    iargs['output_dir'] = os.path.abspath(iargs['output_dir'])
+
+    return iargs
+
+
+def check_iargs_parser(iargs):
+    """[For group statistics] Defines the possible arguments of the program, generates
+    help and usage messages, and issues errors in case of invalid arguments.
+    """
+
+    parser = ArgumentParser(
+        prog='spark.py',
+        description=dedent('''\
+        SParsity-based Analysis of Reliable K-hubness (SPARK) for brain fMRI functional
+        connectivity
+        ____________________________________________________________________________________
+
+           8b    d8 88   88 88     888888 88     888888 88   88 88b 88 88  dP 88 8b    d8
+           88b  d88 88   88 88       88   88     88__   88   88 88Yb88 88odP  88 88b  d88
+           88YbdP88 Y8   8P 88  .o   88   88     88""   Y8   8P 88 Y88 88"Yb  88 88YbdP88
+           88 YY 88 `YbodP' 88ood8   88   88     88     `YbodP' 88  Y8 88  Yb 88 88 YY 88
+           ------------------------------------------------------------------------------
+                              Multimodal Functional Imaging Laboratory
+        ____________________________________________________________________________________
+
+        '''),
+        add_help=False,
+        formatter_class=RawTextHelpFormatter)
+
+    # Required
+    required = parser.add_argument_group(
+        title='  REQUIRED arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    required.add_argument('--GROUP',
+                          action='store_true',
+                          required=True,
+                          help='\n____________________________________________________________')
+    required.add_argument('--out-dirs', nargs='+', type=str,
+                          required=True,
+                          help=dedent('''\
+                          Paths (absolute or relative) to the output directories of
+                          the analyses, wrapped-up with --WRAP-UP (e.g. with
+                          --move-outputs). All the k-hubness maps found in these
+                          directories are used once, even when the directories are
+                          repeated or nested, those re-thresholded with --RETHRESHOLD
+                          excepted.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='out_dirs')
+    required.add_argument('--output-dir', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the directory of the group
+                          summaries, one per task and scale (number of networks), for
+                          example: 'group_task-rest_scale-12.mat'. Each summary holds,
+                          voxel by voxel, the number of maps ('count'), the mean and
+                          variance of the k-hubness, and the fraction of maps where
+                          the voxel is a hub ('hub_frequency'). Maps without their
+                          statistics (kstats_<BIDS filename>.mat), whose scale is
+                          unknown, are reported and left out.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='output_dir')
+
+    # Optional
+    optional = parser.add_argument_group(
+        title='  OPTIONAL arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    optional.add_argument('-h', '--help',
+                          action='help',
+                          help=dedent('''\
+                          Shows this help message and exits.
+                          ____________________________________________________________
+                          '''))
+    optional.add_argument('--hub-threshold', nargs=1, type=int,
+                          default=2,
+                          help=dedent('''\
+                          Smallest k-hubness (number of networks) of a hub.
+
+                          (valid values: %(metavar)s>=1)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='hub_threshold')
+    optional.add_argument('--parallel', nargs=1, type=int,
+                          default=int(os.environ.get('SPARK_THREADS', '1')),
+                          help=dedent('''\
+                          Number of worker processes reading the maps in parallel, each
+                          one keeping its own running statistics, merged at the end. The
+                          memory used only depends on this number, on the number of
+                          groups and on the number of voxels, not on the number of
+                          maps.
+
+                          (valid values: %(metavar)s>=1)
+                          (default: --threads)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='parallel')
+    optional.add_argument('-v', '--verbose',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, the program will provide some additional details.
+
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='verbose')
+
+    oargs = vars(parser.parse_known_args(iargs)[0])
+
+    # Hack: when (nargs=1) a list should not be returned
+    for k in ['output_dir', 'hub_threshold', 'parallel', 'verbose']:
+        if type(oargs[k]) is list:
+            oargs[k] = oargs[k][0]
+
+    return oargs
+
+
+def check_iargs(iargs):
+    """Checks the integrity of the input arguments and returns the options if successful
+    """
+
+    oargs = check_iargs_parser(iargs)
+    oargs = setup_abspath(oargs)
+    check_iargs_integrity(oargs)
+    return oargs
+
+
+def group(iargs):
+    """Main function, checks the inputs and computes the group statistics
+    """
+
+    group_kmaps(check_iargs(iargs))
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    group(argv[1:])
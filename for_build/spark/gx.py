@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Python engine of the SPARK global dictionary spatial clustering (kmdl_Gx jobs):
+# clusters the atoms of the dictionaries of all resamplings with k-means
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from concurrent.futures import ThreadPoolExecutor
+from sys import stderr
+from sys import exit as sys_exit
+
+import numpy as np
+from scipy.io import savemat
+
+from spark.pipeline import (VAR_DICTIONARY, VAR_ENGINE, VAR_GLOBAL_DICTIONARY, VAR_LABELS,
+                            load_var, var_shape)
+
+
+# Number of k-means runs from different initializations, the best one being kept
+NB_RESTARTS = 8
+
+# Maximum number of iterations of a k-means run
+MAX_ITERATIONS = 100
+
+# Memory used by the atoms-to-centroids distances of a block of atoms (bytes)
+BLOCK_MEMORY = 64 * 1024 ** 2
+
+
+def load_atoms(dictionary_files, dtype='float64'):
+    """Stacks the atoms of the dictionaries of all resamplings (atoms x time), unit
+    norm and with their sign fixed so that the largest element is positive, the sign
+    of an atom being arbitrary. Returns the atoms and the number of atoms of each
+    dictionary.
+    """
+
+    shapes = [var_shape(f, VAR_DICTIONARY) for f in dictionary_files]
+    for (f, shape) in zip(dictionary_files, shapes):
+        if shape is None or len(shape) != 2:
+            print('No dictionary (variable ' + VAR_DICTIONARY + ', time x atoms) found in ' +
+                  'the output of the kmdl_boot job:\n' + f, file=stderr)
+            sys_exit(1)
+        if shape[0] != shapes[0][0]:
+            print('The atoms do not have the same length as the previous ones (' +
+                  str(shape[0]) + '):\n' + f, file=stderr)
+            sys_exit(1)
+
+    # Filled dictionary by dictionary, so that only one of them is loaded at a time
+    nb_atoms = [shape[1] for shape in shapes]
+    atoms = np.empty((sum(nb_atoms), shapes[0][0]), dtype)
+    offset = 0
+    for (f, n) in zip(dictionary_files, nb_atoms):
+        atoms[offset: offset + n] = load_var(f, VAR_DICTIONARY).T
+        offset += n
+    norms = np.linalg.norm(atoms, axis=1)
+    norms[norms == 0] = 1
+    atoms /= norms[:, None]
+    signs = np.sign(atoms[np.arange(atoms.shape[0]), np.abs(atoms).argmax(axis=1)])
+    signs[signs == 0] = 1
+    atoms *= signs[:, None]
+
+    return atoms, nb_atoms
+
+
+def get_block_size(nb_clusters, itemsize):
+    """Number of atoms whose distances to the centroids fit in BLOCK_MEMORY
+    """
+
+    return max(1, BLOCK_MEMORY // (nb_clusters * itemsize))
+
+
+def assign(atoms, centroids, block_size):
+    """Assigns each atom to its closest centroid, block of atoms by block of atoms.
+    Returns the labels and the sum of the squared distances.
+    """
+
+    labels = np.empty(atoms.shape[0], np.int64)
+    inertia = 0.0
+    sq_centroids = (centroids ** 2).sum(axis=1)
+    for start in range(0, atoms.shape[0], block_size):
+        block = atoms[start: start + block_size]
+        # ||a - c||^2 = ||a||^2 - 2 a.c + ||c||^2, the first term being constant per atom
+        dist = sq_centroids[None, :] - 2 * (block @ centroids.T)
+        labels[start: start + block.shape[0]] = dist.argmin(axis=1)
+        inertia += float((dist.min(axis=1) + (block ** 2).sum(axis=1)).sum())
+
+    return labels, inertia
+
+
+def init_centroids(atoms, nb_clusters, rng, block_size):
+    """k-means++ initialization
+    """
+
+    centroids = np.empty((nb_clusters, atoms.shape[1]), atoms.dtype)
+    centroids[0] = atoms[rng.integers(atoms.shape[0])]
+    closest = np.full(atoms.shape[0], np.inf)
+    for k in range(1, nb_clusters):
+        for start in range(0, atoms.shape[0], block_size):
+            block = atoms[start: start + block_size]
+            closest[start: start + block.shape[0]] = np.minimum(
+                closest[start: start + block.shape[0]],
+                ((block - centroids[k - 1]) ** 2).sum(axis=1))
+        total = closest.sum()
+        if total > 0:
+            centroids[k] = atoms[rng.choice(atoms.shape[0], p=closest / total)]
+        else:
+            centroids[k] = atoms[rng.integers(atoms.shape[0])]
+
+    return centroids
+
+
+def kmeans(atoms, nb_clusters, seed, block_size):
+    """Single k-means run (Lloyd). Returns the labels, the centroids and the inertia.
+    """
+
+    rng = np.random.default_rng(seed)
+    centroids = init_centroids(atoms, nb_clusters, rng, block_size)
+    labels = None
+    for _ in range(MAX_ITERATIONS):
+        new_labels, inertia = assign(atoms, centroids, block_size)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=nb_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, atoms)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Empty clusters are moved to random atoms
+        centroids[empty] = atoms[rng.choice(atoms.shape[0], int(empty.sum()), replace=False)]
+
+    return labels, centroids, inertia
+
+
+def cluster_atoms(atoms, nb_clusters, nb_restarts=NB_RESTARTS, threads=1, seed=0):
+    """Runs several k-means in parallel, from different initializations, and keeps the
+    one with the smallest inertia
+    """
+
+    block_size = get_block_size(nb_clusters, atoms.dtype.itemsize)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        runs = list(executor.map(lambda k: kmeans(atoms, nb_clusters, seed + k, block_size),
+                                 range(nb_restarts)))
+
+    return min(runs, key=lambda run: run[2])
+
+
+def run_gx(dictionary_files, gx_file, dtype='float64', threads=1):
+    """Clusters the atoms of the dictionaries of all resamplings into as many clusters
+    as atoms per dictionary (the median number when the network scale was estimated
+    resampling by resampling), and saves the cluster of each atom (1-based, resampling
+    after resampling, a column of doubles) and the global dictionary (time x clusters)
+    read by the Python nkmap engine. The output is marked as written by a Python
+    engine, the standalone application refusing it as input.
+    """
+
+    atoms, nb_atoms = load_atoms(dictionary_files, dtype)
+    labels, centroids, _ = cluster_atoms(atoms, int(np.median(nb_atoms)), threads=threads)
+
+    savemat(gx_file, {
+        VAR_LABELS: (labels + 1).astype(np.float64)[:, None],
+        VAR_GLOBAL_DICTIONARY: centroids.T,
+        VAR_ENGINE: 'python',
+    })
+
+    return None
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Input normalization cache: the fMRI and the mask are decoded once at setup into
+# uncompressed copies in the pipelines directory, read by all the stages
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import gzip
+from hashlib import sha256
+import json
+import os
+from shutil import copyfileobj, which
+from subprocess import DEVNULL, PIPE, Popen
+from subprocess import run as sp_run
+from sys import stderr
+from sys import exit as sys_exit
+from zlib import error as zlib_error
+
+
+# Directory of the copies, in the pipelines directory
+CACHE_DIR = 'inputs'
+
+# Size of the blocks read to hash the inputs (bytes)
+HASH_BLOCK = 16 * 1024 ** 2
+
+
+def get_cache_dir(pipes_dir):
+    """Builds the path of the directory holding the copies of the inputs
+    """
+
+    return os.sep.join([pipes_dir, CACHE_DIR])
+
+
+def get_manifest_file(pipes_dir):
+    """Builds the path of the manifest of the copies (original file, size, modification
+    time and hash of each input)
+    """
+
+    return os.sep.join([get_cache_dir(pipes_dir), 'manifest.json'])
+
+
+def get_cache_file(pipes_dir, name, src):
+    """Builds the path of the copy of an input, without its '.gz' extension
+    """
+
+    filename = os.path.basename(src)
+    if filename.endswith('.gz'):
+        filename = filename[:-3]
+
+    return os.sep.join([get_cache_dir(pipes_dir), name + '_' + filename])
+
+
+def needs_copy(src):
+    """Whether an input is compressed (gzip, or MINC which may be compressed HDF5) and
+    gains from being decoded once, an uncompressed NIfTI being used as is
+    """
+
+    return src.endswith('.gz') or src.endswith('.mnc')
+
+
+def hash_stream(stream, digest):
+    """Hashes a binary stream, block by block
+    """
+
+    for block in iter(lambda: stream.read(HASH_BLOCK), b''):
+        digest.update(block)
+
+    return digest
+
+
+class HashReader:
+    """Binary file hashing what is read from it
+    """
+
+    def __init__(self, file, digest):
+        self.file = file
+        self.digest = digest
+
+    def read(self, size=-1):
+        block = self.file.read(size)
+        self.digest.update(block)
+        return block
+
+
+def decompress(src, dst, threads):
+    """Decompresses a gzip file with pigz, or gzip without pigz, while hashing it. pigz
+    decompresses on a single thread, but reads, writes and checks on others, which
+    makes it faster than gzip. Returns the hash of the compressed file.
+    """
+
+    digest = sha256()
+    if which('pigz'):
+        with open(dst, 'wb') as out:
+            p = Popen(['pigz', '-d', '-c', '-p', str(threads)], stdin=PIPE, stdout=out)
+            try:
+                with open(src, 'rb') as file:
+                    for block in iter(lambda: file.read(HASH_BLOCK), b''):
+                        digest.update(block)
+                        p.stdin.write(block)
+                p.stdin.close()
+            except OSError as e:
+                # Including a broken pipe, when pigz stopped on invalid data
+                p.kill()
+                p.wait()
+                print('Failed to decompress with pigz:\n' + src + '\n' + str(e), file=stderr)
+                sys_exit(1)
+            if p.wait() != 0:
+                print('Failed to decompress with pigz:\n' + src, file=stderr)
+                sys_exit(1)
+    else:
+        try:
+            with open(src, 'rb') as file, open(dst, 'wb') as out:
+                copyfileobj(gzip.GzipFile(fileobj=HashReader(file, digest)), out, HASH_BLOCK)
+        except (OSError, EOFError, zlib_error) as e:
+            print('Failed to decompress with gzip:\n' + src + '\n' + str(e), file=stderr)
+            sys_exit(1)
+
+    return digest.hexdigest()
+
+
+def convert_minc(src, dst):
+    """Converts a MINC file to uncompressed MINC2 with mincconvert. Returns whether
+    mincconvert is available.
+    """
+
+    if not which('mincconvert'):
+        return False
+
+    p = sp_run(['mincconvert', '-clobber', '-2', src, dst], stdout=DEVNULL,
+               env=dict(os.environ, MINC_COMPRESS='0'))
+    if p.returncode != 0:
+        print('Failed to convert with mincconvert:\n' + src, file=stderr)
+        sys_exit(1)
+
+    return True
+
+
+def normalize(src, dst, threads):
+    """Writes the uncompressed copy of an input. Returns the hash of the input.
+    """
+
+    tmp_file = dst + '.tmp'
+    if src.endswith('.gz'):
+        digest = decompress(src, tmp_file, threads)
+        if dst.endswith('.mnc') and convert_minc(tmp_file, tmp_file + '.mnc'):
+            os.replace(tmp_file + '.mnc', tmp_file)
+    else:
+        with open(src, 'rb') as file:
+            digest = hash_stream(file, sha256()).hexdigest()
+        if not convert_minc(src, tmp_file):
+            print('mincconvert not found, the MINC file is used as is:\n' + src, file=stderr)
+            return digest
+    os.replace(tmp_file, dst)
+
+    return digest
+
+
+def is_cached(entry, src):
+    """Whether the copy recorded in the manifest is that of the current input file
+    """
+
+    stat = os.stat(src)
+
+    return entry.get('source') == src and entry.get('size') == stat.st_size and \
+        entry.get('mtime') == stat.st_mtime_ns and os.path.isfile(entry.get('cache', '')) and \
+        os.path.getsize(entry['cache']) == entry.get('cache_size')
+
+
+def cache_inputs(pipes_dir, inputs, threads=1, verbose=False):
+    """Decodes the inputs ({name: file}) once into uncompressed copies, unless already
+    done for the same files, and records their size, modification time and hash in the
+    manifest. Returns the file to be read by the stages for each input.
+    """
+
+    os.makedirs(get_cache_dir(pipes_dir), exist_ok=True)
+    manifest_file = get_manifest_file(pipes_dir)
+    try:
+        with open(manifest_file, 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    files = {}
+    for (name, src) in inputs.items():
+        entry = manifest.get(name, {})
+        if not is_cached(entry, src):
+            dst = get_cache_file(pipes_dir, name, src) if needs_copy(src) else src
+            if verbose:
+                print('Normalizing the input ' + name + ':\n' + src, file=stderr)
+            if dst == src:
+                with open(src, 'rb') as file:
+                    digest = hash_stream(file, sha256()).hexdigest()
+            else:
+                digest = normalize(src, dst, threads)
+                if not os.path.isfile(dst):
+                    dst = src
+            stat = os.stat(src)
+            entry = manifest[name] = {
+                'source': src,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'sha256': digest,
+                'cache': dst,
+                'cache_size': os.path.getsize(dst),
+            }
+        files[name] = entry['cache']
+
+    with open(manifest_file, 'w', newline='\n') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+    return files
+
+
+def get_copies(pipes_dir):
+    """Lists the existing copies of the inputs recorded in the manifest
+    """
+
+    try:
+        with open(get_manifest_file(pipes_dir), 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return []
+
+    return [entry['cache'] for entry in manifest.values()
+            if entry['cache'] != entry['source'] and os.path.isfile(entry['cache'])]
+
+
+def remove_copies(pipes_dir):
+    """Removes the copies of the inputs, the manifest being kept as a record of them.
+    The pipeline reading them, --SETUP has to be run again before running its jobs.
+    """
+
+    for f in get_copies(pipes_dir):
+        os.remove(f)
+
+    return None
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Statistics of the k-hubness maps, persisted after the SPARK stage C so that maps
+# can be re-thresholded without running the pipeline again
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import os
+from sys import stderr
+from sys import exit as sys_exit
+
+import numpy as np
+from scipy.io import loadmat, savemat
+from scipy.sparse import csr_matrix, issparse
+from scipy.stats import norm
+
+from spark.pipeline import (VAR_CODES, VAR_KMAP, VAR_LABELS, find_jobs, get_dtype,
+                            get_nkmap_inputs, get_opt_file, has_var, load_pipe, load_var,
+                            mat_outputs, read_opt, var_shape)
+
+
+def z_critical(p_value):
+    """Two-tailed critical value of the Z-test at the given significance level
+    """
+
+    return norm.isf(p_value / 2)
+
+
+def threshold(zscores, p_value):
+    """Computes the k-hubness map, i.e. the number of networks a voxel significantly
+    belongs to
+    """
+
+    kmap = (np.abs(zscores) > z_critical(p_value)).sum(axis=0)
+    return kmap.astype(np.uint16)
+
+
+def compute_zscores(sums, counts, dtype='float64'):
+    """Averages the sparse codes of each network and standardizes them, the elements of
+    an average map being considered as Gaussian noise
+    """
+
+    maps = sums / np.maximum(counts, 1)[:, None]
+    mu = maps.mean(axis=1)
+    sigma = maps.std(axis=1)
+    sigma[sigma == 0] = 1
+    zscores = (maps - mu[:, None]) / sigma[:, None]
+
+    return zscores.astype(dtype), mu, sigma
+
+
+def network_maps(codes, labels, nb_networks, dtype='float64'):
+    """Sums the sparse codes of the atoms of each network (networks x voxels), the
+    codes being dense or sparse
+    """
+
+    members = csr_matrix((np.ones(labels.size, dtype), (labels, np.arange(labels.size))),
+                         shape=(nb_networks, labels.size))
+    maps = members @ codes
+    if issparse(maps):
+        maps = maps.toarray()
+
+    return np.asarray(maps, dtype)
+
+
+def compute_kstats(codes_files, labels_file, p_value, dtype='float64'):
+    """Computes the statistics needed to threshold the k-hubness map, from the sparse
+    codes of every resampling and the global dictionary spatial clustering. The codes
+    are streamed one resampling at a time into running per-voxel counters, so that
+    the memory used only depends on the numbers of networks and voxels. Raises a
+    ValueError when the clustering does not match the sparse codes.
+    """
+
+    labels = load_var(labels_file, VAR_LABELS).ravel().astype(np.int64) - 1
+    nb_networks = int(labels.max()) + 1
+
+    sums = None
+    hits = None
+    offset = 0
+    for codes_file in codes_files:
+        codes = load_var(codes_file, VAR_CODES)
+        if sums is None:
+            sums = np.zeros((nb_networks, codes.shape[1]), dtype)
+            hits = np.zeros((nb_networks, codes.shape[1]), np.uint16)
+        maps = network_maps(codes, labels[offset: offset + codes.shape[0]], nb_networks, dtype)
+        sums += maps
+        hits += maps != 0
+        offset += codes.shape[0]
+
+    if offset != labels.size:
+        raise ValueError('The number of clustered atoms (' + str(labels.size) + ') does ' +
+                         'not match the number of atoms in the sparse codes (' +
+                         str(offset) + '):\n' + labels_file)
+
+    counts = np.bincount(labels, minlength=nb_networks)
+    zscores, mu, sigma = compute_zscores(sums, counts, dtype)
+
+    return {
+        'zscores': zscores,
+        'mu': mu,
+        'sigma': sigma,
+        'counts': counts,
+        'hits': hits,
+        'nb_resamplings': len(codes_files),
+        'pvalue': p_value,
+        'kmap': threshold(zscores, p_value),
+    }
+
+
+def save_kstats(kstats_file, kstats):
+    """Saves the statistics of a k-hubness map
+    """
+
+    savemat(kstats_file, kstats, do_compression=False)
+
+    return None
+
+
+def load_kstats(kstats_file):
+    """Loads the statistics of a k-hubness map
+    """
+
+    try:
+        return loadmat(kstats_file, squeeze_me=True)
+    except (OSError, ValueError) as e:
+        print('Failed to load the k-hubness statistics file:\n' +
+              kstats_file + '\n' + str(e), file=stderr)
+        sys_exit(1)
+
+
+def get_kstats_file(kmap_file):
+    """Builds the path of the statistics file, next to the k-hubness map and named after
+    it, e.g. 'kstats_[SPARK filename].mat' for 'kmap_[SPARK filename].mat'
+    """
+
+    name = os.path.basename(kmap_file)
+    if name.startswith('kmap_'):
+        name = name[len('kmap_'):]
+
+    return os.sep.join([os.path.dirname(kmap_file), 'kstats_' + name])
+
+
+def matches_kmap(kmap_file, kmap):
+    """Whether the k-hubness map saved by the stage C is the one given by the statistics
+    at the p-value of the setup, i.e. whether the statistics can be used to re-threshold
+    it, whatever its layout (row or column vector)
+    """
+
+    if not has_var(kmap_file, VAR_KMAP):
+        return False
+    saved = load_var(kmap_file, VAR_KMAP)
+
+    return saved.size == kmap.size and \
+        np.array_equal(saved.ravel(order='F'), kmap.ravel(order='F'))
+
+
+def shape_kmap(kmap, kstats):
+    """Lays out a k-hubness map computed from the statistics (one value per voxel) as
+    the map of the stage C they were computed for ('kmap_shape')
+    """
+
+    shape = tuple(np.atleast_1d(kstats.get('kmap_shape', [])).astype(int))
+    if not shape or int(np.prod(shape)) != kmap.size:
+        return kmap
+
+    return kmap.reshape(shape, order='F')
+
+
+def get_spark_filename(opt):
+    """Extracts filename used by SPARK for naming raw outputs
+    """
+
+    return '_'.join(opt['fmri_data'].split(' ')[0: 3])
+
+
+def persist_kstats(pipe_file):
+    """Persists the statistics of the k-hubness maps computed by the stage C, from the
+    inputs of each nkmap job. Maps whose inputs do not hold the expected variables are
+    skipped with a warning, and the statistics record whether they reproduce the map.
+    """
+
+    opt = read_opt(get_opt_file(pipe_file))
+    jobs = load_pipe(pipe_file)
+
+    for job in find_jobs(jobs, 'nkmap'):
+        kmap_files = mat_outputs(job)
+        if not kmap_files or not os.path.isfile(kmap_files[0]):
+            continue
+        # Already saved by the Python engine of the job
+        kstats_file = get_kstats_file(kmap_files[0])
+        if os.path.isfile(kstats_file) and \
+                os.path.getmtime(kstats_file) >= os.path.getmtime(kmap_files[0]):
+            continue
+        (codes_files, labels_files) = get_nkmap_inputs(jobs, job)
+        missing = [f + ' (' + var + ')'
+                   for (files, var) in ((codes_files, VAR_CODES), (labels_files, VAR_LABELS))
+                   for f in files if not has_var(f, var)]
+        if not codes_files or len(labels_files) != 1 or missing:
+            print('Warning: the statistics used by --RETHRESHOLD are not saved for ' +
+                  job['name'] + ', its inputs were not found or do not hold the expected ' +
+                  'variables:\n' + '\n'.join(missing or codes_files + labels_files), file=stderr)
+            continue
+        # Optional step: a finished stage C is never failed by it
+        try:
+            kstats = compute_kstats(codes_files, labels_files[0], float(opt['p_value']),
+                                    get_dtype(opt))
+        except ValueError as e:
+            print('Warning: the statistics used by --RETHRESHOLD are not saved for ' +
+                  job['name'] + ':\n' + str(e), file=stderr)
+            continue
+        kstats['consistent'] = matches_kmap(kmap_files[0], kstats['kmap'])
+        kstats['kmap_shape'] = np.array(var_shape(kmap_files[0], VAR_KMAP) or
+                                        kstats['kmap'].shape)
+        if not kstats['consistent']:
+            print('Warning: the statistics do not reproduce the k-hubness map of ' +
+                  job['name'] + ', --RETHRESHOLD will refuse to use them:\n' + kmap_files[0],
+                  file=stderr)
+        save_kstats(kstats_file, kstats)
+
+    return None
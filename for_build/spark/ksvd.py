@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Python engine of the SPARK sparse dictionary learning (kmdl_boot jobs): K-SVD with
+# the sparse coding of each iteration run in parallel over blocks of voxels.
+# Experimental: unless set with --SETUP --sparsity-level and --network-scale, a fixed
+# sparsity replaces the voxel by voxel estimation of the MATLAB brick, and the network
+# scale is selected with a description length of its own
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from zlib import crc32
+
+import numpy as np
+from scipy.io import savemat
+from scipy.sparse import csc_matrix, hstack
+
+from spark.pipeline import VAR_CODES, VAR_DICTIONARY
+
+
+# Maximum number of atoms (networks) coding a voxel, the same for all voxels, when not
+# set with --SETUP --sparsity-level
+SPARSITY = 4
+
+# Number of voxels coded together, a block being coded by a single thread
+BLOCK_SIZE = 4096
+
+# Regularization of the Gram sub-matrices, in case of collinear atoms
+RIDGE = 1e-10
+
+
+def normalize(dictionary):
+    """Scales the atoms to unit norm
+    """
+
+    norms = np.linalg.norm(dictionary, axis=0)
+    norms[norms == 0] = 1
+
+    return dictionary / norms
+
+
+def init_dictionary(signals, nb_atoms, method, preserve_dc, rng):
+    """Initial dictionary (time x atoms), made of the signals of random voxels
+    ('GivenMatrix') or of the first voxels ('DataElements'), with a constant first atom
+    if preserve_dc
+    """
+
+    candidates = np.flatnonzero(np.abs(signals).sum(axis=0) > 0)
+    if method == 'DataElements':
+        voxels = candidates[:nb_atoms]
+    else:
+        voxels = rng.permutation(candidates)[:nb_atoms]
+
+    dictionary = normalize(signals[:, voxels].copy())
+    if preserve_dc:
+        dictionary[:, 0] = 1 / np.sqrt(signals.shape[0])
+
+    return dictionary
+
+
+def code_block(dictionary, gram, block, sparsity, method):
+    """Sparse codes (atoms x voxels) of a block of signals, with OMP or Thresholding,
+    vectorized over the voxels of the block
+    """
+
+    corr = (dictionary.T @ block).T
+    nb_voxels = block.shape[1]
+    rows = np.arange(nb_voxels)[:, None]
+
+    if method == 'OMP':
+        support = np.empty((nb_voxels, sparsity), np.int64)
+        residual_corr = np.abs(corr)
+        for s in range(sparsity):
+            support[:, s] = residual_corr.argmax(axis=1)
+            coefs = solve_support(gram, corr, support[:, :s + 1])
+            # D'(x - D_S a) = D'x - G[:, S] a
+            residual_corr = np.abs(
+                corr - np.einsum('nks,ns->nk', gram[:, support[:, :s + 1]].transpose(1, 0, 2),
+                                 coefs))
+            residual_corr[rows, support[:, :s + 1]] = -1
+    else:
+        support = np.argsort(-np.abs(corr), axis=1)[:, :sparsity]
+        coefs = solve_support(gram, corr, support)
+
+    voxels = np.repeat(np.arange(nb_voxels), support.shape[1])
+    return csc_matrix((coefs.ravel(), (support.ravel(), voxels)),
+                      shape=(dictionary.shape[1], nb_voxels))
+
+
+def solve_support(gram, corr, support):
+    """Least-squares codes of each voxel on its selected atoms, from the Gram matrix
+    """
+
+    sub_gram = gram[support[:, :, None], support[:, None, :]]
+    sub_gram += RIDGE * np.eye(support.shape[1], dtype=gram.dtype)
+    sub_corr = np.take_along_axis(corr, support, axis=1)
+
+    return np.linalg.solve(sub_gram, sub_corr[:, :, None])[:, :, 0]
+
+
+def sparse_code(dictionary, signals, sparsity, method, threads=1):
+    """Sparse codes (atoms x voxels) of all signals: the blocks of voxels are coded in a
+    thread pool, sharing the dictionary and its Gram matrix computed once
+    """
+
+    gram = dictionary.T @ dictionary
+    starts = range(0, signals.shape[1], BLOCK_SIZE)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        blocks = list(executor.map(
+            lambda start: code_block(dictionary, gram, signals[:, start: start + BLOCK_SIZE],
+                                     sparsity, method), starts))
+
+    return hstack(blocks, format='csc')
+
+
+def update_atoms(dictionary, codes, signals, preserve_dc, rng):
+    """K-SVD atom update, atom after atom: rank-1 approximation of the residual of the
+    voxels using the atom
+    """
+
+    codes = codes.toarray()
+    for k in range(1 if preserve_dc else 0, dictionary.shape[1]):
+        users = np.flatnonzero(codes[k])
+        if users.size == 0:
+            # Unused atom: replaced by the signal of a random voxel
+            atom = signals[:, rng.integers(signals.shape[1])]
+            dictionary[:, k] = atom / (np.linalg.norm(atom) or 1)
+            continue
+        error = signals[:, users] - dictionary @ codes[:, users] + \
+            np.outer(dictionary[:, k], codes[k, users])
+        u, s, vt = np.linalg.svd(error, full_matrices=False)
+        dictionary[:, k] = u[:, 0]
+        codes[k, users] = s[0] * vt[0]
+
+    return dictionary, csc_matrix(codes)
+
+
+def residual_energy(dictionary, codes, signals):
+    """Squared norm of the approximation error, block of voxels by block of voxels
+    """
+
+    energy = 0.0
+    for start in range(0, signals.shape[1], BLOCK_SIZE):
+        block = signals[:, start: start + BLOCK_SIZE]
+        energy += float(((block - dictionary @ codes[:, start: start + BLOCK_SIZE]) ** 2).sum())
+
+    return energy
+
+
+def description_length(dictionary, codes, signals):
+    """Two-part description length of the signals with a dictionary and sparse codes,
+    used to select the network scale
+    """
+
+    n = signals.size
+    energy = max(residual_energy(dictionary, codes, signals), np.finfo(float).tiny)
+    nb_params = codes.nnz + dictionary.size
+
+    return n / 2 * np.log(energy / n) + nb_params / 2 * np.log(n)
+
+
+def ksvd(signals, nb_atoms, nb_iterations, method='Thresholding', init='GivenMatrix',
+         preserve_dc=False, threads=1, seed=0, resume=None, checkpoint=None,
+         sparsity=SPARSITY):
+    """Learns a dictionary (time x atoms) and the sparse codes (atoms x voxels) of the
+    signals (time x voxels). Starts from resume (iterations done, dictionary, state of
+    the random generator) if given, and calls checkpoint with the same after each
+    iteration.
+    """
+
+    rng = np.random.default_rng(seed)
+    sparsity = min(sparsity, nb_atoms)
+    if resume is None:
+        first = 0
+        dictionary = init_dictionary(signals, nb_atoms, init, preserve_dc, rng)
+    else:
+        (first, dictionary, rng.bit_generator.state) = resume
+    for k in range(first, nb_iterations):
+        codes = sparse_code(dictionary, signals, sparsity, method, threads)
+        dictionary, codes = update_atoms(dictionary, codes, signals, preserve_dc, rng)
+        if checkpoint is not None:
+            checkpoint(k + 1, dictionary, rng.bit_generator.state)
+
+    return dictionary, codes
+
+
+def get_scales(opt):
+    """Network scales tested, from the '[begin] [step] [end]' option, or the single
+    network scale set with --SETUP --network-scale
+    """
+
+    if int(opt.get('network_scale', '0')) > 0:
+        return [int(opt['network_scale'])]
+
+    (begin, step, end) = [int(x) for x in opt['network_scales'].split(' ')]
+    return list(range(begin, end + 1, step))
+
+
+def get_sparsity(opt):
+    """Maximum number of atoms coding a voxel, set with --SETUP --sparsity-level or
+    SPARSITY
+    """
+
+    return int(opt.get('sparsity_level', '0')) or SPARSITY
+
+
+def get_checkpoint_file(kmdl_file):
+    """Builds the path of the checkpoint of a kmdl_boot job, next to its output
+    """
+
+    return os.sep.join([os.path.dirname(kmdl_file),
+                        '.' + os.path.splitext(os.path.basename(kmdl_file))[0] +
+                        '.checkpoint.npz'])
+
+
+def save_checkpoint(checkpoint_file, key, scale, iteration, dictionary, rng_state, best):
+    """Saves the progress of a kmdl_boot job: the scale and iteration reached, the
+    dictionary and random generator at that iteration, and the best scale so far. The
+    file is written next to the checkpoint and then renamed, so that an interrupted
+    write leaves the previous checkpoint intact.
+    """
+
+    arrays = {
+        'key': np.array(key),
+        'scale': scale,
+        'iteration': iteration,
+        'rng_state': np.array(json.dumps(rng_state)),
+    }
+    if dictionary is not None:
+        arrays['dictionary'] = dictionary
+    if best is not None:
+        arrays.update(best_dl=best[0], best_dictionary=best[1], best_data=best[2].data,
+                      best_indices=best[2].indices, best_indptr=best[2].indptr,
+                      best_shape=np.array(best[2].shape))
+
+    tmp_file = checkpoint_file[:-4] + '.tmp.npz'
+    with open(tmp_file, 'wb') as file:
+        np.savez(file, **arrays)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_file, checkpoint_file)
+
+    return None
+
+
+def load_checkpoint(checkpoint_file, key):
+    """Loads the progress of a kmdl_boot job (scale, iteration, dictionary, state of
+    the random generator, best scale so far), or None without a usable checkpoint of the
+    same job and options
+    """
+
+    try:
+        with np.load(checkpoint_file) as arrays:
+            if str(arrays['key']) != key:
+                return None
+            best = None
+            if 'best_dl' in arrays:
+                best = (float(arrays['best_dl']), arrays['best_dictionary'],
+                        csc_matrix((arrays['best_data'], arrays['best_indices'],
+                                    arrays['best_indptr']), shape=tuple(arrays['best_shape'])))
+            return (int(arrays['scale']), int(arrays['iteration']),
+                    arrays['dictionary'] if 'dictionary' in arrays else None,
+                    json.loads(str(arrays['rng_state'])), best)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def run_kmdl(signals, kmdl_file, opt, name='', dtype='float64', threads=1):
+    """Learns the dictionary and sparse codes of a resampling at each network scale,
+    and saves those of the scale with the smallest description length (the only scale
+    when set with --SETUP --network-scale). Every
+    'checkpoint_interval' iterations, the progress is checkpointed next to the output,
+    and a job started again continues from its last checkpoint.
+    """
+
+    signals = np.asarray(signals, dtype)
+    nb_iterations = int(opt['nb_iterations'])
+    interval = int(opt.get('checkpoint_interval', '0'))
+    method = opt.get('sparse_coding_method', 'Thresholding')
+    init = opt.get('dict_init_method', 'GivenMatrix')
+    preserve_dc = bool(int(opt.get('preserve_dc_atom', '0')))
+    sparsity = get_sparsity(opt)
+    scales = get_scales(opt)
+    seed = crc32(name.encode('utf-8'))
+
+    # A checkpoint is only used by the same job, with the same options and data
+    checkpoint_file = get_checkpoint_file(kmdl_file)
+    key = ' '.join([name, str(signals.shape), str(signals.dtype), str(scales),
+                    str(sparsity), str(nb_iterations), method, init, str(preserve_dc)])
+    progress = load_checkpoint(checkpoint_file, key) if interval > 0 else None
+    best = None if progress is None else progress[4]
+
+    for nb_atoms in scales:
+        resume = None
+        if progress is not None:
+            if nb_atoms < progress[0] or (nb_atoms == progress[0] and progress[2] is None):
+                # Scale completed before the checkpoint
+                continue
+            if nb_atoms == progress[0]:
+                resume = progress[1:4]
+
+        def checkpoint(iteration, dictionary, rng_state):
+            if iteration % interval == 0 and iteration < nb_iterations:
+                save_checkpoint(checkpoint_file, key, nb_atoms, iteration, dictionary,
+                                rng_state, best)
+
+        dictionary, codes = ksvd(signals, nb_atoms, nb_iterations, method, init, preserve_dc,
+                                 threads, seed, resume, checkpoint if interval > 0 else None,
+                                 sparsity)
+        dl = description_length(dictionary, codes, signals)
+        if best is None or dl < best[0]:
+            best = (dl, dictionary, codes)
+        if interval > 0:
+            save_checkpoint(checkpoint_file, key, nb_atoms, nb_iterations, None, {}, best)
+
+    savemat(kmdl_file, {
+        VAR_DICTIONARY: best[1],
+        # MATLAB sparse matrices are double
+        VAR_CODES: best[2].astype(np.float64),
+        'scale': best[1].shape[1],
+    })
+
+    if os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return None
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Manages the MATLAB Runtime cache (MCR_CACHE_ROOT) of the standalone application, so
+# that its archive is extracted once per node and version instead of once per task
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser, RawTextHelpFormatter
+from fcntl import LOCK_EX, LOCK_UN, flock
+from hashlib import sha256
+import json
+import os
+from shutil import copytree, rmtree
+from subprocess import run as sp_run
+from sys import argv, stderr
+from sys import exit as sys_exit
+from tempfile import gettempdir
+from textwrap import dedent
+
+
+def get_cache_root():
+    """Directory holding the MATLAB Runtime caches on this node
+    """
+
+    return os.environ.get('SPARK_MCR_CACHE_ROOT', '') or get_fallback_root()
+
+
+def get_fallback_root():
+    """Directory holding the MATLAB Runtime caches of the current user, when
+    $SPARK_MCR_CACHE_ROOT is not set or cannot be written, e.g. in a container image
+    mounted read-only: in $TMPDIR (or /tmp) if possible, in $HOME otherwise
+    """
+
+    name = 'spark-mcr-' + str(os.getuid())
+    if is_writable(gettempdir()) or not os.environ.get('HOME', ''):
+        return os.sep.join([gettempdir(), name])
+
+    return os.sep.join([os.environ['HOME'], '.' + name])
+
+
+def is_writable(path):
+    """Whether files can be created in a directory, or in its nearest existing parent
+    when it does not exist yet
+    """
+
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        if os.path.dirname(path) == path:
+            return False
+        path = os.path.dirname(path)
+
+    return os.access(path, os.W_OK | os.X_OK)
+
+
+def get_exe_hash(exe, cache_root):
+    """Hash of the standalone application, only computed again when the file changes
+    """
+
+    stat = os.stat(exe)
+    key = '|'.join([os.path.realpath(exe), str(stat.st_size), str(stat.st_mtime_ns)])
+    hashes_file = os.sep.join([cache_root, 'hashes.json'])
+
+    try:
+        with open(hashes_file, 'r') as file:
+            hashes = json.load(file)
+    except (OSError, ValueError):
+        hashes = {}
+
+    if key not in hashes:
+        h = sha256()
+        with open(exe, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 ** 2), b''):
+                h.update(chunk)
+        hashes[key] = h.hexdigest()
+        try:
+            with open(hashes_file + '.' + str(os.getpid()), 'w') as file:
+                json.dump(hashes, file)
+            os.replace(hashes_file + '.' + str(os.getpid()), hashes_file)
+        except OSError:
+            pass
+
+    return hashes[key]
+
+
+def get_cache_name(exe, cache_root):
+    """Name of the cache of the standalone application, keyed on the SPARK version and
+    the hash of the executable
+    """
+
+    return os.environ.get('SPARK_VERSION', 'dev') + '-' + get_exe_hash(exe, cache_root)[:16]
+
+
+def warm_cache(exe, verbose=False):
+    """Extracts the archive of the standalone application in its cache, once, other
+    processes waiting for the extraction to complete. When the cache root cannot be
+    written (e.g. the cache extracted in a container image, mounted read-only), a
+    writable cache is used instead, seeded with a copy of the one of the root if it is
+    warm. Returns the cache directory.
+    """
+
+    cache_root = get_cache_root()
+    cache_name = get_cache_name(exe, cache_root)
+    seed_dir = ''
+    if not is_writable(cache_root):
+        if os.path.isfile(os.sep.join([cache_root, cache_name, '.warm'])):
+            seed_dir = os.sep.join([cache_root, cache_name])
+        cache_root = get_fallback_root()
+        if not is_writable(cache_root):
+            print('No writable directory for the MATLAB Runtime cache, set ' +
+                  '$SPARK_MCR_CACHE_ROOT or $TMPDIR:\n' + cache_root, file=stderr)
+            sys_exit(1)
+
+    os.makedirs(cache_root, exist_ok=True)
+    cache_dir = os.sep.join([cache_root, cache_name])
+    warm_file = os.sep.join([cache_dir, '.warm'])
+    if os.path.isfile(warm_file):
+        return cache_dir
+
+    with open(cache_dir + '.lock', 'a') as lock:
+        flock(lock, LOCK_EX)
+        try:
+            if not os.path.isfile(warm_file) and seed_dir:
+                if verbose:
+                    print('Copying the MATLAB Runtime cache:\n' + seed_dir + '\nto:\n' +
+                          cache_dir, file=stderr)
+                rmtree(cache_dir, ignore_errors=True)
+                try:
+                    # The copy of the warm file, last, marks it complete
+                    copytree(seed_dir, cache_dir,
+                             ignore=lambda d, names: ['.warm'] if d == seed_dir else [])
+                    open(warm_file, 'w').close()
+                except OSError as e:
+                    print('Warning: failed to copy the MATLAB Runtime cache, extracting ' +
+                          'the archive instead:\n' + str(e), file=stderr)
+                    rmtree(cache_dir, ignore_errors=True)
+            if not os.path.isfile(warm_file):
+                if verbose:
+                    print('Extracting the MATLAB Runtime archive in:\n' + cache_dir, file=stderr)
+                os.makedirs(cache_dir, exist_ok=True)
+                p = sp_run([exe, 'warm'], env=dict(os.environ, MCR_CACHE_ROOT=cache_dir))
+                if p.returncode != 0:
+                    print('\n\nFailed to extract the MATLAB Runtime archive, ' +
+                          'the process returned a non-zero exit status:\n' +
+                          str(p.returncode), file=stderr)
+                    sys_exit(1)
+                open(warm_file, 'w').close()
+        finally:
+            flock(lock, LOCK_UN)
+
+    return cache_dir
+
+
+def runtime_env(exe, verbose=False):
+    """Environment for running the standalone application on a warm cache. A
+    MCR_CACHE_ROOT set by the user is left untouched.
+    """
+
+    if os.environ.get('MCR_CACHE_ROOT', ''):
+        return dict(os.environ)
+
+    return dict(os.environ, MCR_CACHE_ROOT=warm_cache(exe, verbose))
+
+
+def check_iargs_integrity(iargs):
+    """Integrity of the input arguments
+    """
+
+    # MATLAB executable
+    if not os.path.isfile(iargs['exe']):
+        print('--exe\n' +
+              'Invalid or nonexistent file:\n' + iargs['exe'], file=stderr)
+        sys_exit(1)
+
+    return None
+
+
+def setup_abspath(iargs):
+    """Makes sure all paths are absolute.
+    """
+
+    iargs['exe'] = os.path.abspath(iargs['exe'])
+
+    return iargs
+
+
+def check_iargs_parser(iargs):
+    """[For warming the MATLAB Runtime cache] Defines the possible arguments of the
+    program, generates help and usage messages, and issues errors in case of invalid
+    arguments.
+    """
+
+    parser = ArgumentParser(
+        prog='spark.py',
+        description=dedent('''\
+        SParsity-based Analysis of Reliable K-hubness (SPARK) for brain fMRI functional
+        connectivity
+        ____________________________________________________________________________________
+
+           8b    d8 88   88 88     888888 88     888888 88   88 88b 88 88  dP 88 8b    d8
+           88b  d88 88   88 88       88   88     88__   88   88 88Yb88 88odP  88 88b  d88
+           88YbdP88 Y8   8P 88  .o   88   88     88""   Y8   8P 88 Y88 88"Yb  88 88YbdP88
+           88 YY 88 `YbodP' 88ood8   88   88     88     `YbodP' 88  Y8 88  Yb 88 88 YY 88
+           ------------------------------------------------------------------------------
+                              Multimodal Functional Imaging Laboratory
+        ____________________________________________________________________________________
+
+        '''),
+        add_help=False,
+        formatter_class=RawTextHelpFormatter)
+
+    # Required
+    required = parser.add_argument_group(
+        title='  REQUIRED arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    required.add_argument('--WARM-CACHE',
+                          action='store_true',
+                          required=True,
+                          help=dedent('''\
+                          Extracts the archive of the standalone application in the
+                          MATLAB Runtime cache used by all SPARK calls on this node:
+                          $SPARK_MCR_CACHE_ROOT (default: a directory in $TMPDIR or
+                          /tmp), in a sub-directory keyed on $SPARK_VERSION and the
+                          hash of the standalone application. Useful when building
+                          containers: when the cache root cannot be written at run
+                          time (e.g. read-only Singularity image), the cache is copied
+                          to a writable one in $TMPDIR (or $HOME) instead of being
+                          extracted again.
+                          ____________________________________________________________
+                          '''))
+    required.add_argument('--exe', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the MATLAB generated
+                          standalone application.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='XXX',
+                          dest='exe')
+
+    # Optional
+    optional = parser.add_argument_group(
+        title='  OPTIONAL arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    optional.add_argument('-h', '--help',
+                          action='help',
+                          help=dedent('''\
+                          Shows this help message and exits.
+                          ____________________________________________________________
+                          '''))
+    optional.add_argument('-v', '--verbose',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, the program will provide some additional details.
+
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='verbose')
+
+    oargs = vars(parser.parse_known_args(iargs)[0])
+
+    # Hack: when (nargs=1) a list should not be returned
+    for k in ['exe', 'verbose']:
+        if type(oargs[k]) is list:
+            oargs[k] = oargs[k][0]
+
+    return oargs
+
+
+def check_iargs(iargs):
+    """Checks the integrity of the input arguments and returns the options if successful
+    """
+
+    oargs = check_iargs_parser(iargs)
+    oargs = setup_abspath(oargs)
+    check_iargs_integrity(oargs)
+    return oargs
+
+
+def warmcache(iargs):
+    """Main function, checks the inputs and warms the MATLAB Runtime cache
+    """
+
+    oargs = check_iargs(iargs)
+    print(warm_cache(oargs['exe'], oargs['verbose']))
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    warmcache(argv[1:])
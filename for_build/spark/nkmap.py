@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Python engine of the SPARK k-hubness map generation (nkmap jobs)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from sys import stderr
+from sys import exit as sys_exit
+
+import numpy as np
+from scipy.io import savemat
+
+from spark.kstats import compute_kstats, save_kstats, z_critical
+from spark.pipeline import VAR_KMAP
+
+
+def run_nkmap(codes_files, labels_file, kmap_file, kstats_file, p_value, dtype='float64'):
+    """Computes the k-hubness map from the sparse codes of every resampling and the
+    global dictionary spatial clustering, and saves it along with the statistics used
+    by --RETHRESHOLD. The map is saved as 'kmap', a 1 x voxels row (the layout of a sum
+    over the atoms of the codes, atoms x voxels), with 'pvalue' and 'zcritical'. The
+    layout of the map is recorded in the statistics ('kmap_shape'), the readers of the
+    maps accepting rows, columns and volumes.
+    """
+
+    try:
+        kstats = compute_kstats(codes_files, labels_file, p_value, dtype)
+    except ValueError as e:
+        print(str(e), file=stderr)
+        sys_exit(1)
+    # The map is the one given by the statistics, which can be used to re-threshold it
+    kstats['consistent'] = True
+    kmap = kstats['kmap'][None, :]
+    kstats['kmap_shape'] = np.array(kmap.shape)
+    savemat(kmap_file, {
+        VAR_KMAP: kmap,
+        'pvalue': p_value,
+        'zcritical': z_critical(p_value),
+    })
+    save_kstats(kstats_file, kstats)
+
+    return None
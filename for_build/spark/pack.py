@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Packs the outputs of a SPARK analysis into a single archive with a manifest of
+# checksums, to transfer them as one large file
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import gzip
+from hashlib import sha256
+import json
+import os
+from shutil import rmtree
+import tarfile
+
+
+# Size of the blocks read from the outputs (bytes)
+BLOCK_SIZE = 16 * 1024 ** 2
+
+
+def get_archive_file(out_dir, bids_filename):
+    """Builds the path of the archive of an analysis
+    """
+
+    return os.sep.join([out_dir, bids_filename + '.spark.tar'])
+
+
+def get_manifest_file(archive_file):
+    """Builds the path of the manifest of an archive
+    """
+
+    return archive_file[:-len('.tar')] + '.manifest.json'
+
+
+class HashWriter:
+    """Binary file hashing what is written to it
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.digest = sha256()
+        self.size = 0
+
+    def write(self, block):
+        self.digest.update(block)
+        self.size += len(block)
+        return self.file.write(block)
+
+    def tell(self):
+        return self.size
+
+
+def prepare_file(src, tmp_file, level):
+    """Hashes an output and, if level > 0, compresses it into tmp_file (gzip), in a
+    worker thread. Returns its size and hash.
+    """
+
+    digest = sha256()
+    size = 0
+    with open(src, 'rb') as file:
+        if level > 0:
+            # Named after the output in the gzip header, not after the temporary file
+            with open(tmp_file, 'wb') as raw, \
+                    gzip.GzipFile(filename=os.path.basename(src), mode='wb',
+                                  compresslevel=level, fileobj=raw) as out:
+                for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+                    size += len(block)
+                    out.write(block)
+        else:
+            for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                digest.update(block)
+                size += len(block)
+
+    return size, digest.hexdigest()
+
+
+def add_member(tar, analysis_dir, src, level, tmp_file, size, digest):
+    """Adds an output to the archive, its compressed copy if level > 0. Returns its
+    entry of the manifest.
+    """
+
+    name = os.path.relpath(src, os.path.dirname(analysis_dir))
+    if level > 0:
+        tar.add(tmp_file, arcname=name + '.gz', recursive=False)
+        stored_size = os.path.getsize(tmp_file)
+        os.remove(tmp_file)
+    else:
+        tar.add(src, arcname=name, recursive=False)
+        stored_size = size
+
+    return {
+        'path': name,
+        'member': name + '.gz' if level > 0 else name,
+        'size': size,
+        'stored_size': stored_size,
+        'sha256': digest,
+    }
+
+
+def pack_outputs(analysis_dir, archive_file, final_files, level=6, threads=1,
+                 verbose=False, exclude=()):
+    """Packs all the files of an analysis but those excluded into an uncompressed tar
+    archive: the final outputs as they are, so that they can be read without
+    decompression, and the intermediate outputs each compressed with gzip (if level > 0),
+    in parallel. Writes a manifest with the size and SHA-256 of every file and of the
+    archive.
+    """
+
+    exclude = set(exclude)
+    files = []
+    for (root, dirs, names) in os.walk(analysis_dir):
+        dirs.sort()
+        files.extend([os.sep.join([root, f]) for f in sorted(names)
+                      if os.sep.join([root, f]) not in exclude])
+    final_files = set(final_files)
+
+    tmp_dir = os.sep.join([os.path.dirname(archive_file),
+                           '.' + os.path.basename(archive_file) + '.tmp'])
+    os.makedirs(tmp_dir, exist_ok=True)
+    levels = [0 if f in final_files else level for f in files]
+    tmp_files = [os.sep.join([tmp_dir, str(k) + '.gz']) for k in range(len(files))]
+
+    entries = []
+    workers = max(1, threads)
+    try:
+        with open(archive_file + '.tmp', 'wb') as file:
+            out = HashWriter(file)
+            with tarfile.open(fileobj=out, mode='w', format=tarfile.PAX_FORMAT) as tar, \
+                    ThreadPoolExecutor(max_workers=workers) as executor:
+
+                # Members are added in order, at most one compressed output per worker
+                # waiting on disk to be added
+                in_flight = deque()
+                for (k, (f, lvl, tmp_file)) in enumerate(zip(files, levels, tmp_files)):
+                    in_flight.append((f, lvl, tmp_file,
+                                      executor.submit(prepare_file, f, tmp_file, lvl)))
+                    while in_flight and (len(in_flight) >= workers or k == len(files) - 1):
+                        (f, lvl, tmp_file, future) = in_flight.popleft()
+                        entry = add_member(tar, analysis_dir, f, lvl, tmp_file,
+                                           *future.result())
+                        entries.append(dict(entry, final=f in final_files))
+                        if verbose:
+                            print('Packed: ' + entry['path'])
+        os.replace(archive_file + '.tmp', archive_file)
+    finally:
+        rmtree(tmp_dir, ignore_errors=True)
+
+    with open(get_manifest_file(archive_file), 'w', newline='\n') as file:
+        json.dump({
+            'archive': os.path.basename(archive_file),
+            'size': out.size,
+            'sha256': out.digest.hexdigest(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'compression_level': level,
+            'files': entries,
+        }, file, indent=1)
+
+    return None
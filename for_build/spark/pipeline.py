@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Reads the SPARK pipeline files created with --SETUP
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from collections import OrderedDict
+import json
+import os
+from sys import stderr
+from sys import exit as sys_exit
+
+
+# Jobs of each sub-pipeline, by name prefix (see spark_main.m:spark_sub_pipelines)
+STAGES_IDS = OrderedDict([
+    ('A', ('single_kmap', 'tseries_boot')),
+    ('B', ('kmdl_boot',)),
+    ('C', ('kmdl_Gx', 'nkmap')),
+])
+
+# Variables saved in the '.mat' outputs of the SPARK bricks
+VAR_TSERIES = 'tseries'       # tseries_boot: bootstrap sample (time x voxels)
+VAR_DICTIONARY = 'D'          # kmdl_boot: dictionary (time x atoms)
+VAR_CODES = 'X'               # kmdl_boot: sparse codes (atoms x voxels)
+VAR_LABELS = 'idx'            # kmdl_Gx: cluster of each atom, resampling after resampling
+VAR_GLOBAL_DICTIONARY = 'Gx'  # kmdl_Gx: global dictionary (time x clusters)
+VAR_KMAP = 'kmap'             # nkmap: k-hubness map (row, column or volume)
+
+# Variable marking the outputs of the Python engines, which the standalone application
+# refuses as inputs (see spark_main.m:check_engine)
+VAR_ENGINE = 'spark_engine'
+
+
+def read_opt(opt_file):
+    """Reads the options ('key value' lines) of a SPARK pipeline options file
+    """
+
+    opt = OrderedDict()
+    try:
+        with open(opt_file, 'r', newline='\n') as file:
+            for line in file:
+                tokens = line.rstrip('\n').split(' ', 1)
+                if len(tokens) == 2:
+                    opt[tokens[0]] = tokens[1]
+    except OSError as e:
+        print('Failed to read the SPARK pipeline options file:\n' +
+              opt_file + '\n' + str(e), file=stderr)
+        sys_exit(1)
+
+    return opt
+
+
+def get_dtype(opt):
+    """Floating-point type of the intermediate outputs, set with --SETUP --precision
+    """
+
+    return 'float32' if opt.get('precision', 'double') == 'single' else 'float64'
+
+
+def flatten_files(files):
+    """Lists all the paths found in the 'files_in' or 'files_out' of a job
+    """
+
+    if isinstance(files, str):
+        return [str(files)] if files else []
+    elif hasattr(files, '_fieldnames'):
+        return [f for k in files._fieldnames for f in flatten_files(getattr(files, k))]
+    elif hasattr(files, 'ravel'):
+        return [f for x in files.ravel() for f in flatten_files(x)]
+    elif isinstance(files, (list, tuple)):
+        return [f for x in files for f in flatten_files(x)]
+
+    return []
+
+
+def get_index_file(pipe_file):
+    """Builds the path of the jobs index written with the pipeline file at setup
+    """
+
+    return os.path.splitext(pipe_file)[0] + '.jobs.json'
+
+
+def load_index(index_file):
+    """Loads the jobs of all sub-pipelines from the jobs index, each job pointing to the
+    file holding its own definition
+    """
+
+    try:
+        with open(index_file, 'r') as file:
+            index = json.load(file)
+    except (OSError, ValueError) as e:
+        print('Failed to load the SPARK jobs index:\n' +
+              index_file + '\n' + str(e), file=stderr)
+        sys_exit(1)
+
+    jobs = OrderedDict()
+    for stage in STAGES_IDS:
+        entries = index.get(stage, [])
+        jobs[stage] = [{
+            'name': entry['name'],
+            'stage': stage,
+            'index': k + 1,
+            'file': entry['file'],
+            'files_in': flatten_files(entry['files_in']),
+            'files_out': flatten_files(entry['files_out']),
+        } for (k, entry) in enumerate(entries if isinstance(entries, list) else [entries])]
+
+    return jobs
+
+
+def load_pipe(pipe_file):
+    """Loads the jobs of all sub-pipelines, in the order they are run by the standalone
+    application. Pipelines set up before the jobs index was introduced are read from
+    the pipeline file itself, their jobs have no file of their own.
+    """
+
+    if os.path.isfile(get_index_file(pipe_file)):
+        return load_index(get_index_file(pipe_file))
+
+    from scipy.io import loadmat
+
+    try:
+        pipe = loadmat(pipe_file, variable_names=['pipe'],
+                       squeeze_me=True, struct_as_record=False)['pipe']
+    except (OSError, KeyError, ValueError) as e:
+        print('Failed to load the SPARK pipeline file:\n' +
+              pipe_file + '\n' + str(e), file=stderr)
+        sys_exit(1)
+
+    jobs = OrderedDict()
+    for stage in STAGES_IDS:
+        sub_pipe = getattr(pipe, 'pipe_' + stage)
+        jobs[stage] = []
+        for name in getattr(sub_pipe, '_fieldnames', []):
+            job = getattr(sub_pipe, name)
+            jobs[stage].append({
+                'name': name,
+                'stage': stage,
+                'index': len(jobs[stage]) + 1,
+                'file': None,
+                'files_in': flatten_files(job.files_in),
+                'files_out': flatten_files(job.files_out),
+            })
+
+    return jobs
+
+
+def job_cmd(exe, pipe_file, job):
+    """Command running a single job with the standalone application, loading only the
+    file of this job when there is one
+    """
+
+    if job.get('file'):
+        return [exe, 'run-jobs', pipe_file, job['file']]
+
+    return [exe, 'run', pipe_file, job['stage'], str(job['index']) + ';']
+
+
+def build_dependencies(jobs):
+    """Finds the jobs each job depends on, i.e. those producing one of its inputs
+    """
+
+    producers = {}
+    for stage in jobs:
+        for job in jobs[stage]:
+            for f in job['files_out']:
+                producers[f] = job['name']
+
+    deps = {}
+    for stage in jobs:
+        for job in jobs[stage]:
+            deps[job['name']] = sorted(set(
+                [producers[f] for f in job['files_in'] if f in producers]) - {job['name']})
+
+    return deps
+
+
+def load_var(mat_file, var):
+    """Loads a single variable from a '.mat' file
+    """
+
+    from scipy.io import loadmat
+
+    try:
+        return loadmat(mat_file, variable_names=[var])[var]
+    except (OSError, KeyError, ValueError) as e:
+        print('Failed to load the variable ' + var + ' from:\n' +
+              mat_file + '\n' + str(e), file=stderr)
+        sys_exit(1)
+
+
+def var_shape(mat_file, var):
+    """Shape of a variable of a '.mat' file, without loading it, or None if not found
+    """
+
+    from scipy.io import whosmat
+
+    try:
+        return ([tuple(v[1]) for v in whosmat(mat_file) if v[0] == var] or [None])[0]
+    except (OSError, ValueError, NotImplementedError):
+        return None
+
+
+def has_var(mat_file, var):
+    """Whether a '.mat' file holds a variable, without loading it
+    """
+
+    return var_shape(mat_file, var) is not None
+
+
+def element_axis(shape, nb_elements):
+    """Axis of an array holding one value per voxel (or element) of the mask, e.g. the
+    voxel axis of a row or column vector, or of a networks x voxels matrix, or None if
+    no axis has this size. The last one when several do.
+    """
+
+    axes = [k for (k, n) in enumerate(shape) if n == nb_elements]
+
+    return axes[-1] if axes else None
+
+
+def find_jobs(jobs, prefix):
+    """Selects the jobs whose name starts with the given prefix
+    """
+
+    return [job for stage in jobs for job in jobs[stage] if job['name'].startswith(prefix)]
+
+
+def select_jobs(jobs, jobs_indices, jobs_patterns):
+    """Filters the jobs of a sub-pipeline the same way the standalone application does
+    """
+
+    if jobs_patterns:
+        return [job for job in jobs if any(s in job['name'] for s in jobs_patterns)]
+    elif jobs_indices:
+        return [job for job in jobs if job['index'] in jobs_indices]
+
+    return list(jobs)
+
+
+def mat_inputs(job):
+    """Lists the '.mat' inputs of a job
+    """
+
+    return [f for f in job['files_in'] if f.endswith('.mat')]
+
+
+def mat_outputs(job):
+    """Lists the '.mat' outputs of a job
+    """
+
+    return [f for f in job['files_out'] if f.endswith('.mat')]
+
+
+def get_nkmap_inputs(jobs, job):
+    """Lists the inputs of a nkmap job: the sparse codes of the kmdl_boot jobs and the
+    clustering of the kmdl_Gx job it reads
+    """
+
+    inputs = mat_inputs(job)
+    codes_files = [f for boot_job in find_jobs(jobs, 'kmdl_boot')
+                   for f in mat_outputs(boot_job)[:1] if f in inputs]
+    labels_files = [f for gx_job in find_jobs(jobs, 'kmdl_Gx')
+                    for f in mat_outputs(gx_job) if f in inputs]
+
+    return codes_files, labels_files
+
+
+def get_opt_file(pipe_file):
+    """Builds the path of the options file corresponding to a pipeline file
+    """
+
+    return os.path.splitext(pipe_file)[0] + '.opt'
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Data reduction of the fast exploratory mode (--SETUP --reduce): the masked fMRI is
+# averaged within atlas parcels or spatially downsampled before the stages A to C, and
+# the final maps are projected back to the voxels of the mask
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import os
+from shutil import copy2
+from sys import stderr
+from sys import exit as sys_exit
+
+import numpy as np
+from scipy.io import loadmat, savemat
+from scipy.sparse import csr_matrix
+
+
+# Reductions, with their argument
+REDUCE_METHODS = {'parcels': 'ATLAS', 'downsample': 'F'}
+
+# Variables of the final outputs with one value per voxel (or element) of the mask, along
+# any axis, or laid out as a volume of the grid of the mask
+VOXEL_VARS = ('kmap', 'zscores', 'hits')
+
+
+def parse_reduce(value):
+    """Splits a --reduce value ('parcels:ATLAS' or 'downsample:F') into the method and
+    its argument, or returns None if invalid
+    """
+
+    (method, _, arg) = value.partition(':')
+    if method not in REDUCE_METHODS or not arg:
+        return None
+    if method == 'downsample' and (not arg.isdigit() or int(arg) < 2):
+        return None
+
+    return method, arg
+
+
+def get_reduce_dir(pipes_dir):
+    """Builds the path of the directory holding the reduced inputs and the voxel to
+    reduced element mapping
+    """
+
+    return os.sep.join([pipes_dir, 'reduced'])
+
+
+def get_reduction_file(pipes_dir):
+    """Builds the path of the file describing the reduction
+    """
+
+    return os.sep.join([get_reduce_dir(pipes_dir), 'reduction.mat'])
+
+
+def import_nibabel():
+    """Imports nibabel, only needed by the reduction
+    """
+
+    try:
+        import nibabel
+    except ImportError:
+        print('--reduce\n' +
+              'The Python package nibabel is required to reduce the data.', file=stderr)
+        sys_exit(1)
+
+    return nibabel
+
+
+def mask_indices(mask):
+    """Indices of the voxels of a mask, in the (column-major) order of the standalone
+    application
+    """
+
+    return np.flatnonzero(np.asarray(mask).ravel(order='F') > 0)
+
+
+def masked_tseries(fmri, indices):
+    """Time series of the voxels of the mask (voxels x time)
+    """
+
+    data = np.asarray(fmri.dataobj, np.float32)
+    return data.reshape((-1, data.shape[-1]), order='F')[indices]
+
+
+def reduce_parcels(tseries, indices, atlas):
+    """Averages the time series within each parcel of the atlas (label > 0). Returns
+    the reduced time series (parcels x time) and the parcel of each voxel of the mask
+    (-1 outside of the parcels).
+    """
+
+    labels = np.rint(np.asarray(atlas).ravel(order='F')[indices]).astype(np.int64)
+    parcels = np.unique(labels[labels > 0])
+    mapping = np.searchsorted(parcels, labels)
+    mapping[labels <= 0] = -1
+
+    inside = mapping >= 0
+    members = csr_matrix((np.ones(int(inside.sum()), np.float32),
+                          (mapping[inside], np.flatnonzero(inside))),
+                         shape=(parcels.size, labels.size))
+    counts = np.asarray(members.sum(axis=1)).ravel()
+
+    return np.asarray(members @ tseries) / counts[:, None], mapping
+
+
+def reduce_downsample(tseries, indices, shape, factor):
+    """Averages the time series within blocks of factor^3 voxels. Returns the reduced
+    time series (blocks x time), the reduced mask and the block of each voxel of the
+    mask.
+    """
+
+    coords = np.unravel_index(indices, shape, order='F')
+    reduced_shape = tuple(-(-n // factor) for n in shape)
+    blocks = np.ravel_multi_index(tuple(c // factor for c in coords), reduced_shape, order='F')
+    (kept, mapping) = np.unique(blocks, return_inverse=True)
+
+    members = csr_matrix((np.ones(indices.size, np.float32), (mapping, np.arange(indices.size))),
+                         shape=(kept.size, indices.size))
+    counts = np.asarray(members.sum(axis=1)).ravel()
+    mask = np.zeros(reduced_shape, np.uint8, order='F')
+    mask.ravel(order='F')[kept] = 1
+
+    return np.asarray(members @ tseries) / counts[:, None], mask, mapping
+
+
+def same_grid(image, reference):
+    """Whether two images are on the same voxel grid (dimensions and affine)
+    """
+
+    return image.shape[:3] == reference.shape[:3] and \
+        np.allclose(image.affine, reference.affine, atol=1e-4)
+
+
+def reduce_inputs(pipes_dir, fmri_file, mask_file, method, arg, verbose=False):
+    """Writes the reduced fMRI and mask read by the stages A to C, and the element of
+    each voxel of the mask. Returns the paths of the reduced fMRI and mask.
+    """
+
+    nibabel = import_nibabel()
+    fmri = nibabel.load(fmri_file)
+    mask = nibabel.load(mask_file)
+    if not same_grid(fmri, mask):
+        print('--reduce\n' +
+              'The fMRI is not on the grid of the mask (' + str(mask.shape[:3]) + '):\n' +
+              fmri_file, file=stderr)
+        sys_exit(1)
+    indices = mask_indices(mask.dataobj)
+    tseries = masked_tseries(fmri, indices)
+
+    affine = fmri.affine
+    if method == 'parcels':
+        atlas = nibabel.load(arg)
+        if not same_grid(atlas, mask):
+            print('--reduce\n' +
+                  'The atlas is not on the grid of the mask (' + str(mask.shape[:3]) + '):\n' +
+                  arg, file=stderr)
+            sys_exit(1)
+        (reduced, mapping) = reduce_parcels(tseries, indices, atlas.dataobj)
+        # Parcels laid out along the first axis
+        reduced_mask = np.ones((reduced.shape[0], 1, 1), np.uint8)
+        affine = np.eye(4)
+    else:
+        factor = int(arg)
+        (reduced, reduced_mask, mapping) = reduce_downsample(tseries, indices,
+                                                             mask.shape[:3], factor)
+        # Voxel (0, 0, 0) of the reduced grid centered on its block
+        affine = affine @ np.diag([factor, factor, factor, 1])
+        affine[:3, 3] = fmri.affine[:3, :3] @ np.full(3, (factor - 1) / 2) + fmri.affine[:3, 3]
+    del tseries
+
+    volume = np.zeros(reduced_mask.shape + (reduced.shape[1],), np.float32, order='F')
+    volume.reshape((-1, reduced.shape[1]), order='F')[mask_indices(reduced_mask)] = reduced
+
+    reduce_dir = get_reduce_dir(pipes_dir)
+    os.makedirs(reduce_dir, exist_ok=True)
+    name = os.path.basename(fmri_file).split('.')[0]
+    reduced_fmri = os.sep.join([reduce_dir, name + '.nii'])
+    reduced_mask_file = os.sep.join([reduce_dir, 'mask.nii'])
+    nibabel.save(nibabel.Nifti1Image(volume, affine), reduced_fmri)
+    nibabel.save(nibabel.Nifti1Image(reduced_mask, affine), reduced_mask_file)
+
+    savemat(get_reduction_file(pipes_dir), {
+        'method': method,
+        'argument': arg,
+        # Element of each voxel of the mask (1-based, 0 outside of the parcels)
+        'mapping': (mapping + 1).astype(np.float64)[:, None],
+        'nb_voxels': indices.size,
+        'nb_elements': reduced.shape[0],
+        'mask': mask_file,
+        # Grids of the mask and of the reduced fMRI, for the maps written as volumes
+        'mask_shape': np.array(mask.shape[:3], np.float64),
+        'reduced_shape': np.array(reduced_mask.shape, np.float64),
+        'voxels': (indices + 1).astype(np.float64)[:, None],
+        'elements': (mask_indices(reduced_mask) + 1).astype(np.float64)[:, None],
+    })
+
+    print('Reduced the ' + str(indices.size) + ' voxels of the mask to ' +
+          str(reduced.shape[0]) + ' ' + ('parcels' if method == 'parcels' else 'blocks') +
+          ' (x{:.1f} fewer)'.format(indices.size / max(1, reduced.shape[0])) +
+          (':\n' + reduced_fmri if verbose else ''))
+
+    return reduced_fmri, reduced_mask_file
+
+
+def load_reduction(pipes_dir):
+    """Loads the description of the reduction of an analysis, or None if not reduced
+    """
+
+    if not os.path.isfile(get_reduction_file(pipes_dir)):
+        return None
+
+    reduction = loadmat(get_reduction_file(pipes_dir), squeeze_me=True)
+    for key in ('mapping', 'voxels', 'elements'):
+        if key in reduction:
+            reduction[key] = np.atleast_1d(reduction[key]).astype(np.int64) - 1
+    for key in ('mask_shape', 'reduced_shape'):
+        if key in reduction:
+            reduction[key] = tuple(np.atleast_1d(reduction[key]).astype(int))
+
+    return reduction
+
+
+def project(array, mapping, axis=-1):
+    """Projects an array with one value per reduced element along the given axis to the
+    voxels of the mask, voxels outside of the parcels being 0
+    """
+
+    array = np.moveaxis(array, axis, -1)
+    out = np.zeros(array.shape[:-1] + (mapping.size,), array.dtype)
+    inside = mapping >= 0
+    out[..., inside] = array[..., mapping[inside]]
+
+    return np.moveaxis(out, -1, axis)
+
+
+def project_volume(array, reduction):
+    """Projects a volume of the grid of the reduced fMRI (the layout of the maps of the
+    standalone application), with any trailing axes, to a volume of the grid of the mask,
+    voxels outside of the mask being 0
+    """
+
+    rest = array.shape[3:]
+    values = array.reshape((-1,) + rest, order='F')[reduction['elements']]
+    out = np.zeros((int(np.prod(reduction['mask_shape'])),) + rest, array.dtype)
+    out[reduction['voxels']] = project(values, reduction['mapping'], axis=0)
+
+    return out.reshape(reduction['mask_shape'] + rest, order='F')
+
+
+def project_var(array, reduction):
+    """Projects a variable of a final output to the voxels of the mask. Returns the
+    projected array, the array itself if already projected, or None if it matches neither
+    the elements nor the voxels.
+    """
+
+    from spark.pipeline import element_axis
+
+    # Volumes first, one of their dimensions possibly matching the number of elements
+    if array.ndim >= 3 and array.shape[:3] == reduction.get('mask_shape'):
+        return array
+    if array.ndim >= 3 and array.shape[:3] == reduction.get('reduced_shape'):
+        return project_volume(array, reduction)
+    if element_axis(array.shape, reduction['nb_voxels']) is not None:
+        return array
+    axis = element_axis(array.shape, reduction['nb_elements'])
+    if axis is not None:
+        return project(array, reduction['mapping'], axis)
+
+    return None
+
+
+def project_outputs(pipes_dir, final_files, verbose=False):
+    """Projects the final outputs of a reduced analysis back to the voxels of the mask,
+    in place, the reduced outputs being kept in the 'reduced' directory. Outputs already
+    projected are left as they are, those that cannot be projected are reported.
+    """
+
+    reduction = load_reduction(pipes_dir)
+    if reduction is None:
+        return None
+
+    for f in final_files:
+        variables = loadmat(f)
+        projected = False
+        for name in VOXEL_VARS:
+            if name not in variables:
+                continue
+            array = project_var(variables[name], reduction)
+            if array is None:
+                print('Warning: \'' + name + '\' (' + 'x'.join(map(str, variables[name].shape)) +
+                      ') matches neither the ' + str(reduction['nb_elements']) +
+                      ' reduced elements nor the ' + str(reduction['nb_voxels']) +
+                      ' voxels of the mask, left reduced:\n' + f, file=stderr)
+            elif array is not variables[name]:
+                variables[name] = array
+                projected = True
+        if not projected:
+            continue
+        # The layout of the map of the stage C, recorded with its statistics
+        if 'kmap_shape' in variables and 'kmap' in variables:
+            variables['kmap_shape'] = np.array(variables['kmap'].shape)
+        copy2(f, os.sep.join([get_reduce_dir(pipes_dir), os.path.basename(f)]))
+        savemat(f, {k: v for (k, v) in variables.items() if not k.startswith('__')})
+        if verbose:
+            print('Projected to the voxels of the mask: ' + f)
+
+    return None
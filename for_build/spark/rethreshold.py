@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Re-thresholds SPARK k-hubness maps at a new significance level
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser, RawTextHelpFormatter
+import os
+from sys import argv, stderr
+from sys import exit as sys_exit
+from textwrap import dedent
+
+from scipy.io import savemat
+
+from spark.kstats import get_spark_filename, load_kstats, shape_kmap, threshold, z_critical
+from spark.pipeline import VAR_KMAP, read_opt
+
+
+def rethreshold_kmaps(iargs):
+    """Re-thresholds all the k-hubness maps of an analysis using their persisted
+    statistics
+    """
+
+    kstats_all = [load_kstats(f) for f in iargs['kstats_files']]
+    for (kstats_file, kstats) in zip(iargs['kstats_files'], kstats_all):
+        if not int(kstats.get('consistent', 0)):
+            print('The k-hubness statistics do not reproduce the k-hubness map of the ' +
+                  'stage C, which cannot be re-thresholded with them:\n' + kstats_file,
+                  file=stderr)
+            sys_exit(1)
+
+    for (kstats_file, kstats) in zip(iargs['kstats_files'], kstats_all):
+        kmap_file = os.sep.join([
+            os.path.dirname(kstats_file),
+            'kmap_' + os.path.basename(kstats_file)[len('kstats_'):-len('.mat')] +
+            '_p' + '{:g}'.format(iargs['p_value']) + '.mat'])
+        savemat(kmap_file, {
+            VAR_KMAP: shape_kmap(threshold(kstats['zscores'], iargs['p_value']), kstats),
+            'pvalue': iargs['p_value'],
+            'zcritical': z_critical(iargs['p_value']),
+        })
+        if iargs['verbose']:
+            print('k-hubness map re-thresholded at p=' + '{:g}'.format(iargs['p_value']) +
+                  ':\n' + kmap_file)
+
+    return None
+
+
+def find_kstats_files(analysis_dir, filenames):
+    """Finds the k-hubness statistics files of an analysis, named either with the raw
+    SPARK filename (before --WRAP-UP) or with the BIDS filename (after --WRAP-UP)
+    """
+
+    prefixes = ['kstats_' + f for f in filenames]
+    kstats_files = []
+    for (root, _, files) in os.walk(analysis_dir):
+        # One statistics file per k-hubness map, e.g. 'kstats_[filename].mat'
+        kstats_files.extend([os.sep.join([root, f]) for f in sorted(files)
+                             if f.endswith('.mat') and any(
+                                 f[:-len('.mat')] == p or f.startswith(p + '_') for p in prefixes)])
+
+    return kstats_files
+
+
+def check_iargs_integrity(iargs):
+    """Integrity of the input arguments
+    """
+
+    # P-value
+    if (iargs['p_value'] < 0 or iargs['p_value'] > 1):
+        print('--p-value\n' +
+              'P-value not between 0 and 1:\n' + str(iargs['p_value']), file=stderr)
+        sys_exit(1)
+
+    # Statistics
+    if not iargs['kstats_files']:
+        print('No k-hubness statistics file found in:\n' + iargs['analysis_dir'] + '\n' +
+              'The stage C should have been run first.', file=stderr)
+        sys_exit(1)
+
+    return None
+
+
+def get_bids_fmri_filename(fmri):
+    """Extracts filename without extension from a BIDS fMRI file
+    """
+
+    filename = os.path.basename(fmri)
+    extension = filename.split('_')[-1][4:]
+    return filename[:-len(extension)]
+
+
+def get_analysis_dir(out_dir, fmri):
+    """Builds the path of the directory containing the outputs corresponding to the input
+    fMRI, which might have been moved to --out-dir with --WRAP-UP --move-outputs
+    """
+
+    analysis_dir = os.sep.join([out_dir, get_bids_fmri_filename(fmri)])
+    return analysis_dir if os.path.isdir(analysis_dir) else out_dir
+
+
+def get_filenames(analysis_dir, fmri):
+    """Lists the possible filenames of the outputs corresponding to the input fMRI
+    """
+
+    filenames = [get_bids_fmri_filename(fmri)]
+    opt_file = os.sep.join([analysis_dir, 'pipelines', filenames[0] + '.opt'])
+    if os.path.isfile(opt_file):
+        filenames.append(get_spark_filename(read_opt(opt_file)))
+
+    return filenames
+
+
+def setup_abspath(iargs):
+    """Makes sure all paths are absolute.
+    """
+
+    iargs['fmri'] = os.path.abspath(iargs['fmri'])
+    iargs['out_dir'] = os.path.abspath(iargs['out_dir'])
+
+    return iargs
+
+
+def check_iargs_parser(iargs):
+    """[For re-thresholding SPARK] Defines the possible arguments of the program, generates
+    help and usage messages, and issues errors in case of invalid arguments.
+    """
+
+    parser = ArgumentParser(
+        prog='spark.py',
+        description=dedent('''\
+        SParsity-based Analysis of Reliable K-hubness (SPARK) for brain fMRI functional
+        connectivity
+        ____________________________________________________________________________________
+
+           8b    d8 88   88 88     888888 88     888888 88   88 88b 88 88  dP 88 8b    d8
+           88b  d88 88   88 88       88   88     88__   88   88 88Yb88 88odP  88 88b  d88
+           88YbdP88 Y8   8P 88  .o   88   88     88""   Y8   8P 88 Y88 88"Yb  88 88YbdP88
+           88 YY 88 `YbodP' 88ood8   88   88     88     `YbodP' 88  Y8 88  Yb 88 88 YY 88
+           ------------------------------------------------------------------------------
+                              Multimodal Functional Imaging Laboratory
+        ____________________________________________________________________________________
+
+        '''),
+        add_help=False,
+        formatter_class=RawTextHelpFormatter)
+
+    # Required
+    required = parser.add_argument_group(
+        title='  REQUIRED arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    required.add_argument('--RETHRESHOLD',
+                          action='store_true',
+                          required=True,
+                          help='\n____________________________________________________________')
+    required.add_argument('--fmri', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the fMRI data to analyze.
+
+                          Notes:
+                          - This file should be a valid fMRI file of a BIDS dataset.
+                          - The filename will be used to name the outputs, for
+                            example: 'kmap_sub-01_task-rest_bold_p0.01.mat'.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='XXX',
+                          dest='fmri')
+    required.add_argument('--out-dir', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the output directory.
+                          This directory should have been previously populated with
+                          --SETUP and --RUN (at least up to the stage C), and
+                          optionally wrapped-up with --WRAP-UP.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='out_dir')
+    required.add_argument('--p-value', nargs=1, type=float,
+                          required=True,
+                          help=dedent('''\
+                          Significance level, using a Z-test, for removing
+                          inconsistent elements in the average sparse coefficients
+                          (considered as Gaussian noise) after spatial clustering.
+                          The new k-hubness maps are saved next to the original ones.
+
+                          (valid values: 0<=%(metavar)s<=1)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='p_value')
+
+    # Optional
+    optional = parser.add_argument_group(
+        title='  OPTIONAL arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    optional.add_argument('-h', '--help',
+                          action='help',
+                          help=dedent('''\
+                          Shows this help message and exits.
+                          ____________________________________________________________
+                          '''))
+    optional.add_argument('-v', '--verbose',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, the program will provide some additional details.
+
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='verbose')
+
+    oargs = vars(parser.parse_known_args(iargs)[0])
+
+    # Hack: when (nargs=1) a list should not be returned
+    for k in ['fmri', 'out_dir', 'p_value', 'verbose']:
+        if type(oargs[k]) is list:
+            oargs[k] = oargs[k][0]
+
+    return oargs
+
+
+def check_iargs(iargs):
+    """Checks the integrity of the input arguments and returns the options if successful
+    """
+
+    oargs = check_iargs_parser(iargs)
+    oargs = setup_abspath(oargs)
+    oargs['analysis_dir'] = get_analysis_dir(oargs['out_dir'], oargs['fmri'])
+    oargs['kstats_files'] = find_kstats_files(
+        oargs['analysis_dir'], get_filenames(oargs['analysis_dir'], oargs['fmri']))
+    check_iargs_integrity(oargs)
+    return oargs
+
+
+def rethreshold(iargs):
+    """Main function, checks the inputs and re-thresholds the k-hubness maps
+    """
+
+    rethreshold_kmaps(check_iargs(iargs))
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    rethreshold(argv[1:])
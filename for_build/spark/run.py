@@ -16,6 +16,80 @@ from subprocess import run as sp_run
 from sys import argv, stderr
 from sys import exit as sys_exit
 from textwrap import dedent
+from time import monotonic
+
+from spark.pipeline import get_index_file
+
+
+def get_jobs(iargs):
+    """Lists the jobs of the sub-pipeline selected with --jobs-indices or --jobs-patterns
+    """
+
+    from spark.pipeline import load_pipe, select_jobs
+
+    return select_jobs(load_pipe(iargs['pipe_file'])[iargs['stage']],
+                       iargs['jobs_indices'], iargs['jobs_patterns'])
+
+
+def run_cmd(cmd, iargs):
+    """Runs the selected jobs in a single process, or each job in its own process with
+    the fault-isolated runner (--isolated), or with the local scheduler when --parallel
+    is greater than 1 or with --engine python. Returns an exit status.
+    """
+
+    from spark.mcr import runtime_env
+
+    env = runtime_env(iargs['exe'], iargs['verbose'])
+    if iargs['parallel'] <= 1 and iargs['engine'] == 'matlab' and not iargs['isolated']:
+        return sp_run(cmd, shell=True, cwd=iargs['out_dir'], env=env).returncode
+
+    from spark.engine import engine_env, get_cmd, warn_experimental
+
+    jobs = [{
+        'name': job['name'],
+        'stage': iargs['stage'],
+        'cmd': get_cmd(iargs['exe'], iargs['pipe_file'], job, iargs['engine']),
+        'files_in': job['files_in'],
+        'files_out': job['files_out'],
+    } for job in get_jobs(iargs)]
+    if iargs['engine'] == 'python':
+        warn_experimental()
+        env = engine_env(env)
+
+    if iargs['isolated']:
+        from spark.runner import get_log_dir, get_summary_file, run_isolated
+        summary_file = get_summary_file(iargs['pipe_file'], iargs['stage'])
+        failed = run_isolated(jobs, iargs['out_dir'], iargs['parallel'],
+                              get_log_dir(iargs['pipe_file']), summary_file, env=env,
+                              timeout=iargs['timeout'], heartbeat=iargs['heartbeat'],
+                              retries=iargs['retries'], verbose=iargs['verbose'])
+        print('Summary of the jobs:\n' + summary_file, file=stderr)
+        return len(failed)
+
+    from spark.scheduler import get_history_file, run_jobs
+
+    failed = run_jobs(jobs, iargs['out_dir'], iargs['parallel'],
+                      mem_budget=int(iargs['mem_budget'] * 1024 ** 3),
+                      mem_per_job=int(iargs['mem_per_job'] * 1024 ** 3),
+                      history_file=get_history_file(iargs['pipe_file']),
+                      env=env, speculative=iargs['speculative'], verbose=iargs['verbose'])
+
+    return len(failed)
+
+
+def try_persist_kstats(pipe_file):
+    """Persists what is needed to re-threshold the k-hubness maps with --RETHRESHOLD, if
+    NumPy and SciPy are available, the stage C itself not needing them
+    """
+
+    try:
+        from spark.kstats import persist_kstats
+    except ImportError:
+        print('Warning: NumPy and SciPy are required to save the statistics used by ' +
+              '--RETHRESHOLD, they are not saved.', file=stderr)
+        return None
+
+    return persist_kstats(pipe_file)
 
 
 def run_pipe(iargs):
@@ -30,12 +104,25 @@ def run_pipe(iargs):
 
     cmd = '{} run {} {} {}'.format(
         quote(iargs['exe']), quote(iargs['pipe_file']), iargs['stage'], jobs_patterns)
-    p = sp_run(cmd, shell=True, cwd=iargs['out_dir'])
-    if p.returncode != 0:
+    if os.path.isfile(get_index_file(iargs['pipe_file'])):
+        # Only the files of the selected jobs are passed, and loaded
+        cmd = '{} run-jobs {} {}'.format(
+            quote(iargs['exe']), quote(iargs['pipe_file']),
+            ' '.join([quote(job['file']) for job in get_jobs(iargs)]))
+    start = monotonic()
+    returncode = run_cmd(cmd, iargs)
+    if returncode != 0:
         print('\n\nThe process returned a non-zero exit status:\n' +
-              str(p.returncode), file=stderr)
+              str(returncode), file=stderr)
         sys_exit(1)
 
+    if iargs['stage'] == 'C':
+        try_persist_kstats(iargs['pipe_file'])
+
+    # Compared by --COMPARE, e.g. to measure the speedup of --SETUP --reduce
+    from spark.scheduler import add_time, get_times_file
+    add_time(get_times_file(iargs['pipe_file']), iargs['stage'], monotonic() - start)
+
     return None
 
 
@@ -60,6 +147,32 @@ def check_iargs_integrity(iargs):
               'One of the elements is smaller than 1:\n' + str(iargs['jobs_indices']), file=stderr)
         sys_exit(1)
 
+    # Parallel jobs
+    if iargs['parallel'] < 1:
+        print('--parallel\n' +
+              'Number of parallel jobs smaller than 1:\n' + str(iargs['parallel']), file=stderr)
+        sys_exit(1)
+
+    # Fault-isolated runner
+    if iargs['timeout'] < 0 or iargs['heartbeat'] < 0 or iargs['retries'] < 0:
+        print('--timeout, --heartbeat, --retries\n' +
+              'Negative value:\n' +
+              str([iargs['timeout'], iargs['heartbeat'], iargs['retries']]), file=stderr)
+        sys_exit(1)
+
+    # Speculative duplicates
+    if iargs['speculative'] < 0:
+        print('--speculative\n' +
+              'Negative factor:\n' + str(iargs['speculative']), file=stderr)
+        sys_exit(1)
+
+    # Memory
+    if iargs['mem_budget'] < 0 or iargs['mem_per_job'] < 0:
+        print('--mem-budget, --mem-per-job\n' +
+              'Negative amount of memory:\n' +
+              str([iargs['mem_budget'], iargs['mem_per_job']]), file=stderr)
+        sys_exit(1)
+
     return None
 
 
@@ -224,6 +337,162 @@ def check_iargs_parser(iargs):
                           '''),
                           metavar=('X'),
                           dest='jobs_indices')
+    optional.add_argument('--parallel', nargs=1, type=int,
+                          default=1,
+                          help=dedent('''\
+                          Maximum number of jobs run at the same time on this node.
+                          If greater than 1, each job is run in its own process and
+                          a new job is only started while the projected memory usage
+                          stays under --mem-budget. The memory of a job is estimated
+                          from the peak memory measured for the previous jobs of the
+                          same sub-pipeline, or given with --mem-per-job. Jobs killed
+                          by the system for lack of memory are run again with a
+                          lower number of parallel jobs.
+                           
+                          (valid values: %(metavar)s>=1)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='parallel')
+    optional.add_argument('--mem-budget', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          Memory, in GiB, that the parallel jobs can use altogether.
+                          If 0, then 90%% of the memory available when starting
+                          (MemAvailable in /proc/meminfo) is used.
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='mem_budget')
+    optional.add_argument('--mem-per-job', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          Memory, in GiB, needed by a single job. If 0, then it is
+                          estimated from the previous jobs of the same sub-pipeline,
+                          or from the size of its inputs for the first ones.
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='mem_per_job')
+    optional.add_argument('--speculative', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          With parallel jobs, if greater than 0, a job of the
+                          sub-pipeline B running for longer than %(metavar)s times the
+                          median duration of the completed jobs (once half of them
+                          completed) is duplicated. The duplicate writes in a
+                          temporary directory next to the outputs; the first copy
+                          to complete is kept, its outputs moved in place, and the
+                          other one is killed.
+                           
+                          (valid values: %(metavar)s>=0, e.g. 2)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='speculative')
+    optional.add_argument('--isolated',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, each job is run in its own process (at most
+                          --parallel at a time) by a fault-isolated runner: the
+                          output of each job is streamed, with timestamps, to its
+                          own log file in the 'logs' directory of the pipelines, a
+                          failed job does not stop the others, and a summary of the
+                          jobs is written to [pipeline]_[stage].summary.json.
+                          The memory budget and --speculative are not used.
+                           
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='isolated')
+    optional.add_argument('--timeout', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          With --isolated, time in seconds after which a job is
+                          killed. If 0, then there is no limit.
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='timeout')
+    optional.add_argument('--heartbeat', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          With --isolated, time in seconds after which a job that did
+                          not print anything is considered hung, and killed. If 0,
+                          then there is no limit.
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='heartbeat')
+    optional.add_argument('--retries', nargs=1, type=int,
+                          default=0,
+                          help=dedent('''\
+                          With --isolated, number of times a failed, timed out or
+                          hung job is run again, after 30 seconds, then 60, 120...
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='retries')
+    optional.add_argument('--engine', nargs=1, type=str,
+                          choices=['matlab', 'python'],
+                          default='matlab',
+                          help=dedent('''\
+                          Engine running the jobs. With 'python' (EXPERIMENTAL), the
+                          jobs that have a NumPy/SciPy engine are run with it, in
+                          their own process, and the others with the standalone
+                          application. The Python engines are not equivalent to the
+                          published method: the sparse coding uses a fixed number of
+                          atoms per voxel instead of estimating it voxel by voxel,
+                          and the network scale is selected with a description
+                          length of their own, unless both are set with --SETUP
+                          --sparsity-level and --network-scale (then also used by
+                          the standalone application). They were not validated
+                          against the standalone application, do not use them for
+                          results before comparing both engines with --COMPARE.
+                          Jobs with a Python engine:
+                          - B: 'kmdl_boot' (sparse dictionary learning, the sparse
+                            coding being run in parallel over blocks of voxels).
+                          - C: 'kmdl_Gx' (global dictionary spatial clustering),
+                            'nkmap' (k-hubness map generation). The outputs of the
+                            Python 'kmdl_Gx' are only read by the Python 'nkmap',
+                            the standalone application refusing them: run all the
+                            jobs of the stage C with the same engine.
+                            The Python 'nkmap' saves the k-hubness map as a row over
+                            the voxels of the mask ('kmap', 'pvalue', 'zcritical').
+                            --GROUP, --RETHRESHOLD and --WRAP-UP --export read maps
+                            laid out as rows, columns or volumes.
+                           
+                          (valid values: %(choices)s)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='X',
+                          dest='engine')
     optional.add_argument('-v', '--verbose',
                           action='store_true',
                           help=dedent('''\
@@ -237,7 +506,9 @@ def check_iargs_parser(iargs):
     oargs = vars(parser.parse_known_args(iargs)[0])
 
     # Hack: when (nargs=1) a list should not be returned
-    for k in ['exe', 'stage', 'fmri', 'out_dir', 'verbose']:
+    for k in ['exe', 'stage', 'fmri', 'out_dir', 'parallel', 'mem_budget', 'mem_per_job',
+              'speculative', 'isolated', 'timeout', 'heartbeat', 'retries', 'engine',
+              'verbose']:
         if type(oargs[k]) is list:
             oargs[k] = oargs[k][0]
 
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Runs all the SPARK sub-pipelines on a single node, each job starting as soon as the
+# jobs producing its inputs completed
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser, RawTextHelpFormatter
+import os
+from sys import argv, stderr
+from sys import exit as sys_exit
+from textwrap import dedent
+from time import monotonic
+
+from spark.engine import engine_env, get_cmd, warn_experimental
+from spark.pipeline import build_dependencies, load_pipe
+from spark.run import get_pipe_file, try_persist_kstats
+from spark.scheduler import add_time, get_history_file, get_times_file, run_jobs
+
+
+def run_all(iargs):
+    """Runs the jobs of all sub-pipelines following their actual dependencies, instead
+    of waiting for a whole sub-pipeline to complete before starting the next one
+    """
+
+    from spark.mcr import runtime_env
+
+    start = monotonic()
+    jobs = load_pipe(iargs['pipe_file'])
+    deps = build_dependencies(jobs)
+    env = runtime_env(iargs['exe'], iargs['verbose'])
+    if iargs['engine'] == 'python':
+        warn_experimental()
+        env = engine_env(env)
+
+    failed = run_jobs([{
+        'name': job['name'],
+        'stage': stage,
+        'deps': deps[job['name']],
+        'cmd': get_cmd(iargs['exe'], iargs['pipe_file'], job, iargs['engine']),
+        'files_in': job['files_in'],
+        'files_out': job['files_out'],
+    } for stage in jobs for job in jobs[stage]],
+        iargs['out_dir'], iargs['parallel'],
+        mem_budget=int(iargs['mem_budget'] * 1024 ** 3),
+        mem_per_job=int(iargs['mem_per_job'] * 1024 ** 3),
+        history_file=get_history_file(iargs['pipe_file']),
+        env=env,
+        speculative=iargs['speculative'],
+        verbose=iargs['verbose'])
+
+    if failed:
+        print('\n\nThe following jobs did not complete:\n' + '\n'.join(failed), file=stderr)
+        sys_exit(1)
+
+    try_persist_kstats(iargs['pipe_file'])
+
+    # Compared by --COMPARE, e.g. to measure the speedup of --SETUP --reduce
+    add_time(get_times_file(iargs['pipe_file']), 'all', monotonic() - start)
+
+    return None
+
+
+def check_iargs_integrity(iargs):
+    """Integrity of the input arguments
+    """
+
+    # MATLAB executable
+    if not os.path.isfile(iargs['exe']):
+        print('--exe\n' +
+              'Invalid or nonexistent file:\n' + iargs['exe'], file=stderr)
+        sys_exit(1)
+
+    # Pipeline
+    if not os.path.isfile(iargs['pipe_file']):
+        print('Pipeline file not found:\n' + iargs['pipe_file'], file=stderr)
+        sys_exit(1)
+
+    # Parallel jobs
+    if iargs['parallel'] < 1:
+        print('--parallel\n' +
+              'Number of parallel jobs smaller than 1:\n' + str(iargs['parallel']), file=stderr)
+        sys_exit(1)
+
+    # Speculative duplicates
+    if iargs['speculative'] < 0:
+        print('--speculative\n' +
+              'Negative factor:\n' + str(iargs['speculative']), file=stderr)
+        sys_exit(1)
+
+    # Memory
+    if iargs['mem_budget'] < 0 or iargs['mem_per_job'] < 0:
+        print('--mem-budget, --mem-per-job\n' +
+              'Negative amount of memory:\n' +
+              str([iargs['mem_budget'], iargs['mem_per_job']]), file=stderr)
+        sys_exit(1)
+
+    return None
+
+
+def setup_abspath(iargs):
+    """Makes sure all paths are absolute.
+    """
+
+    iargs['fmri'] = os.path.abspath(iargs['fmri'])
+    iargs['out_dir'] = os.path.abspath(iargs['out_dir'])
+    iargs['exe'] = os.path.abspath(iargs['exe'])
+
+    return iargs
+
+
+def check_iargs_parser(iargs):
+    """[For running all SPARK sub-pipelines] Defines the possible arguments of the
+    program, generates help and usage messages, and issues errors in case of invalid
+    arguments.
+    """
+
+    parser = ArgumentParser(
+        prog='spark.py',
+        description=dedent('''\
+        SParsity-based Analysis of Reliable K-hubness (SPARK) for brain fMRI functional
+        connectivity
+        ____________________________________________________________________________________
+
+           8b    d8 88   88 88     888888 88     888888 88   88 88b 88 88  dP 88 8b    d8
+           88b  d88 88   88 88       88   88     88__   88   88 88Yb88 88odP  88 88b  d88
+           88YbdP88 Y8   8P 88  .o   88   88     88""   Y8   8P 88 Y88 88"Yb  88 88YbdP88
+           88 YY 88 `YbodP' 88ood8   88   88     88     `YbodP' 88  Y8 88  Yb 88 88 YY 88
+           ------------------------------------------------------------------------------
+                              Multimodal Functional Imaging Laboratory
+        ____________________________________________________________________________________
+
+        '''),
+        add_help=False,
+        formatter_class=RawTextHelpFormatter)
+
+    # Required
+    required = parser.add_argument_group(
+        title='  REQUIRED arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    required.add_argument('--RUN-ALL',
+                          action='store_true',
+                          required=True,
+                          help='\n____________________________________________________________')
+    required.add_argument('--exe', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the MATLAB generated
+                          standalone application.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='XXX',
+                          dest='exe')
+    required.add_argument('--fmri', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the fMRI data to analyze.
+
+                          Notes:
+                          - This file should be a valid fMRI file of a BIDS dataset.
+                          - The filename will be used to name the outputs, for
+                            example: 'kmap_sub-01_task-rest_bold.mat'.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='XXX',
+                          dest='fmri')
+    required.add_argument('--out-dir', nargs=1, type=str,
+                          required=True,
+                          help=dedent('''\
+                          Path (absolute or relative) to the output directory (old
+                          files might get replaced).
+                          This directory should have been previously set up with
+                          --SETUP and at least contain the pipeline '.mat' file
+                          corresponding to the input --fmri.
+
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='out_dir')
+
+    # Optional
+    optional = parser.add_argument_group(
+        title='  OPTIONAL arguments',
+        description=dedent('''\
+        __________________________________________________________________________________
+        '''))
+    optional.add_argument('-h', '--help',
+                          action='help',
+                          help=dedent('''\
+                          Shows this help message and exits.
+                          ____________________________________________________________
+                          '''))
+    optional.add_argument('--parallel', nargs=1, type=int,
+                          default=os.cpu_count() or 1,
+                          help=dedent('''\
+                          Maximum number of jobs run at the same time on this node.
+                          A job is started as soon as the jobs producing its inputs
+                          completed, and while the projected memory usage stays
+                          under --mem-budget.
+
+                          (valid values: %(metavar)s>=1)
+                          (default: number of CPUs)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='parallel')
+    optional.add_argument('--mem-budget', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          Memory, in GiB, that the parallel jobs can use altogether.
+                          If 0, then 90%% of the memory available when starting
+                          (MemAvailable in /proc/meminfo) is used.
+
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='mem_budget')
+    optional.add_argument('--mem-per-job', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          Memory, in GiB, needed by a single job. If 0, then it is
+                          estimated from the previous jobs of the same sub-pipeline,
+                          or from the size of its inputs for the first ones.
+
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='mem_per_job')
+    optional.add_argument('--speculative', nargs=1, type=float,
+                          default=0,
+                          help=dedent('''\
+                          With parallel jobs, if greater than 0, a job of the
+                          sub-pipeline B running for longer than %(metavar)s times the
+                          median duration of the completed jobs (once half of them
+                          completed) is duplicated. The duplicate writes in a
+                          temporary directory next to the outputs; the first copy
+                          to complete is kept, its outputs moved in place, and the
+                          other one is killed.
+
+                          (valid values: %(metavar)s>=0, e.g. 2)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='speculative')
+    optional.add_argument('--engine', nargs=1, type=str,
+                          choices=['matlab', 'python'],
+                          default='matlab',
+                          help=dedent('''\
+                          Engine running the jobs. With 'python' (EXPERIMENTAL, not
+                          equivalent to the published method), the jobs that have a
+                          NumPy/SciPy engine are run with it, and the others with
+                          the standalone application. See --RUN --help.
+
+                          (valid values: %(choices)s)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='X',
+                          dest='engine')
+    optional.add_argument('-v', '--verbose',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, the program will provide some additional details.
+
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='verbose')
+
+    oargs = vars(parser.parse_known_args(iargs)[0])
+
+    # Hack: when (nargs=1) a list should not be returned
+    for k in ['exe', 'fmri', 'out_dir', 'parallel', 'mem_budget', 'mem_per_job', 'speculative',
+              'engine', 'verbose']:
+        if type(oargs[k]) is list:
+            oargs[k] = oargs[k][0]
+
+    return oargs
+
+
+def check_iargs(iargs):
+    """Checks the integrity of the input arguments and returns the options if successful
+    """
+
+    oargs = check_iargs_parser(iargs)
+    oargs = setup_abspath(oargs)
+    oargs['pipe_file'] = get_pipe_file(oargs['out_dir'], oargs['fmri'])
+    check_iargs_integrity(oargs)
+    return oargs
+
+
+def runall(iargs):
+    """Main function, checks the inputs and runs all SPARK sub-pipelines
+    """
+
+    run_all(check_iargs(iargs))
+
+    return sys_exit(0)
+
+
+# Main
+if __name__ == "__main__":
+    runall(argv[1:])
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Fault-isolated runner of SPARK jobs: each job in its own process, its output streamed
+# to its own log file, with timeouts, heartbeat detection and retries
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import asyncio
+from datetime import datetime
+import json
+import os
+from signal import SIGKILL
+from sys import stderr
+from time import monotonic
+
+
+# Interval between two checks of the timeouts (seconds)
+WATCH_INTERVAL = 1.0
+
+# Wait before the first retry of a job, doubled at each retry (seconds)
+BACKOFF = 30
+
+# Longest line written to the log of a job (bytes), longer lines being split
+LINE_LIMIT = 1024 ** 2
+
+# Size of the blocks read from the output of a job (bytes)
+READ_SIZE = 64 * 1024
+
+
+def get_log_dir(pipe_file):
+    """Builds the path of the directory holding the logs of the jobs
+    """
+
+    return os.sep.join([os.path.dirname(pipe_file), 'logs'])
+
+
+def get_summary_file(pipe_file, stage):
+    """Builds the path of the summary of the jobs of a sub-pipeline
+    """
+
+    return os.path.splitext(pipe_file)[0] + '_' + stage + '.summary.json'
+
+
+def timestamp():
+    """Current local time, to the millisecond
+    """
+
+    return datetime.now().isoformat(timespec='milliseconds')
+
+
+def write_line(log, tag, line):
+    """Writes a line of the output of a job to its log file, with a timestamp
+    """
+
+    log.write(timestamp() + ' [' + tag + '] ' +
+              line.decode('utf-8', 'replace').rstrip('\r') + '\n')
+
+    return None
+
+
+async def stream(pipe, log, tag, state):
+    """Copies the lines of a pipe of a job to its log file, with a timestamp, and
+    records the time of the last output for the heartbeat detection. The pipe is read
+    by blocks, so that lines of any length are read, those longer than LINE_LIMIT being
+    split.
+    """
+
+    pending = b''
+    while True:
+        block = await pipe.read(READ_SIZE)
+        if not block:
+            break
+        state['last_output'] = monotonic()
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop()
+        while len(pending) >= LINE_LIMIT:
+            lines.append(pending[:LINE_LIMIT])
+            pending = pending[LINE_LIMIT:]
+        for line in lines:
+            write_line(log, tag, line)
+        log.flush()
+    if pending:
+        write_line(log, tag, pending)
+        log.flush()
+
+    return None
+
+
+async def attempt(job, cwd, env, log_file, timeout, heartbeat):
+    """Runs a job once. Returns its status ('success', 'failed', 'timeout' or 'hung')
+    and its exit code.
+    """
+
+    with open(log_file, 'a') as log:
+        log.write(timestamp() + ' [spark] ' + ' '.join(job['cmd']) + '\n')
+        log.flush()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *job['cmd'], cwd=cwd, env=env, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE, start_new_session=True)
+        except (OSError, ValueError) as e:
+            log.write(timestamp() + ' [spark] failed to start: ' + str(e) + '\n')
+            return 'failed', None
+        state = {'start': monotonic(), 'last_output': monotonic()}
+        readers = asyncio.gather(stream(proc.stdout, log, 'out', state),
+                                 stream(proc.stderr, log, 'err', state))
+
+        status = None
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(proc.wait()), WATCH_INTERVAL)
+                break
+            except asyncio.TimeoutError:
+                now = monotonic()
+                if timeout and now - state['start'] > timeout:
+                    status = 'timeout'
+                elif heartbeat and now - state['last_output'] > heartbeat:
+                    status = 'hung'
+                if status is not None:
+                    # The whole process group, the runtime possibly having children
+                    try:
+                        os.killpg(proc.pid, SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                    await proc.wait()
+                    break
+
+        await readers
+        if status is None:
+            status = 'success' if proc.returncode == 0 else 'failed'
+        log.write(timestamp() + ' [spark] ' + status + ' (exit status: ' +
+                  str(proc.returncode) + ')\n')
+
+    return status, proc.returncode
+
+
+async def run_job(job, cwd, env, log_dir, timeout, heartbeat, retries, backoff, slots,
+                  summary, verbose):
+    """Runs a job until it succeeds or all its attempts failed, waiting longer and longer
+    between two attempts
+    """
+
+    log_file = os.sep.join([log_dir, job['name'] + '.log'])
+    entry = summary[job['name']] = {'status': 'pending', 'attempts': 0, 'log': log_file}
+
+    for k in range(retries + 1):
+        if k:
+            await asyncio.sleep(backoff * 2 ** (k - 1))
+        async with slots:
+            if verbose:
+                print('Starting ' + job['name'] + ' (attempt ' + str(k + 1) + ')', file=stderr)
+            start = monotonic()
+            try:
+                status, returncode = await attempt(job, cwd, env, log_file, timeout, heartbeat)
+            except (OSError, ValueError) as e:
+                # A failure of the runner itself for this job, the others carrying on
+                print('The job ' + job['name'] + ' could not be run:\n' + str(e), file=stderr)
+                (status, returncode) = ('failed', None)
+        entry.update(status=status, attempts=k + 1, returncode=returncode,
+                     duration=round(monotonic() - start, 3))
+        if status == 'success':
+            break
+        print('The job ' + job['name'] + ' ended with status ' + status + ' (attempt ' +
+              str(k + 1) + ' of ' + str(retries + 1) + '), see:\n' + log_file, file=stderr)
+
+    return None
+
+
+async def run_all(jobs, cwd, max_jobs, env, log_dir, timeout, heartbeat, retries, backoff,
+                  verbose):
+    """Runs all jobs, at most max_jobs at a time
+    """
+
+    slots = asyncio.Semaphore(max(1, max_jobs))
+    summary = {}
+    await asyncio.gather(*[run_job(job, cwd, env, log_dir, timeout, heartbeat, retries,
+                                   backoff, slots, summary, verbose) for job in jobs])
+
+    return summary
+
+
+def run_isolated(jobs, cwd, max_jobs, log_dir, summary_file, env=None, timeout=0,
+                 heartbeat=0, retries=0, backoff=BACKOFF, verbose=False):
+    """Runs jobs ({'name', 'cmd'}), each in its own process, at most max_jobs at a time.
+    A job is killed when running longer than timeout seconds, or when silent for longer
+    than heartbeat seconds (0: no limit), and run again up to retries times, after
+    backoff seconds doubled at each attempt. The failure of a job does not stop the
+    others. Writes a JSON summary and returns the names of the failed jobs.
+    """
+
+    os.makedirs(log_dir, exist_ok=True)
+    start = timestamp()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        summary = loop.run_until_complete(
+            run_all(jobs, cwd, max_jobs, env, log_dir, timeout, heartbeat, retries, backoff,
+                    verbose))
+    finally:
+        loop.close()
+
+    failed = [job['name'] for job in jobs if summary[job['name']]['status'] != 'success']
+    with open(summary_file, 'w', newline='\n') as file:
+        json.dump({
+            'start': start,
+            'end': timestamp(),
+            'nb_success': len(jobs) - len(failed),
+            'nb_failed': len(failed),
+            'failed': failed,
+            'jobs': summary,
+        }, file, indent=1, sort_keys=True)
+
+    return failed
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Local scheduler running SPARK jobs concurrently, within a memory budget
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from fcntl import LOCK_EX, LOCK_UN, flock
+import json
+import os
+from shutil import rmtree
+from signal import SIGKILL
+from statistics import median
+from subprocess import Popen
+from sys import stderr
+from time import monotonic, sleep
+
+
+# Memory assumed for a job when no earlier job of its sub-pipeline was measured and
+# the size of its inputs is unknown (bytes)
+DEFAULT_JOB_MEMORY = 8 * 1024 ** 3
+
+# Before any measurement, memory of a job estimated from its inputs: a fixed part for the
+# process, plus a multiple of the size of the inputs (decompressed, and their copies
+# while computing)
+BASE_JOB_MEMORY = 512 * 1024 ** 2
+INPUT_MEMORY_FACTOR = 4
+
+# Fraction of the available memory used by default as budget
+DEFAULT_BUDGET_FRACTION = 0.9
+
+# Number of times a job killed by the kernel (out of memory) is run again
+MAX_OOM_RETRIES = 2
+
+# Sub-pipelines whose straggling jobs can be duplicated, see run_jobs(speculative=...)
+SPECULATIVE_STAGES = ('B',)
+
+# Interval between two checks for stragglers (seconds)
+POLL_INTERVAL = 1.0
+
+# Interval between two checks for completed jobs (seconds)
+WAIT_INTERVAL = 0.05
+
+
+def read_meminfo():
+    """Reads the memory information of the node (bytes)
+    """
+
+    meminfo = {}
+    with open('/proc/meminfo', 'r') as file:
+        for line in file:
+            tokens = line.split()
+            if len(tokens) >= 2:
+                meminfo[tokens[0].rstrip(':')] = int(tokens[1]) * 1024
+
+    return meminfo
+
+
+def available_memory():
+    """Memory that can be used by new processes without swapping (bytes)
+    """
+
+    meminfo = read_meminfo()
+    return meminfo.get('MemAvailable', meminfo.get('MemFree', 0))
+
+
+def get_history_file(pipe_file):
+    """Builds the path of the file recording the peak memory of the jobs
+    """
+
+    return os.path.splitext(pipe_file)[0] + '.rss.json'
+
+
+def read_history(history_file):
+    """Reads the peak memory (bytes) measured for the jobs of each sub-pipeline
+    """
+
+    try:
+        with open(history_file, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_history(history_file, stage, name, peak):
+    """Records the peak memory (bytes) of a job, other processes possibly doing the same
+    """
+
+    with open(history_file + '.lock', 'a') as lock:
+        flock(lock, LOCK_EX)
+        try:
+            history = read_history(history_file)
+            history.setdefault(stage, {})[name] = peak
+            with open(history_file + '.tmp', 'w') as file:
+                json.dump(history, file, indent=1, sort_keys=True)
+            os.replace(history_file + '.tmp', history_file)
+        finally:
+            flock(lock, LOCK_UN)
+
+    return None
+
+
+def get_times_file(pipe_file):
+    """Builds the path of the file recording the run time of each sub-pipeline
+    """
+
+    return os.path.splitext(pipe_file)[0] + '.times.json'
+
+
+def add_time(times_file, stage, seconds):
+    """Adds the wall time (seconds) of a run to the total of its sub-pipeline ('all' for
+    --RUN-ALL), the jobs of a sub-pipeline possibly being split between several runs
+    """
+
+    with open(times_file + '.lock', 'a') as lock:
+        flock(lock, LOCK_EX)
+        try:
+            times = read_history(times_file)
+            times[stage] = times.get(stage, 0) + round(seconds, 3)
+            with open(times_file + '.tmp', 'w') as file:
+                json.dump(times, file, indent=1, sort_keys=True)
+            os.replace(times_file + '.tmp', times_file)
+        finally:
+            flock(lock, LOCK_UN)
+
+    return None
+
+
+def inputs_size(files_in):
+    """Total size of the existing inputs of a job (bytes), 0 if none is found
+    """
+
+    return sum([os.path.getsize(f) for f in files_in if os.path.isfile(f)])
+
+
+def estimate_memory(history, stage, mem_per_job, files_in=()):
+    """Estimates the memory needed by a job from the largest peak measured among the
+    jobs of the same sub-pipeline, or from --mem-per-job when given, or from the size of
+    its inputs before any measurement
+    """
+
+    if mem_per_job:
+        return mem_per_job
+
+    peaks = list(history.get(stage, {}).values())
+    if peaks:
+        return int(max(peaks) * 1.1)
+
+    size = inputs_size(files_in)
+    return BASE_JOB_MEMORY + INPUT_MEMORY_FACTOR * size if size else DEFAULT_JOB_MEMORY
+
+
+def wait_any(pids, timeout):
+    """Waits for one of the given child processes to exit, for at most timeout seconds,
+    other children of the process being left alone. Returns its pid, wait status and
+    resource usage, the pid being 0 if none exited.
+    """
+
+    deadline = monotonic() + timeout
+    while True:
+        for pid in pids:
+            (done, status, rusage) = os.wait4(pid, os.WNOHANG)
+            if done:
+                return done, status, rusage
+        if monotonic() >= deadline:
+            return 0, 0, None
+        sleep(WAIT_INTERVAL)
+
+
+def exit_code(status):
+    """Converts a wait status to an exit code, negative when killed by a signal
+    """
+
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+
+def oom_killed(status):
+    """Whether a process was killed with SIGKILL, as done by the out-of-memory killer
+    """
+
+    return os.WIFSIGNALED(status) and os.WTERMSIG(status) == SIGKILL
+
+
+def get_speculative_dir(job):
+    """Directory where the duplicate of a job writes its outputs, next to the declared
+    ones so that they can be moved atomically
+    """
+
+    return os.sep.join([os.path.dirname(job['files_out'][0]), '.speculative-' + job['name']])
+
+
+def promote_outputs(job):
+    """Moves the outputs of the duplicate of a job to the declared outputs. Returns
+    whether all of them were found.
+    """
+
+    for f in job['files_out']:
+        src = os.sep.join([job['spec_dir'], os.path.basename(f)])
+        if not os.path.isfile(src):
+            return False
+        os.replace(src, f)
+
+    return True
+
+
+def find_straggler(running, durations, nb_jobs, speculative):
+    """Finds a running job of a speculative sub-pipeline, not duplicated yet, running for
+    longer than speculative times the median duration of its completed peers, once
+    half of them completed
+    """
+
+    now = monotonic()
+    for job in running.values():
+        stage = job['stage']
+        if stage not in SPECULATIVE_STAGES or job.get('speculated') or \
+                not job.get('files_out') or \
+                len(durations.get(stage, [])) < max(2, nb_jobs[stage] / 2):
+            continue
+        if now - job['start'] > speculative * median(durations[stage]):
+            return job
+
+    return None
+
+
+def run_jobs(jobs, cwd, max_jobs, mem_budget=0, mem_per_job=0, history_file='', env=None,
+             speculative=0, verbose=False):
+    """Runs jobs ({'name', 'stage', 'cmd'} and optionally 'deps', the names of the jobs
+    they depend on, 'files_in' and 'files_out'), at most max_jobs at a time, admitting a new job
+    only once its dependencies completed and while the projected memory usage stays
+    under the budget. Jobs killed by the out-of-memory killer are run again with a lower
+    concurrency.
+    If speculative is greater than 0, a job of SPECULATIVE_STAGES running for longer than
+    speculative times the median duration of its completed peers is duplicated, the
+    duplicate writing its outputs in a temporary directory ($SPARK_OUTPUT_DIR): the
+    first of the two to complete is kept, its outputs moved to the declared ones, and
+    the other is killed.
+    Returns the names of the failed jobs, including those whose dependencies failed.
+    """
+
+    if not mem_budget:
+        mem_budget = int(available_memory() * DEFAULT_BUDGET_FRACTION)
+
+    history = read_history(history_file) if history_file else {}
+    pending = [dict(job, retries=0, deps=set(job.get('deps', []))) for job in jobs]
+    running = {}
+    done = set()
+    failed = []
+    concurrency = max(1, max_jobs)
+    durations = {}
+    nb_jobs = {}
+    for job in jobs:
+        nb_jobs[job['stage']] = nb_jobs.get(job['stage'], 0) + 1
+
+    while pending or running:
+        # Jobs that will never be able to run
+        for job in [j for j in pending if j['deps'] & set(failed)]:
+            print('The job ' + job['name'] + ' is skipped, one of its dependencies failed.',
+                  file=stderr)
+            pending.remove(job)
+            failed.append(job['name'])
+
+        # Admission
+        for job in [j for j in pending if j['deps'] <= done]:
+            if len(running) >= concurrency:
+                break
+            estimate = max(job.get('estimate', 0),
+                           estimate_memory(history, job['stage'], mem_per_job,
+                                           job.get('files_in', [])))
+            projected = sum([j['estimate'] for j in running.values()]) + estimate
+            if running and (projected > mem_budget or estimate > available_memory()):
+                break
+            job['estimate'] = estimate
+            if verbose:
+                print('Starting ' + job['name'] + ' (estimated memory: ' +
+                      str(estimate // 1024 ** 2) + ' MiB, running: ' + str(len(running)) + ')',
+                      file=stderr)
+            pending.remove(job)
+            job['start'] = monotonic()
+            job['proc'] = Popen(job['cmd'], cwd=cwd, env=env)
+            running[job['proc'].pid] = job
+
+        # Speculative duplicate of a straggler, in a free slot
+        straggler = None
+        if speculative and len(running) < concurrency:
+            straggler = find_straggler(running, durations, nb_jobs, speculative)
+        projected = sum([j['estimate'] for j in running.values()])
+        if straggler is not None and projected + straggler['estimate'] <= mem_budget:
+            straggler['speculated'] = True
+            twin = dict(straggler, spec_dir=get_speculative_dir(straggler), start=monotonic())
+            rmtree(twin['spec_dir'], ignore_errors=True)
+            os.makedirs(twin['spec_dir'])
+            print('The job ' + straggler['name'] + ' is straggling, running a duplicate in:\n' +
+                  twin['spec_dir'], file=stderr)
+            twin['proc'] = Popen(twin['cmd'], cwd=cwd, env=dict(
+                os.environ if env is None else env, SPARK_OUTPUT_DIR=twin['spec_dir']))
+            straggler['partner'] = twin
+            twin['partner'] = straggler
+            running[twin['proc'].pid] = twin
+
+        if not running:
+            for job in pending:
+                print('The job ' + job['name'] + ' is skipped, its dependencies cannot be ' +
+                      'satisfied.', file=stderr)
+                failed.append(job['name'])
+            break
+
+        # Completion, of the jobs of the scheduler only
+        pid, status, rusage = wait_any(list(running), POLL_INTERVAL)
+        if pid == 0:
+            continue
+        job = running.pop(pid)
+        job['proc'].returncode = exit_code(status)
+        peak = rusage.ru_maxrss * 1024
+        success = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+        partner = job.pop('partner', None)
+        if partner is not None and partner['proc'].pid in running:
+            partner.pop('partner', None)
+            if not success:
+                # The other copy of the job carries on
+                if 'spec_dir' in job:
+                    rmtree(job['spec_dir'], ignore_errors=True)
+                continue
+            running.pop(partner['proc'].pid)
+            partner['proc'].kill()
+            partner['proc'].wait()
+            if 'spec_dir' in partner:
+                rmtree(partner['spec_dir'], ignore_errors=True)
+            if verbose:
+                print('The ' + ('duplicate' if 'spec_dir' in job else 'original') +
+                      ' of the job ' + job['name'] + ' completed first.', file=stderr)
+
+        if 'spec_dir' in job:
+            if success and not promote_outputs(job):
+                print('The duplicate of the job ' + job['name'] + ' did not write all the ' +
+                      'outputs in:\n' + job['spec_dir'], file=stderr)
+                success = False
+            rmtree(job.pop('spec_dir'), ignore_errors=True)
+
+        if success:
+            if history_file:
+                update_history(history_file, job['stage'], job['name'], peak)
+            history.setdefault(job['stage'], {})[job['name']] = peak
+            durations.setdefault(job['stage'], []).append(monotonic() - job['start'])
+            done.add(job['name'])
+        elif oom_killed(status) and job['retries'] < MAX_OOM_RETRIES:
+            concurrency = max(1, concurrency // 2)
+            job['retries'] += 1
+            job['estimate'] = max(job['estimate'], peak) * 2
+            print('The job ' + job['name'] + ' was killed, probably out of memory. ' +
+                  'Running it again with at most ' + str(concurrency) + ' concurrent jobs.',
+                  file=stderr)
+            pending.insert(0, job)
+        else:
+            print('The job ' + job['name'] + ' failed with exit status:\n' +
+                  str(exit_code(status)), file=stderr)
+            failed.append(job['name'])
+
+    return failed
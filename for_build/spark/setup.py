@@ -9,7 +9,6 @@
 
 
 from argparse import ArgumentParser, RawTextHelpFormatter
-from bids_validator import BIDSValidator
 from errno import EEXIST
 import os
 from re import sub
@@ -49,6 +48,19 @@ def setup_pipes(iargs):
     pipes_dir = os.sep.join([out_dir, 'pipelines'])
     make_dirs(pipes_dir)
 
+    if iargs['input_cache']:
+        from spark.inputs import cache_inputs
+        inputs = cache_inputs(pipes_dir, {'fmri': iargs['fmri'][4], 'mask': iargs['mask']},
+                              int(os.environ.get('SPARK_THREADS', '1')), iargs['verbose'])
+        iargs['fmri'][4] = inputs['fmri']
+        iargs['mask'] = inputs['mask']
+
+    if iargs['reduce']:
+        from spark.reduce import parse_reduce, reduce_inputs
+        (iargs['fmri'][4], iargs['mask']) = reduce_inputs(
+            pipes_dir, iargs['fmri'][4], iargs['mask'], *parse_reduce(iargs['reduce']),
+            verbose=iargs['verbose'])
+
     pipe_opt = os.sep.join([pipes_dir, iargs['fmri'][0] + '.opt'])
     with open(pipe_opt, 'w', newline='\n') as file:
         file.write(
@@ -58,13 +70,18 @@ def setup_pipes(iargs):
             'mask ' + iargs['mask'] + '\n' +
             'nb_resamplings ' + str(iargs['nb_resamplings']) + '\n' +
             'network_scales ' + ' '.join([str(x) for x in iargs['network_scales']]) + '\n' +
+            'network_scale ' + str(iargs['network_scale']) + '\n' +
+            'sparsity_level ' + str(iargs['sparsity_level']) + '\n' +
             'nb_iterations ' + str(iargs['nb_iterations']) + '\n' +
+            'checkpoint_interval ' + str(iargs['checkpoint_interval']) + '\n' +
             'p_value ' + str(iargs['p_value']) + '\n' +
             'resampling_method ' + iargs['resampling_method'] + '\n' +
             'block_window_length ' + ' '.join([str(x) for x in iargs['block_window_length']]) + '\n' +
             'dict_init_method ' + iargs['dict_init_method'] + '\n' +
             'sparse_coding_method ' + iargs['sparse_coding_method'] + '\n' +
             'preserve_dc_atom ' + str(int(iargs['preserve_dc_atom'])) + '\n' +
+            'precision ' + iargs['precision'] + '\n' +
+            'reduce ' + (iargs['reduce'] or 'none') + '\n' +
             'verbose ' + str(int(iargs['verbose'])) + '\n'
         )
 
@@ -73,8 +90,10 @@ def setup_pipes(iargs):
               pipe_opt, file=stderr)
         sys_exit(1)
 
+    from spark.mcr import runtime_env
+
     cmd = '{} setup {}'.format(quote(iargs['exe']), quote(pipe_opt))
-    p = sp_run(cmd, shell=True, cwd=pipes_dir)
+    p = sp_run(cmd, shell=True, cwd=pipes_dir, env=runtime_env(iargs['exe'], iargs['verbose']))
     if p.returncode != 0:
         print('\n\nThe process returned a non-zero exit status:\n' +
               str(p.returncode), file=stderr)
@@ -87,6 +106,8 @@ def setup_fmri(fmri):
     """Builds the format subject/session/run from the provided BIDS-data
     """
 
+    from bids_validator import BIDSValidator
+
     filename = os.path.basename(fmri)
     tokens = filename.split('_')
 
@@ -134,11 +155,31 @@ def check_iargs_integrity(iargs):
         print('--mask\n' +
               'Invalid or nonexistent file:\n' + iargs['mask'], file=stderr)
         sys_exit(1)
-    elif not (iargs['mask'].endswith('.mnc') or iargs['mask'].endswith('.nii')):
+    elif (iargs['input_cache'] or iargs['reduce']) and \
+            not iargs['mask'].endswith(('.mnc', '.nii', '.mnc.gz', '.nii.gz')):
+        print('--mask\n' +
+              'File is not MINC (.mnc[.gz]) or NIfTI (.nii[.gz]):\n' + iargs['mask'], file=stderr)
+        sys_exit(1)
+    elif not (iargs['input_cache'] or iargs['reduce']) and \
+            not iargs['mask'].endswith(('.mnc', '.nii')):
+        # Read as is by the standalone application
         print('--mask\n' +
               'File is not MINC (.mnc) or NIfTI (.nii):\n' + iargs['mask'], file=stderr)
         sys_exit(1)
 
+    # Data reduction
+    if iargs['reduce']:
+        from spark.reduce import parse_reduce
+        reduce = parse_reduce(iargs['reduce'])
+        if reduce is None:
+            print('--reduce\n' +
+                  'Neither parcels:ATLAS nor downsample:F with F>=2:\n' + iargs['reduce'], file=stderr)
+            sys_exit(1)
+        elif reduce[0] == 'parcels' and not os.path.isfile(reduce[1]):
+            print('--reduce\n' +
+                  'Invalid or nonexistent atlas:\n' + reduce[1], file=stderr)
+            sys_exit(1)
+
     # Number of resamplings
     if iargs['nb_resamplings'] < 2:
         print('--nb-resamplings\n' +
@@ -155,12 +196,30 @@ def check_iargs_integrity(iargs):
               '[begin] is greather than [end]:\n' + str(iargs['network_scales']), file=stderr)
         sys_exit(1)
 
+    # Network scale
+    if iargs['network_scale'] < 0:
+        print('--network-scale\n' +
+              'Network scale smaller than 0:\n' + str(iargs['network_scale']), file=stderr)
+        sys_exit(1)
+
+    # Sparsity level
+    if iargs['sparsity_level'] < 0:
+        print('--sparsity-level\n' +
+              'Sparsity level smaller than 0:\n' + str(iargs['sparsity_level']), file=stderr)
+        sys_exit(1)
+
     # Number of iterations
     if iargs['nb_iterations'] < 2:
         print('--nb-iterations\n' +
               'Number of iterations smaller than 2:\n' + str(iargs['nb_iterations']), file=stderr)
         sys_exit(1)
 
+    # Checkpoint interval
+    if iargs['checkpoint_interval'] < 0:
+        print('--checkpoint-interval\n' +
+              'Number of iterations smaller than 0:\n' + str(iargs['checkpoint_interval']), file=stderr)
+        sys_exit(1)
+
     # P-value
     if (iargs['p_value'] < 0 or iargs['p_value'] > 1):
         print('--p-value\n' +
@@ -188,6 +247,8 @@ def setup_abspath(iargs):
     iargs['out_dir'] = os.path.abspath(iargs['out_dir'])
     iargs['mask'] = os.path.abspath(iargs['mask'])
     iargs['exe'] = os.path.abspath(iargs['exe'])
+    if iargs['reduce'].startswith('parcels:'):
+        iargs['reduce'] = 'parcels:' + os.path.abspath(iargs['reduce'][len('parcels:'):])
 
     return iargs
 
@@ -323,6 +384,40 @@ def check_iargs_parser(iargs):
                           '''),
                           metavar=('X'),
                           dest='network_scales')
+    optional.add_argument('--network-scale', nargs=1, type=int,
+                          default=0,
+                          help=dedent('''\
+                          Network scale (number of atoms) used by all resamplings,
+                          instead of the one estimated from --network-scales. 0 keeps
+                          the estimation.
+                          Setting both --network-scale and --sparsity-level makes
+                          both engines of the stage B (--RUN --engine) learn the same
+                          model, a K-SVD of fixed scale and sparsity, their outputs
+                          differing by the random initialization of the dictionary:
+                          compare them with --COMPARE.
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='network_scale')
+    optional.add_argument('--sparsity-level', nargs=1, type=int,
+                          default=0,
+                          help=dedent('''\
+                          Maximum number of atoms (networks) coding each voxel, the
+                          same for all voxels, instead of the number estimated voxel
+                          by voxel. 0 keeps the estimation, which the Python engine
+                          of the stage B does not implement (it then uses 4).
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='sparsity_level')
     optional.add_argument('--nb-iterations', nargs=1, type=int,
                           default=20,
                           help=dedent('''\
@@ -335,6 +430,28 @@ def check_iargs_parser(iargs):
                           '''),
                           metavar=('X'),
                           dest='nb_iterations')
+    optional.add_argument('--checkpoint-interval', nargs=1, type=int,
+                          default=5,
+                          help=dedent('''\
+                          Number of iterations of the sparse dictionary learning
+                          between two checkpoints of a stage B job run with the
+                          Python engine (--RUN --engine python), so that a job
+                          interrupted (preemption, walltime) and started again
+                          continues from its last checkpoint. The checkpoints are
+                          written next to the outputs of the job and removed once it
+                          completed. 0 disables the checkpoints.
+                          The standalone application checkpoints every stage at the
+                          granularity of the jobs, whatever this option: a stage run
+                          again skips the jobs that completed since their inputs were
+                          last written.
+                           
+                          (valid values: %(metavar)s>=0)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='checkpoint_interval')
     optional.add_argument('--p-value', nargs=1, type=float,
                           default=0.05,
                           help=dedent('''\
@@ -446,6 +563,65 @@ def check_iargs_parser(iargs):
                           ____________________________________________________________
                           '''),
                           dest='preserve_dc_atom')
+    optional.add_argument('--precision', nargs=1, type=str,
+                          choices=['double', 'single'],
+                          default='double',
+                          help=dedent('''\
+                          Floating-point precision of the intermediate outputs
+                          (bootstrap samples, dictionaries, sparse codes, k-hubness
+                          statistics) and of the computations using them.
+                          'single' halves the memory, disk and I/O usage. The drift
+                          against 'double' can be measured on a reference dataset
+                          with --COMPARE.
+                           
+                          (valid values: %(choices)s)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='X',
+                          dest='precision')
+    optional.add_argument('--reduce', nargs=1, type=str,
+                          default='',
+                          help=dedent('''\
+                          Fast exploratory mode: the masked fMRI is reduced before the
+                          stages A to C, which then run on far fewer elements.
+                          - parcels:ATLAS, averages the time series within each parcel
+                            (label > 0) of the atlas ATLAS, on the grid of --mask.
+                          - downsample:F, averages the time series within blocks of
+                            FxFxF voxels.
+                          The reduction factor is printed at setup. --WRAP-UP projects
+                          the final maps back to the voxels of --mask. The speedup
+                          and the agreement with a full analysis of the same fMRI are
+                          reported by --COMPARE. Requires nibabel.
+                           
+                          (valid values: parcels:ATLAS, downsample:F with F>=2)
+                          (default: none)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar='X',
+                          dest='reduce')
+    optional.add_argument('--no-input-cache',
+                          action='store_false',
+                          help=dedent('''\
+                          If set, all stages read the input --fmri and --mask as they
+                          are. By default, compressed inputs (gzip, MINC) are decoded
+                          once into uncompressed copies in the pipelines directory,
+                          read by all stages. gzip files are decompressed with pigz
+                          when available, MINC files converted with mincconvert
+                          (MINC_COMPRESS=0). The copies only save the decoding: the
+                          data is copied as is (byte order, layout). The size,
+                          modification time and hash of the original files are
+                          recorded in 'pipelines/inputs/manifest.json'. The copies
+                          use as much disk as the decoded inputs, and are removed by
+                          --WRAP-UP unless --keep-input-cache is given.
+                          Without the copies, a compressed --mask is not accepted.
+                           
+                          (default: False)
+                          ____________________________________________________________
+                          '''),
+                          dest='input_cache')
     optional.add_argument('-v', '--verbose',
                           action='store_true',
                           help=dedent('''\
@@ -460,8 +636,10 @@ def check_iargs_parser(iargs):
 
     # Hack: when (nargs=1) a list should not be returned
     for k in ['exe', 'fmri', 'out_dir', 'mask',
-        'nb_resamplings', 'nb_iterations', 'p_value',
-        'resampling_method', 'dict_init_method', 'sparse_coding_method', 'preserve_dc_atom', 'verbose']:
+        'nb_resamplings', 'network_scale', 'sparsity_level', 'nb_iterations',
+        'checkpoint_interval', 'p_value',
+        'resampling_method', 'dict_init_method', 'sparse_coding_method', 'preserve_dc_atom',
+        'precision', 'reduce', 'input_cache', 'verbose']:
         if type(oargs[k]) is list:
             oargs[k] = oargs[k][0]
 
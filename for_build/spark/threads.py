@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Compute-thread budget of the SPARK processes (--threads), so that the concurrent jobs
+# of a node do not start more threads than there are cores
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+from argparse import ArgumentParser
+import atexit
+import os
+from sys import stderr
+from sys import exit as sys_exit
+from tempfile import gettempdir
+
+
+# Variables read by the BLAS/OpenMP libraries of NumPy and of the MATLAB Runtime
+THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def get_cpus():
+    """Number of cores this process may run on
+    """
+
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def get_registry_dir():
+    """Directory where the SPARK processes of the current user on this node record
+    their number of parallel jobs
+    """
+
+    return os.sep.join([gettempdir(), 'spark-jobs-' + str(os.getuid())])
+
+
+def node_jobs():
+    """Number of parallel jobs recorded by the other running SPARK processes of the node
+    """
+
+    nb_jobs = 0
+    try:
+        entries = os.listdir(get_registry_dir())
+    except OSError:
+        return 0
+
+    for entry in entries:
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            os.kill(int(entry), 0)
+            with open(os.sep.join([get_registry_dir(), entry]), 'r') as file:
+                nb_jobs += int(file.read() or 1)
+        except ProcessLookupError:
+            try:
+                os.remove(os.sep.join([get_registry_dir(), entry]))
+            except OSError:
+                pass
+        except (OSError, ValueError):
+            pass
+
+    return nb_jobs
+
+
+def register(nb_jobs):
+    """Records the number of parallel jobs of the current process until it exits
+    """
+
+    entry = os.sep.join([get_registry_dir(), str(os.getpid())])
+    try:
+        os.makedirs(get_registry_dir(), exist_ok=True)
+        with open(entry, 'w') as file:
+            file.write(str(nb_jobs))
+    except OSError:
+        return None
+
+    def unregister():
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    atexit.register(unregister)
+
+    return None
+
+
+def get_threads(threads, parallel=1):
+    """Compute threads of each job: the given number, or with 'auto' the cores divided
+    by all the parallel jobs of the node, those of the current process included
+    """
+
+    if threads != 'auto':
+        return int(threads)
+
+    register(parallel)
+    return max(1, get_cpus() // (parallel + node_jobs()))
+
+
+def apply_threads(iargs, parallel=1):
+    """Parses --threads (and --parallel) and sets the thread budget in the environment
+    inherited by the standalone application and the Python engines. Returns the number
+    of threads of each job.
+    """
+
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument('--threads', nargs=1, type=str, default=['auto'])
+    parser.add_argument('--parallel', nargs=1, type=int, default=[parallel])
+    oargs = vars(parser.parse_known_args(iargs)[0])
+
+    if oargs['threads'][0] != 'auto' and \
+            (not oargs['threads'][0].isdigit() or int(oargs['threads'][0]) < 1):
+        print('--threads\n' +
+              'Neither auto nor an integer greater than 0:\n' + oargs['threads'][0], file=stderr)
+        sys_exit(1)
+
+    threads = get_threads(oargs['threads'][0], max(1, oargs['parallel'][0]))
+    for var in THREAD_VARS:
+        os.environ[var] = str(threads)
+    os.environ['SPARK_THREADS'] = str(threads)
+
+    return threads
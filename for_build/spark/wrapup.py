@@ -90,6 +90,12 @@ def check_iargs_integrity(iargs):
         print('Pipeline file not found:\n' + iargs['pipe_file'], file=stderr)
         sys_exit(1)
 
+    # Compression level
+    if iargs['pack_level'] < 0 or iargs['pack_level'] > 9:
+        print('--pack-level\n' +
+              'Compression level not between 0 and 9:\n' + str(iargs['pack_level']), file=stderr)
+        sys_exit(1)
+
     return None
 
 
@@ -116,6 +122,8 @@ def setup_abspath(iargs):
 
     iargs['fmri'] = os.path.abspath(iargs['fmri'])
     iargs['out_dir'] = os.path.abspath(iargs['out_dir'])
+    if iargs['export']:
+        iargs['export'] = os.path.abspath(iargs['export'])
 
     return iargs
 
@@ -209,6 +217,69 @@ def check_iargs_parser(iargs):
                           ____________________________________________________________
                           '''),
                           dest='move_outputs')
+    optional.add_argument('--export', nargs=1, type=str,
+                          default='',
+                          help=dedent('''\
+                          Path (absolute or relative) to an HDF5 store (created if
+                          needed) into which the final outputs (k-hubness maps and
+                          their statistics, global dictionary) are also exported,
+                          under '/scans/<BIDS filename>'. The arrays are compressed
+                          and chunked by blocks of voxels, and the store is indexed by
+                          subject/session/run ('/index'), so that reading a few
+                          voxels of many scans only reads the chunks holding them
+                          (see spark.export.read_voxels). Several analyses can be
+                          exported into the same store, a previous export of the
+                          same fMRI being replaced. Requires h5py.
+                           
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('XXX'),
+                          dest='export')
+    optional.add_argument('--pack',
+                          action='store_true',
+                          help=dedent('''\
+                          If set, all the outputs of the analysis are also packed into
+                          a single archive, '<BIDS filename>.spark.tar' in --out-dir,
+                          to transfer them as one large file. The final outputs
+                          (k-hubness maps and their statistics, global dictionary)
+                          are stored as they are, the intermediate outputs compressed
+                          with gzip in parallel (see --threads). The size and SHA-256
+                          of every file and of the archive are written to
+                          '<BIDS filename>.spark.manifest.json'.
+                           
+                          (default: %(default)s)
+                          ____________________________________________________________
+                          '''),
+                          dest='pack')
+    optional.add_argument('--pack-level', nargs=1, type=int,
+                          default=6,
+                          help=dedent('''\
+                          gzip compression level of the intermediate outputs packed
+                          with --pack, 0 storing them uncompressed too.
+                           
+                          (valid values: 0<=%(metavar)s<=9)
+                          (default: %(default)s)
+                          (type: %(type)s)
+                          ____________________________________________________________
+                          '''),
+                          metavar=('X'),
+                          dest='pack_level')
+    optional.add_argument('--keep-input-cache',
+                          action='store_false',
+                          help=dedent('''\
+                          If set, the decoded copies of the inputs made by --SETUP
+                          (see --no-input-cache) are kept. By default, they are
+                          removed, their manifest being kept, so that they neither
+                          use disk nor are uploaded with the outputs. The pipeline
+                          reads these copies: without them, --SETUP has to be run
+                          again before any further --RUN or --RUN-ALL on this output
+                          directory.
+                           
+                          (default: False)
+                          ____________________________________________________________
+                          '''),
+                          dest='remove_input_cache')
     optional.add_argument('-v', '--verbose',
                           action='store_true',
                           help=dedent('''\
@@ -222,7 +293,8 @@ def check_iargs_parser(iargs):
     oargs = vars(parser.parse_known_args(iargs)[0])
 
     # Hack: when (nargs=1) a list should not be returned
-    for k in ['fmri', 'out_dir', 'move_outputs', 'verbose']:
+    for k in ['fmri', 'out_dir', 'move_outputs', 'export', 'pack', 'pack_level',
+              'remove_input_cache', 'verbose']:
         if type(oargs[k]) is list:
             oargs[k] = oargs[k][0]
 
@@ -245,8 +317,40 @@ def wrapup(iargs):
     """
     oargs = check_iargs(iargs)
 
+    # The pipeline reads the decoded copies of the inputs, removed unless asked otherwise
+    if oargs['remove_input_cache']:
+        from spark.inputs import remove_copies
+        remove_copies(os.path.dirname(oargs['pipe_file']))
+
+    # Before renaming, the paths of the pipeline being those of the raw outputs
+    from spark.pipeline import get_opt_file, read_opt
+    if read_opt(get_opt_file(oargs['pipe_file'])).get('reduce', 'none') != 'none':
+        from spark.export import get_final_files
+        from spark.reduce import project_outputs
+        project_outputs(os.path.dirname(oargs['pipe_file']),
+                        get_final_files(oargs['pipe_file'],
+                                        get_bids_filename(oargs['pipe_file'])),
+                        oargs['verbose'])
+
+    if oargs['export']:
+        from spark.export import export_outputs
+        export_outputs(oargs['export'], oargs['pipe_file'],
+                       get_bids_filename(oargs['pipe_file']), oargs['verbose'])
+
     rename_outputs(oargs['out_dir'], oargs['pipe_file'])
 
+    if oargs['pack']:
+        from spark.export import get_final_files
+        from spark.inputs import get_copies
+        from spark.pack import get_archive_file, pack_outputs
+        bids_filename = get_bids_filename(oargs['pipe_file'])
+        # The decoded copies of the inputs are not results
+        pack_outputs(os.sep.join([oargs['out_dir'], bids_filename]),
+                     get_archive_file(oargs['out_dir'], bids_filename),
+                     get_final_files(oargs['pipe_file'], bids_filename),
+                     oargs['pack_level'], int(os.environ.get('SPARK_THREADS', '1')),
+                     oargs['verbose'], exclude=get_copies(os.path.dirname(oargs['pipe_file'])))
+
     if oargs['move_outputs']:
         move_outputs(oargs['out_dir'], oargs['pipe_file'])
 
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Tests of --COMPARE (run from for_build: python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import numpy as np
+from scipy.io import savemat
+from scipy.sparse import csc_matrix
+
+from spark.compare import compare_arrays, compare_mat_files
+
+
+def test_sparse_outputs_that_differ(tmp_path):
+    ref = np.zeros((4, 50))
+    ref[0, 3] = 2.0
+    ref[2, 10] = -1.0
+    cand = ref.copy()
+    cand[0, 3] = 1.5
+    cand[3, 20] = 0.5
+
+    savemat(str(tmp_path / 'ref.mat'), {'X': csc_matrix(ref)})
+    savemat(str(tmp_path / 'cand.mat'), {'X': csc_matrix(cand)})
+    metrics = compare_mat_files(str(tmp_path / 'ref.mat'), str(tmp_path / 'cand.mat'))['X']
+
+    assert metrics == compare_arrays('X', ref, cand)
+    assert metrics['max_abs_err'] == 0.5
+    assert metrics['max_rel_err'] == 0.25
+    assert np.isclose(metrics['rmse'], np.sqrt(0.5 / ref.size))
+
+
+def test_kmap_agreement_sparse_and_dense():
+    ref = np.array([[0, 1, 2, 0]])
+    cand = np.array([[0, 1, 1, 0]])
+
+    assert compare_arrays('kmap', ref, cand)['agreement'] == 0.75
+    assert compare_arrays('kmap', csc_matrix(ref), csc_matrix(cand))['agreement'] == 0.75
+
+
+def test_kmap_agreement_any_layout():
+    ref = np.array([[0, 1, 2, 0]])
+    cand = np.array([[0], [1], [1], [0]])
+
+    assert compare_arrays('kmap', ref, cand)['agreement'] == 0.75
+    assert 'shape' in compare_arrays('X', ref, cand)
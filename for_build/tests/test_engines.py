@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Tests of the layout of the outputs of the Python engines (run from for_build:
+# python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import numpy as np
+from scipy.io import loadmat, savemat
+
+from spark.gx import run_gx
+from spark.kstats import compute_kstats
+from spark.pipeline import (VAR_CODES, VAR_DICTIONARY, VAR_ENGINE, VAR_GLOBAL_DICTIONARY,
+                            VAR_LABELS)
+
+
+def fake_kmdl_outputs(tmp_path, nb_resamplings=3, nb_time=20, nb_atoms=4, nb_voxels=60):
+    """Writes the outputs of kmdl_boot jobs, returns their paths
+    """
+
+    rng = np.random.default_rng(0)
+    files = []
+    for k in range(nb_resamplings):
+        f = str(tmp_path / ('kmdl_' + str(k + 1) + '.mat'))
+        codes = rng.standard_normal((nb_atoms, nb_voxels))
+        codes[rng.random((nb_atoms, nb_voxels)) > 0.3] = 0
+        savemat(f, {VAR_DICTIONARY: rng.standard_normal((nb_time, nb_atoms)),
+                    VAR_CODES: codes})
+        files.append(f)
+
+    return files
+
+
+def test_gx_layout(tmp_path):
+    kmdl_files = fake_kmdl_outputs(tmp_path)
+    gx_file = str(tmp_path / 'gx.mat')
+
+    run_gx(kmdl_files, gx_file, threads=2)
+
+    # As read by MATLAB's load: no squeezing, MATLAB classes
+    gx = loadmat(gx_file)
+    assert gx[VAR_LABELS].dtype == np.float64
+    assert gx[VAR_LABELS].shape == (12, 1)
+    assert set(np.unique(gx[VAR_LABELS])) <= set(range(1, 5))
+    assert gx[VAR_GLOBAL_DICTIONARY].shape == (20, 4)
+    assert str(gx[VAR_ENGINE][0]) == 'python'
+
+    # As read by the statistics of --RETHRESHOLD
+    kstats = compute_kstats(kmdl_files, gx_file, 0.05)
+    assert kstats['zscores'].shape == (4, 60)
+    assert kstats['counts'].sum() == 12
+
+
+def test_kmdl_scale_and_sparsity_from_the_options(tmp_path):
+    from spark.ksvd import run_kmdl
+
+    rng = np.random.default_rng(0)
+    kmdl_file = str(tmp_path / 'kmdl.mat')
+    opt = {'nb_iterations': '3', 'network_scales': '2 2 8', 'network_scale': '5',
+           'sparsity_level': '2', 'sparse_coding_method': 'OMP'}
+
+    run_kmdl(rng.standard_normal((30, 200)), kmdl_file, opt, 'kmdl_boot_1', threads=2)
+
+    kmdl = loadmat(kmdl_file)
+    assert kmdl[VAR_DICTIONARY].shape == (30, 5)
+    assert kmdl['scale'].item() == 5
+    assert (kmdl[VAR_CODES] != 0).sum(axis=0).max() <= 2
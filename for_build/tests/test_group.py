@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Tests of --GROUP and --RETHRESHOLD on k-hubness maps of any layout (run from
+# for_build: python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import numpy as np
+import pytest
+from scipy.io import loadmat, savemat
+
+from spark.group import aggregate, find_kmaps, save_group
+from spark.kstats import shape_kmap
+
+
+@pytest.mark.parametrize('shape', [(1, 24), (24, 1), (2, 3, 4)])
+def test_group_keeps_the_layout_of_the_maps(tmp_path, shape):
+    rng = np.random.default_rng(0)
+    maps = [rng.integers(0, 5, shape).astype(np.float64) for _ in range(3)]
+    kmaps = []
+    for (k, kmap) in enumerate(maps):
+        f = str(tmp_path / ('kmap_sub-0' + str(k) + '_task-rest_bold.mat'))
+        savemat(f, {'kmap': kmap})
+        kmaps.append(('rest', 6, f))
+
+    groups = aggregate(kmaps, 2, parallel=2)
+    save_group(str(tmp_path / 'group.mat'), groups[('rest', 6)], 2)
+    group = loadmat(str(tmp_path / 'group.mat'))
+
+    assert group['mean'].shape == shape
+    assert np.allclose(group['mean'], np.mean(maps, axis=0))
+    assert np.allclose(group['variance'], np.var(maps, axis=0, ddof=1))
+    assert np.allclose(group['hub_frequency'], np.mean([m >= 2 for m in maps], axis=0))
+
+
+def test_rethresholded_map_keeps_the_layout_of_the_stage_c_map():
+    kmap = np.arange(6, dtype=np.uint16)
+
+    assert shape_kmap(kmap, {'kmap_shape': np.array([6, 1])}).shape == (6, 1)
+    assert shape_kmap(kmap, {'kmap_shape': np.array([1, 6])}).shape == (1, 6)
+    assert shape_kmap(kmap, {}).shape == (6,)
+    assert shape_kmap(kmap, {'kmap_shape': np.array([5, 1])}).shape == (6,)
+
+
+def test_find_kmaps_once_with_their_scale(tmp_path):
+    analysis_dir = tmp_path / 'out' / 'sub-01_task-rest_bold' / 'kmap'
+    analysis_dir.mkdir(parents=True)
+    savemat(str(analysis_dir / 'kmap_sub-01_task-rest_bold.mat'), {'kmap': np.ones(4)})
+    savemat(str(analysis_dir / 'kstats_sub-01_task-rest_bold.mat'), {'counts': np.ones(7)})
+    savemat(str(analysis_dir / 'kmap_sub-01_task-rest_bold_p0.01.mat'), {'kmap': np.ones(4)})
+    savemat(str(analysis_dir / 'kmap_sub-02_task-rest_bold.mat'), {'kmap': np.ones(4)})
+
+    # Repeated and nested directories
+    kmaps = find_kmaps([str(tmp_path / 'out'), str(tmp_path / 'out'), str(analysis_dir)])
+
+    assert sorted((task, scale) for (task, scale, _) in kmaps) == [('rest', 0), ('rest', 7)]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Round trips of --WRAP-UP --pack and --export, on a small fake analysis (run from
+# for_build: python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import gzip
+from hashlib import sha256
+import json
+import tarfile
+
+import numpy as np
+import pytest
+from scipy.io import savemat
+
+from spark.pack import get_manifest_file, pack_outputs
+
+
+BIDS_FILENAME = 'sub-01_task-rest_bold'
+SPARK_FILENAME = 'sub_01_ses_cspark_1_run_cspark_1'
+
+
+def fake_analysis(root, shape=(1, 10000)):
+    """Builds the outputs and the pipeline of a fake analysis, whose stage C wrote a
+    k-hubness map of the given layout. Returns the analysis directory, the pipeline file
+    and the map.
+    """
+
+    analysis_dir = root / BIDS_FILENAME
+    for d in ('pipelines', 'kmdl', 'kmap'):
+        (analysis_dir / d).mkdir(parents=True)
+    kmap = (np.arange(10000, dtype=np.uint16) % 7).reshape(shape, order='F')
+    kmap_file = analysis_dir / 'kmap' / ('kmap_' + SPARK_FILENAME + '.mat')
+    savemat(str(kmap_file), {'kmap': kmap})
+    savemat(str(analysis_dir / 'kmdl' / ('kmdl_' + SPARK_FILENAME + '_1.mat')),
+            {'X': np.ones((4, 100))})
+
+    pipe_file = analysis_dir / 'pipelines' / (BIDS_FILENAME + '.mat')
+    savemat(str(pipe_file), {'pipe': {
+        'pipe_A': {}, 'pipe_B': {},
+        'pipe_C': {'nkmap_' + SPARK_FILENAME: {
+            'files_in': '', 'files_out': str(kmap_file), 'command': '', 'opt': {}}}}},
+            long_field_names=True)
+    (analysis_dir / 'pipelines' / (BIDS_FILENAME + '.opt')).write_text(
+        'fmri_data sub_01 ses_cspark_1 run_cspark_1 /x/' + BIDS_FILENAME + '.nii\n' +
+        'out_dir ' + str(analysis_dir) + '\n')
+
+    return analysis_dir, pipe_file, kmap
+
+
+def test_pack_round_trip(tmp_path):
+    (analysis_dir, pipe_file, kmap) = fake_analysis(tmp_path)
+    kmap_file = str(analysis_dir / 'kmap' / ('kmap_' + SPARK_FILENAME + '.mat'))
+    excluded = str(analysis_dir / 'kmdl' / 'copy.nii')
+    open(excluded, 'w').write('cache')
+    archive_file = str(tmp_path / 'archive.spark.tar')
+
+    pack_outputs(str(analysis_dir), archive_file, [kmap_file], level=6, threads=2,
+                 exclude=[excluded])
+
+    with open(get_manifest_file(archive_file), 'r') as file:
+        manifest = json.load(file)
+    with open(archive_file, 'rb') as file:
+        assert sha256(file.read()).hexdigest() == manifest['sha256']
+    files = [f for f in analysis_dir.rglob('*') if f.is_file() and str(f) != excluded]
+    assert len(manifest['files']) == len(files)
+    with tarfile.open(archive_file, 'r') as tar:
+        assert sorted(tar.getnames()) == sorted(e['member'] for e in manifest['files'])
+        for entry in manifest['files']:
+            data = tar.extractfile(entry['member']).read()
+            if entry['member'].endswith('.gz'):
+                data = gzip.decompress(data)
+            assert entry['final'] == (entry['member'] == entry['path'])
+            assert len(data) == entry['size']
+            assert sha256(data).hexdigest() == entry['sha256']
+            assert data == (tmp_path / entry['path']).read_bytes()
+
+
+@pytest.mark.parametrize('shape', [(1, 10000), (10000, 1), (20, 25, 20)])
+def test_export_round_trip(tmp_path, shape):
+    pytest.importorskip('h5py')
+    from spark.export import export_outputs, read_voxels
+
+    (analysis_dir, pipe_file, kmap) = fake_analysis(tmp_path, shape)
+    store_file = str(tmp_path / 'store.h5')
+
+    export_outputs(store_file, str(pipe_file), BIDS_FILENAME)
+    voxels = [9999, 3, 5000, 3]
+    values = read_voxels(store_file, 'kmap/kmap', voxels, subject='sub_01')
+
+    assert list(values) == [BIDS_FILENAME]
+    assert np.array_equal(values[BIDS_FILENAME].ravel(), kmap.ravel(order='F')[voxels])
+    assert read_voxels(store_file, 'kmap/kmap', voxels, subject='sub_02') == {}
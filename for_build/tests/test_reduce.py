@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Tests of the projection of the final outputs of --SETUP --reduce back to the voxels of
+# the mask, in the layouts of the Python engines and of the standalone application (run
+# from for_build: python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import io
+
+import numpy as np
+import pytest
+from scipy.io import loadmat, savemat
+
+from spark import reduce
+from spark.reduce import load_reduction, project_outputs, reduce_inputs
+
+
+def fake_reduction(tmp_path):
+    """Reduces a small fake fMRI by blocks of 2^3 voxels, returns the pipelines directory
+    and the block of each voxel of the mask
+    """
+
+    nibabel = pytest.importorskip('nibabel')
+    rng = np.random.default_rng(0)
+    mask = (rng.random((6, 6, 4)) > 0.3).astype(np.uint8)
+    fmri_file = str(tmp_path / 'fmri.nii')
+    mask_file = str(tmp_path / 'mask.nii')
+    nibabel.save(nibabel.Nifti1Image(rng.standard_normal((6, 6, 4, 10)).astype(np.float32),
+                                     np.eye(4)), fmri_file)
+    nibabel.save(nibabel.Nifti1Image(mask, np.eye(4)), mask_file)
+    pipes_dir = tmp_path / 'pipelines'
+    pipes_dir.mkdir()
+
+    reduce_inputs(str(pipes_dir), fmri_file, mask_file, 'downsample', '2')
+
+    return str(pipes_dir), load_reduction(str(pipes_dir))
+
+
+@pytest.mark.parametrize('layout', ['row', 'column', 'volume'])
+def test_project_outputs(tmp_path, layout):
+    (pipes_dir, reduction) = fake_reduction(tmp_path)
+    values = np.arange(1, reduction['nb_elements'] + 1, dtype=np.float64)
+    zscores = np.vstack([values, -values])
+    if layout == 'row':
+        kmap = values[None, :]
+    elif layout == 'column':
+        kmap = values[:, None]
+    else:
+        kmap = np.zeros(reduction['reduced_shape'], order='F')
+        kmap.ravel(order='F')[reduction['elements']] = values
+    kmap_file = str(tmp_path / 'kmap.mat')
+    kstats_file = str(tmp_path / 'kstats.mat')
+    savemat(kmap_file, {'kmap': kmap})
+    savemat(kstats_file, {'zscores': zscores, 'kmap': kmap, 'kmap_shape': kmap.shape})
+
+    project_outputs(pipes_dir, [kmap_file, kstats_file])
+
+    expected = values[reduction['mapping']]
+    projected = loadmat(kmap_file)['kmap']
+    if layout == 'volume':
+        assert projected.shape == reduction['mask_shape']
+        assert np.array_equal(projected.ravel(order='F')[reduction['voxels']], expected)
+    else:
+        assert projected.size == reduction['nb_voxels']
+        assert projected.shape[layout == 'column'] == 1
+        assert np.array_equal(projected.ravel(), expected)
+    kstats = loadmat(kstats_file)
+    assert np.array_equal(kstats['zscores'], np.vstack([expected, -expected]))
+    assert tuple(kstats['kmap_shape'].ravel()) == projected.shape
+
+    # Already projected
+    project_outputs(pipes_dir, [kmap_file])
+    assert np.array_equal(loadmat(kmap_file)['kmap'], projected)
+
+
+def test_unprojectable_output_is_reported(tmp_path, monkeypatch):
+    (pipes_dir, reduction) = fake_reduction(tmp_path)
+    kmap_file = str(tmp_path / 'kmap.mat')
+    savemat(kmap_file, {'kmap': np.ones((1, reduction['nb_elements'] + 1))})
+
+    err = io.StringIO()
+    monkeypatch.setattr(reduce, 'stderr', err)
+    project_outputs(pipes_dir, [kmap_file])
+
+    assert 'left reduced' in err.getvalue()
+    assert loadmat(kmap_file)['kmap'].shape == (1, reduction['nb_elements'] + 1)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Tests of the isolated runner of --RUN --isolated, with small fake jobs (run from
+# for_build: python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import json
+import sys
+
+from spark import runner
+from spark.runner import run_isolated
+
+
+def fake_job(name, code):
+    """Job running a Python snippet
+    """
+
+    return {'name': name, 'cmd': [sys.executable, '-c', code]}
+
+
+def run(tmp_path, jobs, **kwargs):
+    """Runs the jobs, returns the failed ones and the summary
+    """
+
+    summary_file = tmp_path / 'summary.json'
+    failed = run_isolated(jobs, str(tmp_path), 2, str(tmp_path / 'logs'), str(summary_file),
+                          **kwargs)
+
+    return failed, json.loads(summary_file.read_text())
+
+
+def test_summary(tmp_path):
+    jobs = [fake_job('ok', 'print("hello")'), fake_job('ko', 'import sys; sys.exit(3)')]
+
+    (failed, summary) = run(tmp_path, jobs)
+
+    assert failed == ['ko']
+    assert summary['nb_success'] == 1
+    assert summary['nb_failed'] == 1
+    assert summary['failed'] == ['ko']
+    assert summary['jobs']['ok']['status'] == 'success'
+    assert summary['jobs']['ko']['status'] == 'failed'
+    assert summary['jobs']['ko']['returncode'] == 3
+    assert '[out] hello' in (tmp_path / 'logs' / 'ok.log').read_text()
+
+
+def test_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(runner, 'WATCH_INTERVAL', 0.1)
+
+    (failed, summary) = run(tmp_path, [fake_job('slow', 'import time; time.sleep(60)')],
+                            timeout=0.5)
+
+    assert failed == ['slow']
+    assert summary['jobs']['slow']['status'] == 'timeout'
+    assert summary['jobs']['slow']['duration'] < 30
+
+
+def test_retries(tmp_path):
+    # Fails on the first two attempts only
+    marker = tmp_path / 'attempts.txt'
+    code = ('import sys\n'
+            'open(' + repr(str(marker)) + ', "a").write("x")\n'
+            'sys.exit(len(open(' + repr(str(marker)) + ').read()) < 3)\n')
+
+    (failed, summary) = run(tmp_path, [fake_job('flaky', code)], retries=2, backoff=0)
+
+    assert failed == []
+    assert summary['jobs']['flaky']['status'] == 'success'
+    assert summary['jobs']['flaky']['attempts'] == 3
+
+
+def test_missing_executable(tmp_path):
+    jobs = [{'name': 'missing', 'cmd': [str(tmp_path / 'missing')]}, fake_job('ok', 'pass')]
+
+    (failed, summary) = run(tmp_path, jobs, retries=1, backoff=0)
+
+    assert failed == ['missing']
+    assert summary['jobs']['missing']['attempts'] == 2
+    assert summary['jobs']['ok']['status'] == 'success'
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Tests of the local scheduler of --RUN and --RUN-ALL, with small fake jobs (run from
+# for_build: python3 -m pytest tests)
+#
+# Last revision: October, 2026
+# Maintainer: Obai Bin Ka'b Ali @aliobaibk
+# License: In the app folder or check GNU GPL-3.0.
+
+
+import sys
+
+from spark import scheduler
+from spark.scheduler import MAX_OOM_RETRIES, run_jobs
+
+
+def fake_job(name, code, stage='B', **kwargs):
+    """Job running a Python snippet
+    """
+
+    return dict(kwargs, name=name, stage=stage, cmd=[sys.executable, '-c', code])
+
+
+def log_times(log_file, seconds):
+    """Snippet appending its start and end times to a file, after sleeping
+    """
+
+    return ('import time\n'
+            't = time.monotonic()\n'
+            'time.sleep(' + str(seconds) + ')\n'
+            'open(' + repr(str(log_file)) + ', "a").write("%f %f\\n" % (t, time.monotonic()))\n')
+
+
+def test_memory_budget_serializes_jobs(tmp_path):
+    log_file = tmp_path / 'times.txt'
+    jobs = [fake_job('job_' + str(k), log_times(log_file, 0.3)) for k in range(3)]
+
+    # Room for a single job at a time, whatever the number of slots
+    failed = run_jobs(jobs, str(tmp_path), 3, mem_budget=1000, mem_per_job=600)
+
+    assert failed == []
+    times = sorted([tuple(map(float, line.split()))
+                    for line in log_file.read_text().splitlines()])
+    assert len(times) == 3
+    assert all(times[k][1] <= times[k + 1][0] for k in range(2))
+
+
+def test_memory_budget_runs_jobs_concurrently(tmp_path):
+    log_file = tmp_path / 'times.txt'
+    jobs = [fake_job('job_' + str(k), log_times(log_file, 0.5)) for k in range(2)]
+
+    failed = run_jobs(jobs, str(tmp_path), 2, mem_budget=1000, mem_per_job=400)
+
+    assert failed == []
+    times = sorted([tuple(map(float, line.split()))
+                    for line in log_file.read_text().splitlines()])
+    assert times[1][0] < times[0][1]
+
+
+def test_oom_killed_job_is_run_again(tmp_path):
+    # Killed with SIGKILL, as by the out-of-memory killer, on the first attempt only
+    marker = tmp_path / 'attempts.txt'
+    code = ('import os, signal\n'
+            'open(' + repr(str(marker)) + ', "a").write("x")\n'
+            'if len(open(' + repr(str(marker)) + ').read()) == 1:\n'
+            '    os.kill(os.getpid(), signal.SIGKILL)\n')
+
+    failed = run_jobs([fake_job('job', code)], str(tmp_path), 2, mem_budget=1000,
+                      mem_per_job=100)
+
+    assert failed == []
+    assert marker.read_text() == 'xx'
+
+
+def test_oom_retries_are_bounded(tmp_path):
+    marker = tmp_path / 'attempts.txt'
+    code = ('import os, signal\n'
+            'open(' + repr(str(marker)) + ', "a").write("x")\n'
+            'os.kill(os.getpid(), signal.SIGKILL)\n')
+
+    failed = run_jobs([fake_job('job', code), fake_job('child', 'pass', deps=['job'])],
+                      str(tmp_path), 2, mem_budget=1000, mem_per_job=100)
+
+    assert sorted(failed) == ['child', 'job']
+    assert marker.read_text() == 'x' * (MAX_OOM_RETRIES + 1)
+
+
+def test_straggler_duplicate_is_promoted(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, 'POLL_INTERVAL', 0.1)
+    out_dir = tmp_path / 'kmdl'
+    out_dir.mkdir()
+    # The original of the last job hangs, its duplicate (in $SPARK_OUTPUT_DIR) does not
+    code = ('import os, sys, time\n'
+            'name = sys.argv[1]\n'
+            'out_dir = os.environ.get("SPARK_OUTPUT_DIR", ' + repr(str(out_dir)) + ')\n'
+            'if name == "slow" and "SPARK_OUTPUT_DIR" not in os.environ:\n'
+            '    time.sleep(60)\n'
+            'time.sleep(0.2)\n'
+            'open(os.path.join(out_dir, name + ".mat"), "w").write(\n'
+            '    "duplicate" if "SPARK_OUTPUT_DIR" in os.environ else "original")\n')
+    jobs = [dict(fake_job(name, code), files_out=[str(out_dir / (name + '.mat'))])
+            for name in ('fast_1', 'fast_2', 'slow')]
+    for job in jobs:
+        job['cmd'] = job['cmd'] + [job['name']]
+
+    failed = run_jobs(jobs, str(tmp_path), 4, mem_budget=1000, mem_per_job=100,
+                      speculative=2)
+
+    assert failed == []
+    assert (out_dir / 'slow.mat').read_text() == 'duplicate'
+    assert (out_dir / 'fast_1.mat').read_text() == 'original'
+    assert sorted(p.name for p in out_dir.iterdir()) == ['fast_1.mat', 'fast_2.mat', 'slow.mat']